@@ -217,9 +217,11 @@ export async function fetchAIStats(): Promise<AIStats | null> {
  * Train AI model
  */
 export async function trainAIModel(): Promise<{ status: string; samples: number }> {
-  const response = await fetch(`${AI_ENGINE_URL}/train`, { method: 'POST' });
+  // Training runs as a background job; wait=true holds the request until it finishes
+  const response = await fetch(`${AI_ENGINE_URL}/train?wait=true`, { method: 'POST' });
   if (!response.ok) throw new Error(`AI Engine Error: ${response.status}`);
-  return response.json();
+  const job = await response.json();
+  return { status: job.status, samples: job.result?.samples ?? 0 };
 }
 
 /**
@@ -0,0 +1,270 @@
+-- =====================================================
+-- PHASE 7: SENSOR ROLLUPS
+-- Per-device 1-minute and 1-hour aggregates of sensor_logs, so analytics
+-- over long windows scan a few rows per device-hour instead of every reading
+-- Run this migration after schema.sql (only sensor_logs is required)
+-- =====================================================
+
+-- =====================================================
+-- ROLLUP TABLES
+-- One row per (device, bucket). Counts and sums are additive, so partial
+-- aggregates from the AI engine can be merged in at any time.
+-- Readings with speed > 1 are "active", speed < 1 with vibration magnitude
+-- > 0.01 "idle"; vibration magnitude treats missing axes as 0.
+-- =====================================================
+CREATE TABLE IF NOT EXISTS sensor_rollups_1m (
+  device_id VARCHAR(100) NOT NULL,
+  bucket TIMESTAMPTZ NOT NULL, -- Start of the minute
+
+  -- Reading counts
+  count INTEGER NOT NULL DEFAULT 0,
+  active_count INTEGER NOT NULL DEFAULT 0,
+  idle_count INTEGER NOT NULL DEFAULT 0,
+  moving_count INTEGER NOT NULL DEFAULT 0, -- speed > 0
+  active_speed_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+  moving_speed_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+
+  -- Temperature (NULL readings are not counted)
+  temp_count INTEGER NOT NULL DEFAULT 0,
+  temp_min DOUBLE PRECISION,
+  temp_max DOUBLE PRECISION,
+  temp_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+  temp_sumsq DOUBLE PRECISION NOT NULL DEFAULT 0,
+
+  -- Speed (NULL readings are not counted)
+  speed_count INTEGER NOT NULL DEFAULT 0,
+  speed_min DOUBLE PRECISION,
+  speed_max DOUBLE PRECISION,
+  speed_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+  speed_sumsq DOUBLE PRECISION NOT NULL DEFAULT 0,
+
+  -- Vibration magnitude (every reading)
+  vib_min DOUBLE PRECISION,
+  vib_max DOUBLE PRECISION,
+  vib_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+  vib_sumsq DOUBLE PRECISION NOT NULL DEFAULT 0,
+
+  updated_at TIMESTAMPTZ DEFAULT NOW(),
+  PRIMARY KEY (device_id, bucket)
+);
+
+CREATE TABLE IF NOT EXISTS sensor_rollups_1h (LIKE sensor_rollups_1m INCLUDING ALL);
+
+CREATE INDEX IF NOT EXISTS idx_sensor_rollups_1m_bucket ON sensor_rollups_1m(bucket DESC);
+CREATE INDEX IF NOT EXISTS idx_sensor_rollups_1h_bucket ON sensor_rollups_1h(bucket DESC);
+
+-- Hours recomputed from sensor_logs by rebuild_sensor_rollups. Their totals
+-- already include every reading logged so far, so merge_sensor_rollups
+-- drops live partials for them instead of adding readings a second time.
+CREATE TABLE IF NOT EXISTS sensor_rollups_rebuilt (
+  hour TIMESTAMPTZ PRIMARY KEY,
+  rebuilt_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- =====================================================
+-- FUNCTION: Merge partial 1-minute aggregates
+-- Called by the AI engine with aggregates of freshly ingested readings
+-- (JSON array of rollup rows). Adds them to the 1-minute buckets and, grouped
+-- by hour, to the 1-hour buckets. Rows for rebuilt hours are dropped; the
+-- SHARE lock waits out a running rebuild, so a partial is either replaced by
+-- the rebuild or skipped, never added on top of it. Returns the number of
+-- 1-minute rows merged.
+-- =====================================================
+CREATE OR REPLACE FUNCTION merge_sensor_rollups(p_rows JSONB)
+RETURNS INTEGER AS $$
+DECLARE
+  merged INTEGER;
+BEGIN
+  CREATE TEMP TABLE incoming_rollups ON COMMIT DROP AS
+  SELECT * FROM jsonb_to_recordset(p_rows) AS r(
+    device_id VARCHAR(100), bucket TIMESTAMPTZ,
+    count INTEGER, active_count INTEGER, idle_count INTEGER, moving_count INTEGER,
+    active_speed_sum DOUBLE PRECISION, moving_speed_sum DOUBLE PRECISION,
+    temp_count INTEGER, temp_min DOUBLE PRECISION, temp_max DOUBLE PRECISION,
+    temp_sum DOUBLE PRECISION, temp_sumsq DOUBLE PRECISION,
+    speed_count INTEGER, speed_min DOUBLE PRECISION, speed_max DOUBLE PRECISION,
+    speed_sum DOUBLE PRECISION, speed_sumsq DOUBLE PRECISION,
+    vib_min DOUBLE PRECISION, vib_max DOUBLE PRECISION,
+    vib_sum DOUBLE PRECISION, vib_sumsq DOUBLE PRECISION
+  );
+
+  LOCK TABLE sensor_rollups_rebuilt IN SHARE MODE;
+  DELETE FROM incoming_rollups i
+  USING sensor_rollups_rebuilt r
+  WHERE r.hour = date_trunc('hour', i.bucket);
+
+  INSERT INTO sensor_rollups_1m AS t (
+    device_id, bucket, count, active_count, idle_count, moving_count,
+    active_speed_sum, moving_speed_sum,
+    temp_count, temp_min, temp_max, temp_sum, temp_sumsq,
+    speed_count, speed_min, speed_max, speed_sum, speed_sumsq,
+    vib_min, vib_max, vib_sum, vib_sumsq
+  )
+  SELECT
+    device_id, date_trunc('minute', bucket), SUM(count), SUM(active_count), SUM(idle_count), SUM(moving_count),
+    SUM(active_speed_sum), SUM(moving_speed_sum),
+    SUM(temp_count), MIN(temp_min), MAX(temp_max), SUM(temp_sum), SUM(temp_sumsq),
+    SUM(speed_count), MIN(speed_min), MAX(speed_max), SUM(speed_sum), SUM(speed_sumsq),
+    MIN(vib_min), MAX(vib_max), SUM(vib_sum), SUM(vib_sumsq)
+  FROM incoming_rollups
+  GROUP BY device_id, date_trunc('minute', bucket)
+  ON CONFLICT (device_id, bucket) DO UPDATE SET
+    count = t.count + EXCLUDED.count,
+    active_count = t.active_count + EXCLUDED.active_count,
+    idle_count = t.idle_count + EXCLUDED.idle_count,
+    moving_count = t.moving_count + EXCLUDED.moving_count,
+    active_speed_sum = t.active_speed_sum + EXCLUDED.active_speed_sum,
+    moving_speed_sum = t.moving_speed_sum + EXCLUDED.moving_speed_sum,
+    temp_count = t.temp_count + EXCLUDED.temp_count,
+    temp_min = LEAST(t.temp_min, EXCLUDED.temp_min),
+    temp_max = GREATEST(t.temp_max, EXCLUDED.temp_max),
+    temp_sum = t.temp_sum + EXCLUDED.temp_sum,
+    temp_sumsq = t.temp_sumsq + EXCLUDED.temp_sumsq,
+    speed_count = t.speed_count + EXCLUDED.speed_count,
+    speed_min = LEAST(t.speed_min, EXCLUDED.speed_min),
+    speed_max = GREATEST(t.speed_max, EXCLUDED.speed_max),
+    speed_sum = t.speed_sum + EXCLUDED.speed_sum,
+    speed_sumsq = t.speed_sumsq + EXCLUDED.speed_sumsq,
+    vib_min = LEAST(t.vib_min, EXCLUDED.vib_min),
+    vib_max = GREATEST(t.vib_max, EXCLUDED.vib_max),
+    vib_sum = t.vib_sum + EXCLUDED.vib_sum,
+    vib_sumsq = t.vib_sumsq + EXCLUDED.vib_sumsq,
+    updated_at = NOW();
+
+  GET DIAGNOSTICS merged = ROW_COUNT;
+
+  INSERT INTO sensor_rollups_1h AS t (
+    device_id, bucket, count, active_count, idle_count, moving_count,
+    active_speed_sum, moving_speed_sum,
+    temp_count, temp_min, temp_max, temp_sum, temp_sumsq,
+    speed_count, speed_min, speed_max, speed_sum, speed_sumsq,
+    vib_min, vib_max, vib_sum, vib_sumsq
+  )
+  SELECT
+    device_id, date_trunc('hour', bucket), SUM(count), SUM(active_count), SUM(idle_count), SUM(moving_count),
+    SUM(active_speed_sum), SUM(moving_speed_sum),
+    SUM(temp_count), MIN(temp_min), MAX(temp_max), SUM(temp_sum), SUM(temp_sumsq),
+    SUM(speed_count), MIN(speed_min), MAX(speed_max), SUM(speed_sum), SUM(speed_sumsq),
+    MIN(vib_min), MAX(vib_max), SUM(vib_sum), SUM(vib_sumsq)
+  FROM incoming_rollups
+  GROUP BY device_id, date_trunc('hour', bucket)
+  ON CONFLICT (device_id, bucket) DO UPDATE SET
+    count = t.count + EXCLUDED.count,
+    active_count = t.active_count + EXCLUDED.active_count,
+    idle_count = t.idle_count + EXCLUDED.idle_count,
+    moving_count = t.moving_count + EXCLUDED.moving_count,
+    active_speed_sum = t.active_speed_sum + EXCLUDED.active_speed_sum,
+    moving_speed_sum = t.moving_speed_sum + EXCLUDED.moving_speed_sum,
+    temp_count = t.temp_count + EXCLUDED.temp_count,
+    temp_min = LEAST(t.temp_min, EXCLUDED.temp_min),
+    temp_max = GREATEST(t.temp_max, EXCLUDED.temp_max),
+    temp_sum = t.temp_sum + EXCLUDED.temp_sum,
+    temp_sumsq = t.temp_sumsq + EXCLUDED.temp_sumsq,
+    speed_count = t.speed_count + EXCLUDED.speed_count,
+    speed_min = LEAST(t.speed_min, EXCLUDED.speed_min),
+    speed_max = GREATEST(t.speed_max, EXCLUDED.speed_max),
+    speed_sum = t.speed_sum + EXCLUDED.speed_sum,
+    speed_sumsq = t.speed_sumsq + EXCLUDED.speed_sumsq,
+    vib_min = LEAST(t.vib_min, EXCLUDED.vib_min),
+    vib_max = GREATEST(t.vib_max, EXCLUDED.vib_max),
+    vib_sum = t.vib_sum + EXCLUDED.vib_sum,
+    vib_sumsq = t.vib_sumsq + EXCLUDED.vib_sumsq,
+    updated_at = NOW();
+
+  RETURN merged;
+END;
+$$ LANGUAGE plpgsql;
+
+-- =====================================================
+-- FUNCTION: Rebuild rollups from sensor_logs
+-- Backfill / repair: replaces every 1-minute and 1-hour bucket in
+-- [p_since, p_until) (widened to whole hours) with aggregates recomputed
+-- from sensor_logs, and records those hours in sensor_rollups_rebuilt.
+-- Returns the number of 1-minute rows written.
+-- =====================================================
+CREATE OR REPLACE FUNCTION rebuild_sensor_rollups(p_since TIMESTAMPTZ, p_until TIMESTAMPTZ)
+RETURNS INTEGER AS $$
+DECLARE
+  range_start TIMESTAMPTZ := date_trunc('hour', p_since);
+  range_end TIMESTAMPTZ := date_trunc('hour', p_until + INTERVAL '59 minutes 59.999999 seconds');
+  rebuilt INTEGER;
+BEGIN
+  -- Serialises with merge_sensor_rollups (see there)
+  LOCK TABLE sensor_rollups_rebuilt IN EXCLUSIVE MODE;
+  INSERT INTO sensor_rollups_rebuilt (hour)
+  SELECT generate_series(range_start, range_end - INTERVAL '1 hour', INTERVAL '1 hour')
+  ON CONFLICT (hour) DO UPDATE SET rebuilt_at = NOW();
+
+  DELETE FROM sensor_rollups_1m WHERE bucket >= range_start AND bucket < range_end;
+  DELETE FROM sensor_rollups_1h WHERE bucket >= range_start AND bucket < range_end;
+
+  INSERT INTO sensor_rollups_1m (
+    device_id, bucket, count, active_count, idle_count, moving_count,
+    active_speed_sum, moving_speed_sum,
+    temp_count, temp_min, temp_max, temp_sum, temp_sumsq,
+    speed_count, speed_min, speed_max, speed_sum, speed_sumsq,
+    vib_min, vib_max, vib_sum, vib_sumsq
+  )
+  SELECT
+    device_id,
+    date_trunc('minute', timestamp),
+    COUNT(*),
+    COUNT(*) FILTER (WHERE speed > 1),
+    COUNT(*) FILTER (WHERE speed < 1 AND vib > 0.01),
+    COUNT(*) FILTER (WHERE speed > 0),
+    COALESCE(SUM(speed) FILTER (WHERE speed > 1), 0),
+    COALESCE(SUM(speed) FILTER (WHERE speed > 0), 0),
+    COUNT(temperature), MIN(temperature), MAX(temperature),
+    COALESCE(SUM(temperature), 0), COALESCE(SUM(temperature * temperature), 0),
+    COUNT(speed), MIN(speed), MAX(speed),
+    COALESCE(SUM(speed), 0), COALESCE(SUM(speed * speed), 0),
+    MIN(vib), MAX(vib), SUM(vib), SUM(vib * vib)
+  FROM (
+    SELECT
+      device_id, timestamp,
+      temperature::DOUBLE PRECISION AS temperature,
+      speed::DOUBLE PRECISION AS speed,
+      SQRT(
+        COALESCE(vibration_x, 0)^2 + COALESCE(vibration_y, 0)^2 + COALESCE(vibration_z, 0)^2
+      )::DOUBLE PRECISION AS vib
+    FROM sensor_logs
+    WHERE timestamp >= range_start AND timestamp < range_end
+  ) readings
+  GROUP BY device_id, date_trunc('minute', timestamp);
+
+  GET DIAGNOSTICS rebuilt = ROW_COUNT;
+
+  INSERT INTO sensor_rollups_1h (
+    device_id, bucket, count, active_count, idle_count, moving_count,
+    active_speed_sum, moving_speed_sum,
+    temp_count, temp_min, temp_max, temp_sum, temp_sumsq,
+    speed_count, speed_min, speed_max, speed_sum, speed_sumsq,
+    vib_min, vib_max, vib_sum, vib_sumsq
+  )
+  SELECT
+    device_id, date_trunc('hour', bucket), SUM(count), SUM(active_count), SUM(idle_count), SUM(moving_count),
+    SUM(active_speed_sum), SUM(moving_speed_sum),
+    SUM(temp_count), MIN(temp_min), MAX(temp_max), SUM(temp_sum), SUM(temp_sumsq),
+    SUM(speed_count), MIN(speed_min), MAX(speed_max), SUM(speed_sum), SUM(speed_sumsq),
+    MIN(vib_min), MAX(vib_max), SUM(vib_sum), SUM(vib_sumsq)
+  FROM sensor_rollups_1m
+  WHERE bucket >= range_start AND bucket < range_end
+  GROUP BY device_id, date_trunc('hour', bucket);
+
+  RETURN rebuilt;
+END;
+$$ LANGUAGE plpgsql;
+
+-- =====================================================
+-- ROW LEVEL SECURITY
+-- =====================================================
+ALTER TABLE sensor_rollups_1m ENABLE ROW LEVEL SECURITY;
+ALTER TABLE sensor_rollups_1h ENABLE ROW LEVEL SECURITY;
+ALTER TABLE sensor_rollups_rebuilt ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Service role full access on sensor_rollups_1m" ON sensor_rollups_1m FOR ALL USING (true);
+CREATE POLICY "Service role full access on sensor_rollups_1h" ON sensor_rollups_1h FOR ALL USING (true);
+CREATE POLICY "Service role full access on sensor_rollups_rebuilt" ON sensor_rollups_rebuilt FOR ALL USING (true);
+
+COMMENT ON TABLE sensor_rollups_1m IS 'Per-device 1-minute sensor aggregates (fed by the AI engine, rebuilt by rebuild_sensor_rollups)';
+COMMENT ON TABLE sensor_rollups_1h IS 'Per-device 1-hour sensor aggregates (fed by the AI engine, rebuilt by rebuild_sensor_rollups)';
@@ -0,0 +1,161 @@
+-- =====================================================
+-- PHASE 8: ANALYTICS FUNCTIONS
+-- Server-side aggregation for the AI engine's analytics endpoints, so they
+-- receive one row per device (or per device-minute) instead of every
+-- sensor reading
+-- Run this migration after schema.sql (only sensor_logs and alerts are required)
+--
+-- Every function is paged by its caller through p_after_* (the last row's
+-- key) and p_limit. The resume key filters sensor_logs / alerts before the
+-- aggregation, so a page aggregates only the groups it returns instead of
+-- the whole window again.
+-- =====================================================
+
+-- Signatures before paging parameters were added
+DROP FUNCTION IF EXISTS sensor_window_totals(TIMESTAMPTZ, TIMESTAMPTZ, VARCHAR);
+DROP FUNCTION IF EXISTS sensor_trend_grid(TIMESTAMPTZ, INTEGER, VARCHAR);
+DROP FUNCTION IF EXISTS alert_counts(TIMESTAMPTZ);
+
+-- =====================================================
+-- FUNCTION: Per-device totals over a window of sensor_logs
+-- Same fields and activity rules as the rollup tables
+-- (phase7-sensor-rollups.sql): readings with speed > 1 are "active",
+-- speed < 1 with vibration magnitude > 0.01 "idle"; vibration magnitude
+-- treats missing axes as 0. One row per device, ordered by device_id,
+-- starting after p_after_device_id; at most p_limit rows (NULL: all).
+-- =====================================================
+CREATE OR REPLACE FUNCTION sensor_window_totals(
+  p_since TIMESTAMPTZ,
+  p_until TIMESTAMPTZ DEFAULT NULL,
+  p_device_id VARCHAR DEFAULT NULL,
+  p_after_device_id VARCHAR DEFAULT NULL,
+  p_limit INTEGER DEFAULT NULL
+)
+RETURNS TABLE (
+  device_id VARCHAR(100),
+  count BIGINT, active_count BIGINT, idle_count BIGINT, moving_count BIGINT,
+  active_speed_sum DOUBLE PRECISION, moving_speed_sum DOUBLE PRECISION,
+  temp_count BIGINT, temp_min DOUBLE PRECISION, temp_max DOUBLE PRECISION,
+  temp_sum DOUBLE PRECISION, temp_sumsq DOUBLE PRECISION,
+  speed_count BIGINT, speed_min DOUBLE PRECISION, speed_max DOUBLE PRECISION,
+  speed_sum DOUBLE PRECISION, speed_sumsq DOUBLE PRECISION,
+  vib_min DOUBLE PRECISION, vib_max DOUBLE PRECISION,
+  vib_sum DOUBLE PRECISION, vib_sumsq DOUBLE PRECISION
+) AS $$
+  SELECT
+    r.device_id,
+    COUNT(*),
+    COUNT(*) FILTER (WHERE r.speed > 1),
+    COUNT(*) FILTER (WHERE r.speed < 1 AND r.vib > 0.01),
+    COUNT(*) FILTER (WHERE r.speed > 0),
+    COALESCE(SUM(r.speed) FILTER (WHERE r.speed > 1), 0),
+    COALESCE(SUM(r.speed) FILTER (WHERE r.speed > 0), 0),
+    COUNT(r.temperature), MIN(r.temperature), MAX(r.temperature),
+    COALESCE(SUM(r.temperature), 0), COALESCE(SUM(r.temperature * r.temperature), 0),
+    COUNT(r.speed), MIN(r.speed), MAX(r.speed),
+    COALESCE(SUM(r.speed), 0), COALESCE(SUM(r.speed * r.speed), 0),
+    MIN(r.vib), MAX(r.vib), SUM(r.vib), SUM(r.vib * r.vib)
+  FROM (
+    SELECT
+      s.device_id,
+      s.temperature::DOUBLE PRECISION AS temperature,
+      s.speed::DOUBLE PRECISION AS speed,
+      SQRT(
+        COALESCE(s.vibration_x, 0)^2 + COALESCE(s.vibration_y, 0)^2 + COALESCE(s.vibration_z, 0)^2
+      )::DOUBLE PRECISION AS vib
+    FROM sensor_logs s
+    WHERE s.timestamp >= p_since
+      AND (p_until IS NULL OR s.timestamp < p_until)
+      AND (p_device_id IS NULL OR s.device_id = p_device_id)
+      AND (p_after_device_id IS NULL OR s.device_id > p_after_device_id)
+  ) r
+  GROUP BY r.device_id
+  ORDER BY r.device_id
+  LIMIT p_limit;
+$$ LANGUAGE sql STABLE;
+
+-- =====================================================
+-- FUNCTION: Per-device time grid of sensor_logs
+-- Mean temperature and vibration magnitude per device and
+-- p_bin_seconds-wide bin (bin = floor(epoch / p_bin_seconds)), the input of
+-- the AI engine's trend fits. Empty bins produce no row; a bin whose
+-- temperatures are all NULL has a NULL temp_mean. Ordered by device and bin,
+-- starting after (p_after_device_id, p_after_bin); at most p_limit rows.
+-- =====================================================
+CREATE OR REPLACE FUNCTION sensor_trend_grid(
+  p_since TIMESTAMPTZ,
+  p_bin_seconds INTEGER DEFAULT 60,
+  p_device_id VARCHAR DEFAULT NULL,
+  p_after_device_id VARCHAR DEFAULT NULL,
+  p_after_bin BIGINT DEFAULT NULL,
+  p_limit INTEGER DEFAULT NULL
+)
+RETURNS TABLE (
+  device_id VARCHAR(100),
+  bin BIGINT,
+  readings BIGINT,
+  temp_mean DOUBLE PRECISION,
+  vib_mean DOUBLE PRECISION
+) AS $$
+  SELECT
+    s.device_id,
+    FLOOR(EXTRACT(EPOCH FROM s.timestamp) / p_bin_seconds)::BIGINT AS bin,
+    COUNT(*),
+    AVG(s.temperature)::DOUBLE PRECISION,
+    AVG(SQRT(
+      COALESCE(s.vibration_x, 0)^2 + COALESCE(s.vibration_y, 0)^2 + COALESCE(s.vibration_z, 0)^2
+    ))::DOUBLE PRECISION
+  FROM sensor_logs s
+  WHERE s.timestamp >= p_since
+    AND (p_device_id IS NULL OR s.device_id = p_device_id)
+    -- Readings from the start of the bin after the resume key on
+    AND (p_after_device_id IS NULL OR (s.device_id, s.timestamp) >=
+         (p_after_device_id, TO_TIMESTAMP((p_after_bin + 1) * p_bin_seconds)))
+  GROUP BY s.device_id, bin
+  ORDER BY s.device_id, bin
+  LIMIT p_limit;
+$$ LANGUAGE sql STABLE;
+
+-- =====================================================
+-- FUNCTION: Alert counts since a point in time
+-- One row per machine with alerts: total, critical, and counts per type
+-- ({"overheat": 3, ...}), ordered by machine_id, starting after
+-- p_after_machine_id; at most p_limit rows
+-- =====================================================
+CREATE OR REPLACE FUNCTION alert_counts(
+  p_since TIMESTAMPTZ,
+  p_after_machine_id UUID DEFAULT NULL,
+  p_limit INTEGER DEFAULT NULL
+)
+RETURNS TABLE (
+  machine_id UUID,
+  count BIGINT,
+  critical_count BIGINT,
+  type_counts JSONB
+) AS $$
+  SELECT
+    t.machine_id,
+    SUM(t.n)::BIGINT,
+    SUM(t.critical)::BIGINT,
+    jsonb_object_agg(t.type, t.n)
+  FROM (
+    SELECT
+      a.machine_id, a.type,
+      COUNT(*) AS n,
+      COUNT(*) FILTER (WHERE a.severity = 'critical') AS critical
+    FROM alerts a
+    WHERE a.created_at >= p_since
+      AND (p_after_machine_id IS NULL OR a.machine_id > p_after_machine_id)
+    GROUP BY a.machine_id, a.type
+  ) t
+  GROUP BY t.machine_id
+  ORDER BY t.machine_id
+  LIMIT p_limit;
+$$ LANGUAGE sql STABLE;
+
+-- Grid and window scans filter one device over a time range
+CREATE INDEX IF NOT EXISTS idx_sensor_logs_device_timestamp ON sensor_logs(device_id, timestamp);
+
+COMMENT ON FUNCTION sensor_window_totals IS 'Per-device reading counts and metric sums / min / max over a sensor_logs window (AI engine analytics)';
+COMMENT ON FUNCTION sensor_trend_grid IS 'Per-device binned temperature / vibration means over sensor_logs (AI engine trend fits)';
+COMMENT ON FUNCTION alert_counts IS 'Alert counts per machine (total, critical, per type) since a point in time';
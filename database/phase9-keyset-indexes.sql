@@ -0,0 +1,25 @@
+-- =====================================================
+-- PHASE 9: KEYSET PAGINATION INDEXES
+-- The AI engine pages through sensor_logs ordered by (timestamp, id) and
+-- through the rollup tables ordered by (bucket, device_id), resuming after
+-- the last row seen (services/ai-engine/sensor_reader.py):
+--   timestamp > last_ts OR (timestamp = last_ts AND id > last_id)
+-- With a composite index on the same key, every page (oldest or newest
+-- first) is one index range scan that stops after the page size, instead
+-- of a scan of the rest of the window followed by a sort
+-- Run this migration after schema.sql (phase7-sensor-rollups.sql for the
+-- rollup indexes)
+-- =====================================================
+
+CREATE INDEX IF NOT EXISTS idx_sensor_logs_timestamp_id ON sensor_logs(timestamp, id);
+
+-- Rollup tables are keyed (device_id, bucket); pages walk them by bucket
+DO $$
+BEGIN
+  IF to_regclass('sensor_rollups_1m') IS NOT NULL THEN
+    CREATE INDEX IF NOT EXISTS idx_sensor_rollups_1m_bucket_device ON sensor_rollups_1m(bucket, device_id);
+  END IF;
+  IF to_regclass('sensor_rollups_1h') IS NOT NULL THEN
+    CREATE INDEX IF NOT EXISTS idx_sensor_rollups_1h_bucket_device ON sensor_rollups_1h(bucket, device_id);
+  END IF;
+END $$;
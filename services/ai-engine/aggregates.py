@@ -0,0 +1,144 @@
+"""
+Server-Side Aggregates
+======================
+Analytics queries answered by Postgres functions
+(database/phase8-analytics-functions.sql) instead of shipping raw rows to
+the engine:
+
+- window_totals(): per-device counts, sums and min / max over a sensor_logs
+  window, in the same fields as the rollup tables, so the rollup helpers
+  (rollups.total_rollups / rollup_stats) summarise them unchanged.
+- trend_grid(): per-device binned means, the input of the trend fits.
+- alert_counts(): per-machine alert totals by type and severity.
+
+Results are paged, so the server's max-rows cap never truncates a large
+fleet. Each function takes the last row's key and a page size as parameters
+and applies the key before aggregating (see _rpc_pages), so a page costs an
+aggregation of its own groups rather than of the whole window.
+"""
+
+from typing import Callable, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+from db_executor import check_deadline
+from rollups import ROLLUP_FIELDS
+from sensor_reader import SENSOR_PAGE_SIZE
+
+
+ALERT_COUNT_FIELDS = ('machine_id', 'count', 'critical_count', 'type_counts')
+
+
+def window_totals(db, since: str, until: Optional[str] = None,
+                  device_id: Optional[str] = None) -> pd.DataFrame:
+    """
+    Per-device totals of sensor_logs in [since, until).
+
+    Returns:
+        DataFrame indexed by device_id with the ROLLUP_FIELDS columns (same
+        shape as rollups.combine_rollups), empty if there are no readings
+    """
+    params = {'p_since': since, 'p_until': until, 'p_device_id': device_id}
+    chunks = list(_rpc_pages(db, 'sensor_window_totals', params,
+                             lambda row: {'p_after_device_id': row['device_id']}))
+    if not chunks:
+        return pd.DataFrame(columns=ROLLUP_FIELDS, index=pd.Index([], name='device_id'))
+
+    df = pd.concat(chunks, ignore_index=True).set_index('device_id')
+    return df[list(ROLLUP_FIELDS)].apply(pd.to_numeric)
+
+
+def trend_grid(db, since: str, bin_seconds: int,
+               device_id: Optional[str] = None) -> pd.DataFrame:
+    """
+    Per-device grid of mean temperature and vibration magnitude since `since`.
+
+    Returns:
+        DataFrame with device_id, bin (floor(epoch / bin_seconds)), readings,
+        temp_mean and vib_mean, sorted by device then bin; NaN temp_mean where
+        a bin had no temperatures
+    """
+    params = {'p_since': since, 'p_bin_seconds': bin_seconds, 'p_device_id': device_id}
+    chunks = list(_rpc_pages(db, 'sensor_trend_grid', params,
+                             lambda row: {'p_after_device_id': row['device_id'], 'p_after_bin': row['bin']}))
+    if not chunks:
+        return pd.DataFrame(columns=['device_id', 'bin', 'readings', 'temp_mean', 'vib_mean'])
+
+    df = pd.concat(chunks, ignore_index=True)
+    df[['bin', 'readings']] = df[['bin', 'readings']].astype(np.int64)
+    df[['temp_mean', 'vib_mean']] = df[['temp_mean', 'vib_mean']].astype(np.float64)
+    return df
+
+
+def alert_counts(db, since: str) -> pd.DataFrame:
+    """
+    Alerts created since `since`, counted per machine.
+
+    Returns:
+        DataFrame with machine_id, count, critical_count and type_counts
+        ({type: count}), one row per machine with alerts
+    """
+    chunks = list(_rpc_pages(db, 'alert_counts', {'p_since': since},
+                             lambda row: {'p_after_machine_id': row['machine_id']}))
+    if not chunks:
+        return pd.DataFrame(columns=ALERT_COUNT_FIELDS)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def _rpc_pages(db, function: str, params: dict, resume: Callable[[dict], dict],
+               page_size: int = SENSOR_PAGE_SIZE) -> Iterator[pd.DataFrame]:
+    """
+    Page through an aggregating RPC that takes its resume key and page size
+    as parameters (p_after_*, p_limit).
+
+    Args:
+        db: Supabase client
+        function: RPC name
+        params: Arguments common to every page
+        resume: Resume-key arguments following a page's last row
+
+    Yields:
+        DataFrame per page
+
+    Raises:
+        DatabaseTimeout: Run on the DatabaseExecutor, past the call's timeout
+    """
+    after = {}
+    while True:
+        check_deadline()
+        rows = db.rpc(function, {**params, **after, 'p_limit': page_size}).execute().data or []
+        # Stop on an empty page rather than a short one: the server may cap
+        # pages below page_size
+        if not rows:
+            return
+        yield pd.DataFrame(rows)
+
+        after = resume(rows[-1])
+        # NULL keys sort last: nothing follows them (and NULL means "from the start")
+        if any(value is None for value in after.values()):
+            return
+
+
+def count_alert_rows(alerts: list) -> pd.DataFrame:
+    """alert_counts()-shaped frame from raw alert rows (machine_id, type, severity)"""
+    counts = {}
+    for alert in alerts:
+        row = counts.setdefault(alert.get('machine_id'), {'count': 0, 'critical_count': 0, 'type_counts': {}})
+        row['count'] += 1
+        row['critical_count'] += alert.get('severity') == 'critical'
+        alert_type = alert.get('type', 'unknown')
+        row['type_counts'][alert_type] = row['type_counts'].get(alert_type, 0) + 1
+    return pd.DataFrame(
+        [{'machine_id': machine_id, **row} for machine_id, row in counts.items()],
+        columns=ALERT_COUNT_FIELDS
+    )
+
+
+def alert_type_totals(counts: pd.DataFrame) -> dict:
+    """Alert count per type across machines, from an alert_counts() frame"""
+    totals = {}
+    for type_counts in counts['type_counts']:
+        for alert_type, n in type_counts.items():
+            totals[alert_type] = totals.get(alert_type, 0) + int(n)
+    return totals
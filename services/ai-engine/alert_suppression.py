@@ -0,0 +1,262 @@
+"""
+Alert Suppression
+=================
+Turns a stream of per-reading anomalies into alert state transitions.
+
+A machine overheating for an hour at one reading every 3 seconds produces
+~1200 anomalous readings, but only one alert: it opened, maybe escalated, and
+eventually resolved. The suppressor keeps one alert per (machine,
+anomaly_type) and emits only those transitions:
+
+- opened:    first anomaly of that type for the machine
+- escalated: a later anomaly with a higher severity (info < warning < critical)
+- resolved:  the machine kept reporting for `resolve_after` seconds without
+             that anomaly type
+
+Everything in between is counted on the open alert (occurrences, peak score)
+and suppressed. Critical variants belong to the same alert as their base
+type (overheat_critical escalates an open overheat alert rather than opening
+a second one). An alert that reopens within `cooldown` seconds of being
+announced stays silent, resolution included, so a flapping threshold does
+not notify twice; if it gets worse than what was announced, or is still
+anomalous once the cooldown has passed, it is announced as opened then.
+Downstream therefore always sees opened, escalated*, resolved.
+
+Times are reading times in seconds since the epoch, so resolution follows the
+machine's own clock; a machine that stops reporting keeps its alerts open
+until it reports again.
+
+State:
+------
+Alert state is a set of (machine, alert type) arrays from an array store
+(see shared_state), so worker processes share one set of alerts; observe()
+and open_alerts() hold the store's lock. Details are kept as up to
+DETAILS_BYTES of UTF-8.
+"""
+
+from typing import Callable, List, Sequence
+
+import numpy as np
+
+from detector import ANOMALY_TYPES
+from shared_state import CapacityError, LocalArrays
+
+
+SEVERITY_RANK = {"info": 0, "warning": 1, "critical": 2}
+SEVERITIES = tuple(SEVERITY_RANK)
+
+# Detector anomaly types that share an alert with another type
+ALERT_TYPES = {"overheat_critical": "overheat", "vibration_critical": "vibration"}
+
+# One state column per alert type
+ALERT_TYPE_NAMES = tuple(dict.fromkeys(
+    ALERT_TYPES.get(name, name) for name in ANOMALY_TYPES.values() if name is not None
+))
+
+DETAILS_BYTES = 128
+
+OPENED = "opened"
+ESCALATED = "escalated"
+RESOLVED = "resolved"
+
+COUNTERS = ("anomalies", "suppressed", OPENED, ESCALATED, RESOLVED)
+
+# State arrays: name -> (dtype, initial value)
+STATE_FIELDS = {
+    'open': (bool, False),
+    'announced': (bool, False),            # the current alert was announced (not a silent reopen)
+    'severity': (np.int8, 0),              # SEVERITY_RANK
+    'opened_at': (np.float64, 0.0),
+    'last_seen': (np.float64, 0.0),
+    'occurrences': (np.int64, 0),
+    'peak_score': (np.float64, 0.0),
+    'details': (f'S{DETAILS_BYTES}', b''),
+    'announced_at': (np.float64, 0.0),     # last announcement, for the cooldown
+    'announced_severity': (np.int8, -1),   # -1: never announced
+}
+
+
+class AlertSuppressor:
+    """
+    Per-(machine, anomaly_type) open / escalate / resolve state machine.
+    """
+
+    def __init__(self, machine_id: Callable[[int], str], resolve_after: float = 60.0,
+                 cooldown: float = 300.0, initial_machines: int = 64, arrays=None):
+        """
+        Args:
+            machine_id: Resolves an interned machine index to its machine ID
+            resolve_after: Seconds without the anomaly before its alert resolves
+            cooldown: Seconds after an alert opened during which reopening it is silent
+            initial_machines: Initial array capacity (grows as machines appear)
+            arrays: Array store (default: process-local; see shared_state)
+        """
+        arrays = arrays or LocalArrays()
+        self.machine_id = machine_id
+        self.resolve_after = resolve_after
+        self.cooldown = cooldown
+        self._fixed_capacity = arrays.max_machines is not None
+        self._capacity = arrays.max_machines or initial_machines
+        self._lock = arrays.lock('alerts')
+        self._type_index = {name: t for t, name in enumerate(ALERT_TYPE_NAMES)}
+        self._state = {
+            field: arrays.array(field, (self._capacity, len(ALERT_TYPE_NAMES)), dtype, fill)
+            for field, (dtype, fill) in STATE_FIELDS.items()
+        }
+        self._counters = arrays.array('counters', len(COUNTERS), np.int64)
+
+    def observe(self, machines: np.ndarray, seconds: np.ndarray, indices: np.ndarray,
+                rows: Sequence[dict]) -> List[dict]:
+        """
+        Fold a detected batch into the alert state.
+
+        Args:
+            machines: Interned machine index per reading (whole batch)
+            seconds: Reading time per reading (whole batch)
+            indices: Positions of the anomalous readings in the batch
+            rows: Detector result rows for those readings (anomaly_type,
+                severity, anomaly_score, details)
+
+        Returns:
+            Transitions in order: one dict per opened, escalated or resolved
+            alert with machine_id, anomaly_type (see ALERT_TYPES), transition, severity,
+            timestamp (epoch ms), opened_at (epoch ms), occurrences,
+            anomaly_score and details
+        """
+        transitions = []
+        if not len(machines):
+            return transitions
+        machines = np.asarray(machines, dtype=np.int64)
+
+        with self._lock:
+            self._ensure_capacity(int(machines.max()) + 1)
+            for i, row in zip(np.asarray(indices).tolist(), rows):
+                transition = self._anomaly(int(machines[i]), float(seconds[i]), row)
+                if transition is not None:
+                    transitions.append(transition)
+            self._count("anomalies", len(rows))
+            self._count("suppressed", len(rows) - len(transitions))
+
+            # Resolve quiet alerts of machines that reported in this batch
+            codes, inverse = np.unique(machines, return_inverse=True)
+            if self._state['open'][codes].any():
+                latest = np.full(len(codes), -np.inf)
+                np.maximum.at(latest, inverse, np.asarray(seconds, dtype=np.float64))
+                transitions.extend(self._resolve_quiet(codes, latest))
+        return transitions
+
+    def open_alerts(self) -> List[dict]:
+        """Currently open alerts, oldest first"""
+        with self._lock:
+            machines, types = np.nonzero(self._state['open'])
+            alerts = [
+                self._describe(machine, t, "open", float(self._state['last_seen'][machine, t]))
+                for machine, t in zip(machines.tolist(), types.tolist())
+            ]
+        return sorted(alerts, key=lambda alert: alert["opened_at"])
+
+    def stats(self) -> dict:
+        return {
+            "open": int(np.count_nonzero(self._state['open'])),
+            "resolve_after": self.resolve_after,
+            "cooldown": self.cooldown,
+            **{name: int(value) for name, value in zip(COUNTERS, self._counters)}
+        }
+
+    # ───────────────────────────────────────────────────────────────
+    # Transitions (caller holds the lock)
+    # ───────────────────────────────────────────────────────────────
+
+    def _anomaly(self, machine: int, now: float, row: dict):
+        t = self._type_index[ALERT_TYPES.get(row["anomaly_type"], row["anomaly_type"])]
+        rank = SEVERITY_RANK.get(row["severity"], 0)
+        state = self._state
+
+        if state['open'][machine, t]:
+            state['last_seen'][machine, t] = max(state['last_seen'][machine, t], now)
+            state['occurrences'][machine, t] += 1
+            state['peak_score'][machine, t] = max(state['peak_score'][machine, t], row["anomaly_score"])
+            escalated = rank > state['severity'][machine, t]
+            if escalated:
+                state['severity'][machine, t] = rank
+                state['details'][machine, t] = _encode(row["details"])
+            if not state['announced'][machine, t]:
+                # A silent reopen is announced once it gets worse than what was
+                # last announced, or once it outlasts the cooldown
+                if (state['severity'][machine, t] <= state['announced_severity'][machine, t]
+                        and now - state['announced_at'][machine, t] < self.cooldown):
+                    return None
+                state['announced'][machine, t] = True
+                return self._announce(machine, t, OPENED, now)
+            return self._announce(machine, t, ESCALATED, now) if escalated else None
+
+        state['open'][machine, t] = True
+        state['severity'][machine, t] = rank
+        state['opened_at'][machine, t] = now
+        state['last_seen'][machine, t] = now
+        state['occurrences'][machine, t] = 1
+        state['peak_score'][machine, t] = row["anomaly_score"]
+        state['details'][machine, t] = _encode(row["details"])
+        announced_severity = state['announced_severity'][machine, t]
+        if (announced_severity >= 0 and now - state['announced_at'][machine, t] < self.cooldown
+                and rank <= announced_severity):
+            # Reopened within the cooldown, no worse than before: stays silent
+            state['announced'][machine, t] = False
+            return None
+        state['announced'][machine, t] = True
+        return self._announce(machine, t, OPENED, now)
+
+    def _resolve_quiet(self, codes: np.ndarray, now: np.ndarray) -> List[dict]:
+        """Resolve the open alerts of machines `codes` quiet since times `now`"""
+        state = self._state
+        quiet = state['open'][codes] & (now[:, None] - state['last_seen'][codes] >= self.resolve_after)
+        rows, types = np.nonzero(quiet)
+        machines = codes[rows]
+        state['open'][machines, types] = False
+
+        announced = state['announced'][machines, types]
+        self._count(RESOLVED, int(np.count_nonzero(announced)))
+        return [
+            self._describe(machine, t, RESOLVED, resolved_at)
+            for machine, t, resolved_at in zip(machines[announced].tolist(), types[announced].tolist(),
+                                               now[rows][announced].tolist())
+        ]
+
+    def _announce(self, machine: int, t: int, transition: str, now: float) -> dict:
+        self._state['announced_at'][machine, t] = now
+        self._state['announced_severity'][machine, t] = self._state['severity'][machine, t]
+        self._count(transition)
+        return self._describe(machine, t, transition, now)
+
+    def _describe(self, machine: int, t: int, transition: str, now: float) -> dict:
+        state = self._state
+        return {
+            "machine_id": self.machine_id(machine),
+            "anomaly_type": ALERT_TYPE_NAMES[t],
+            "transition": transition,
+            "severity": SEVERITIES[state['severity'][machine, t]],
+            "timestamp": int(now * 1000),
+            "opened_at": int(state['opened_at'][machine, t] * 1000),
+            "occurrences": int(state['occurrences'][machine, t]),
+            "anomaly_score": round(float(state['peak_score'][machine, t]), 3),
+            "details": state['details'][machine, t].decode(errors="ignore"),
+        }
+
+    def _count(self, counter: str, amount: int = 1):
+        self._counters[COUNTERS.index(counter)] += amount
+
+    def _ensure_capacity(self, needed: int):
+        if needed <= self._capacity:
+            return
+        if self._fixed_capacity:
+            raise CapacityError(f"Shared alert state holds {self._capacity} machines; raise SHARED_MAX_MACHINES")
+        size = max(needed, 2 * self._capacity)
+        for field, (dtype, fill) in STATE_FIELDS.items():
+            array = self._state[field]
+            self._state[field] = np.concatenate([array, np.full((size - self._capacity, array.shape[1]), fill, dtype)])
+        self._capacity = size
+
+
+def _encode(details: str) -> bytes:
+    """details as UTF-8, cut to DETAILS_BYTES (a split character is dropped on decode)"""
+    return details.encode()[:DETAILS_BYTES]
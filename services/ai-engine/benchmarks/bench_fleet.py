@@ -0,0 +1,357 @@
+"""
+Fleet Load Benchmark
+====================
+Throughput and latency of the AI engine's hot endpoints at fleet scale, for
+catching performance regressions before a deploy. The engine runs
+in-process behind an ASGI client (httpx, no server or network), with an
+in-memory Supabase fake (fake_supabase.py) seeded with history from the
+simulator's VirtualMachine:
+
+    POST /ingest                    one request per --batch live readings
+    POST /detect                    the same kind of batches, scored
+    GET  /predict/maintenance       source=database and source=stream
+    GET  /stats                     24 h window over the fake sensor_logs
+
+Before timing, the engine is trained (/train) and its trend stats are
+synced (/trends/sync) from the fake, as on a real startup.
+
+Each fleet size runs in its own process, so engine state and memory start
+fresh. For every endpoint the JSON report gives requests, errors, req/s,
+p50 / p99 / mean latency (ms) and the peak RSS while that endpoint ran
+(VmHWM, reset between endpoints; the process-wide peak where that is not
+possible). Request bodies are encoded up front and are not part of the
+timing.
+
+Usage:
+    cd services/ai-engine
+    python benchmarks/bench_fleet.py [--fleet 50 1000 10000] [--history 30]
+        [--batch 500] [--requests 50] [--max-seconds 20] [--output results.json]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', '..', 'simulator'))
+from fake_supabase import FakeSupabase  # noqa: E402
+
+MACHINE_TYPES = ('tractor', 'harvester', 'baler', 'happy_seeder')
+
+# (method, path, body) per request
+Request = Tuple[str, str, Optional[bytes]]
+
+
+# ───────────────────────────────────────────────────────────────
+# Synthetic fleet
+# ───────────────────────────────────────────────────────────────
+
+def build_fleet(machines: int, seed: int) -> list:
+    from simulator import VirtualMachine
+
+    random.seed(seed)
+    return [VirtualMachine(f"sim_{i + 1:05d}") for i in range(machines)]
+
+
+def fleet_ticks(fleet: list, ticks: int, start_ms: int, interval_ms: int) -> List[dict]:
+    """Simulator payloads for `ticks` rounds of the whole fleet, timestamped `interval_ms` apart"""
+    payloads = []
+    # VirtualMachine prints every injected anomaly
+    with contextlib.redirect_stdout(io.StringIO()):
+        for tick in range(ticks):
+            for machine in fleet:
+                machine.update()
+                payload = machine.get_payload()
+                payload['timestamp'] = start_ms + tick * interval_ms
+                payloads.append(payload)
+    return payloads
+
+
+def seed_database(fleet: list, history: int, interval: int) -> FakeSupabase:
+    """Fake Supabase with machines, `history` readings per machine ending now, and their alerts"""
+    now = datetime.now(timezone.utc)
+    start_ms = int((now - timedelta(seconds=history * interval)).timestamp() * 1000)
+    readings = pd.DataFrame(fleet_ticks(fleet, history, start_ms, interval * 1000))
+
+    machines = pd.DataFrame({
+        'id': [str(uuid.uuid4()) for _ in fleet],
+        'device_id': [machine.id for machine in fleet],
+        'name': [f"Machine {machine.id}" for machine in fleet],
+        'type': [MACHINE_TYPES[i % len(MACHINE_TYPES)] for i in range(len(fleet))],
+        'status': 'available',
+    })
+    machine_uuid = dict(zip(machines['device_id'], machines['id']))
+
+    timestamps = pd.to_datetime(readings['timestamp'], unit='ms', utc=True).map(lambda ts: ts.isoformat())
+    sensor_logs = pd.DataFrame({
+        'id': [str(uuid.uuid4()) for _ in range(len(readings))],
+        'machine_id': readings['id'].map(machine_uuid),
+        'device_id': readings['id'],
+        'temperature': readings['temp'],
+        'vibration_x': readings['vib_x'],
+        'vibration_y': readings['vib_y'],
+        'vibration_z': readings['vib_z'],
+        'latitude': readings['gps'].str[0],
+        'longitude': readings['gps'].str[1],
+        'speed': readings['speed'],
+        'state': readings['mode'],
+        'timestamp': timestamps,
+    })
+
+    # One alert per threshold breach, as the backend would have written them
+    vib = np.sqrt(readings['vib_x'] ** 2 + readings['vib_y'] ** 2 + readings['vib_z'] ** 2)
+    overheat, vibration = readings['temp'] > 90, (vib > 0.5) & (readings['temp'] <= 90)
+    alerts = pd.concat([
+        pd.DataFrame({'type': 'overheat', 'severity': np.where(readings['temp'][overheat] > 100, 'critical', 'warning'),
+                      'device_id': readings['id'][overheat], 'created_at': timestamps[overheat]}),
+        pd.DataFrame({'type': 'vibration', 'severity': 'warning',
+                      'device_id': readings['id'][vibration], 'created_at': timestamps[vibration]}),
+    ], ignore_index=True)
+    alerts = pd.DataFrame({
+        'id': [str(uuid.uuid4()) for _ in range(len(alerts))],
+        'machine_id': alerts['device_id'].map(machine_uuid),
+        'type': alerts['type'],
+        'severity': alerts['severity'],
+        'message': alerts['type'] + ' on ' + alerts['device_id'],
+        'acknowledged': False,
+        'created_at': alerts['created_at'],
+    })
+
+    return FakeSupabase(
+        {'machines': machines, 'sensor_logs': sensor_logs, 'alerts': alerts},
+        sort_keys={'sensor_logs': ('timestamp', 'id'), 'alerts': ('created_at', 'id')}
+    )
+
+
+def batch_requests(payloads: List[dict], path: str, batch: int) -> List[Request]:
+    return [
+        (
+            "POST", path,
+            json.dumps({"data": payloads[start:start + batch]}).encode()
+        )
+        for start in range(0, len(payloads) - batch + 1, batch)
+    ]
+
+
+# ───────────────────────────────────────────────────────────────
+# Measurement
+# ───────────────────────────────────────────────────────────────
+
+def reset_peak_rss() -> bool:
+    """Reset the kernel's peak-RSS counter (VmHWM) for this process (Linux)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb() -> float:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+async def run_endpoint(client, requests: List[Request], max_seconds: float, concurrency: int,
+                       warmup: int = 1) -> dict:
+    """Issue requests (up to max_seconds) from `concurrency` workers and summarise them"""
+    # Untimed first requests absorb one-off costs (lazy imports, array growth)
+    for method, path, body in requests[:warmup]:
+        await client.request(method, path, content=body,
+                             headers={"content-type": "application/json"} if body is not None else None)
+    requests = requests[warmup:]
+    per_endpoint_peak = reset_peak_rss()
+    latencies = []
+    errors = 0
+    pending = iter(requests)
+    deadline = time.perf_counter() + max_seconds
+
+    async def worker():
+        nonlocal errors
+        for method, path, body in pending:
+            if time.perf_counter() > deadline:
+                return
+            start = time.perf_counter()
+            response = await client.request(
+                method, path, content=body,
+                headers={"content-type": "application/json"} if body is not None else None
+            )
+            latencies.append(time.perf_counter() - start)
+            errors += response.status_code >= 400
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "req_per_s": round(len(latencies) / elapsed, 2) if elapsed > 0 else None,
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 2) if len(latencies) else None,
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 2) if len(latencies) else None,
+        "mean_ms": round(float(latencies_ms.mean()), 2) if len(latencies) else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "peak_rss_scope": "endpoint" if per_endpoint_peak else "process",
+    }
+
+
+async def wait_for_job(client, job: dict) -> dict:
+    while job["status"] not in ("completed", "failed"):
+        await asyncio.sleep(0.05)
+        job = (await client.get(f"/train/jobs/{job['job_id']}")).json()
+    if job["status"] == "failed":
+        raise RuntimeError(f"Setup job failed: {job.get('error')}")
+    return job
+
+
+# ───────────────────────────────────────────────────────────────
+# One fleet
+# ───────────────────────────────────────────────────────────────
+
+async def bench_fleet(args, machines: int) -> dict:
+    import httpx
+    import main
+    from db_executor import InstrumentedClient
+
+    setup = {}
+    started = time.perf_counter()
+    fleet = build_fleet(machines, args.seed)
+    database = seed_database(fleet, args.history, args.history_interval)
+    setup["history_rows"] = database.row_count('sensor_logs')
+    # Query metrics are on in production, so they are part of what is timed
+    main.supabase = InstrumentedClient(database) if main.METRICS_ENABLED else database
+    setup["seed_s"] = round(time.perf_counter() - started, 2)
+
+    # Live readings continue the history; enough for every /ingest and /detect request
+    ticks = -(-(args.requests + args.warmup) * args.batch // machines)
+    now_ms = int(time.time() * 1000)
+    ingest = fleet_ticks(fleet, ticks, now_ms, args.interval_ms)
+    detect = fleet_ticks(fleet, ticks, now_ms + ticks * args.interval_ms, args.interval_ms)
+    plan = {
+        "POST /ingest": batch_requests(ingest, "/ingest", args.batch),
+        "POST /detect": batch_requests(detect, "/detect", args.batch),
+        "GET /predict/maintenance?source=database": [("GET", "/predict/maintenance?source=database", None)],
+        "GET /predict/maintenance?source=stream": [("GET", "/predict/maintenance?source=stream", None)],
+        "GET /stats": [("GET", "/stats?hours=24", None)],
+    }
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://ai-engine", timeout=None) as client:
+        started = time.perf_counter()
+        trained = (await client.post("/train", params={"hours": 24, "wait": True})).json()
+        if trained.get("status") != "completed":
+            raise RuntimeError(f"Training failed: {trained}")
+        setup["train_s"] = round(time.perf_counter() - started, 2)
+
+        started = time.perf_counter()
+        (await client.post("/trends/sync", params={"days": 1})).raise_for_status()
+        setup["trend_sync_s"] = round(time.perf_counter() - started, 2)
+
+        endpoints = {}
+        for name, requests in plan.items():
+            if name.startswith("GET"):
+                requests = requests * (args.requests + args.warmup)
+            result = await run_endpoint(client, requests, args.max_seconds, args.concurrency, args.warmup)
+            if name.startswith("POST"):
+                result["readings_per_request"] = args.batch
+                result["readings_per_s"] = round(result["req_per_s"] * args.batch, 1)
+            endpoints[name] = result
+
+    return {"machines": machines, "setup": setup, "endpoints": endpoints}
+
+
+def run_in_subprocess(args, machines: int) -> dict:
+    """bench_fleet() for one fleet size in a fresh interpreter"""
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, "result.json")
+        command = [
+            sys.executable, os.path.abspath(__file__),
+            "--fleet", str(machines), "--output", output,
+            "--history", str(args.history), "--history-interval", str(args.history_interval),
+            "--interval-ms", str(args.interval_ms), "--batch", str(args.batch),
+            "--requests", str(args.requests), "--max-seconds", str(args.max_seconds),
+            "--concurrency", str(args.concurrency), "--warmup", str(args.warmup), "--seed", str(args.seed),
+        ]
+        subprocess.run(command, check=True, stdout=sys.stderr)
+        with open(output) as f:
+            return json.load(f)["fleets"][0]
+
+
+def print_summary(report: dict):
+    for fleet in report["fleets"]:
+        print(f"\n{fleet['machines']} machines ({fleet['setup']['history_rows']} history rows, "
+              f"train {fleet['setup']['train_s']} s)", file=sys.stderr)
+        for name, result in fleet["endpoints"].items():
+            print(f"  {name:<44} {result['req_per_s'] or 0:>9.1f} req/s  p50 {result['p50_ms'] or 0:>9.2f} ms  "
+                  f"p99 {result['p99_ms'] or 0:>9.2f} ms  peak {result['peak_rss_mb']:>7.1f} MB"
+                  + (f"  ({result['errors']} errors)" if result['errors'] else ""), file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fleet', type=int, nargs='+', default=[50, 1000, 10000], help='Fleet sizes (machines)')
+    parser.add_argument('--history', type=int, default=30, help='Seeded sensor_logs readings per machine')
+    parser.add_argument('--history-interval', type=int, default=60, help='Seconds between seeded readings')
+    parser.add_argument('--interval-ms', type=int, default=3000, help='Milliseconds between live readings of a machine')
+    parser.add_argument('--batch', type=int, default=500, help='Readings per /ingest and /detect request')
+    parser.add_argument('--requests', type=int, default=50, help='Requests per endpoint')
+    parser.add_argument('--max-seconds', type=float, default=20, help='Time limit per endpoint')
+    parser.add_argument('--concurrency', type=int, default=1, help='Requests in flight')
+    parser.add_argument('--warmup', type=int, default=1, help='Untimed requests per endpoint')
+    parser.add_argument('--seed', type=int, default=42, help='Simulator random seed')
+    parser.add_argument('--output', help='Write the JSON report here (default: stdout)')
+    args = parser.parse_args()
+
+    report = {
+        "benchmark": "fleet",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("fleet", "output")},
+    }
+
+    if len(args.fleet) == 1:
+        # Engine config is read at import; benchmark the computation, not the response cache
+        os.environ.setdefault("CACHE_TTL", "0")
+        os.environ.setdefault("MODEL_STORE_DIR", tempfile.mkdtemp(prefix="bench-models-"))
+        # The engine logs to stdout; keep stdout for the report
+        with contextlib.redirect_stdout(sys.stderr):
+            report["fleets"] = [asyncio.run(bench_fleet(args, args.fleet[0]))]
+    else:
+        report["fleets"] = [run_in_subprocess(args, machines) for machines in args.fleet]
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    print_summary(report)
+
+
+if __name__ == "__main__":
+    main()
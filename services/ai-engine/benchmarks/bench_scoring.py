@@ -0,0 +1,92 @@
+"""
+Isolation Forest Scoring Benchmark
+==================================
+Compares per-reading ML scoring latency on a 150-estimator forest:
+
+    before: predict() + score_samples()   (trees walked twice)
+    after:  score_samples() + offset_     (trees walked once)
+
+Also checks that both paths flag exactly the same readings.
+
+Usage:
+    cd services/ai-engine
+    python benchmarks/bench_scoring.py [--readings 200] [--repeat 3]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from detector import is_outlier_score  # noqa: E402
+
+
+def build_model(n_samples: int = 10000, seed: int = 42):
+    """Fit a scaler + forest the same way POST /train does, on synthetic readings"""
+    rng = np.random.default_rng(seed)
+    features = np.column_stack([
+        rng.normal(60, 12, n_samples),      # temperature
+        rng.gamma(2.0, 0.05, n_samples),    # vibration magnitude
+        rng.uniform(0, 15, n_samples),      # speed
+    ])
+    scaler = StandardScaler()
+    features_scaled = scaler.fit_transform(features)
+    model = IsolationForest(contamination=0.05, random_state=42, n_estimators=150, max_samples='auto')
+    model.fit(features_scaled)
+    return model, scaler, features
+
+
+def score_before(model, scaler, row: np.ndarray):
+    features_scaled = scaler.transform(row)
+    prediction = model.predict(features_scaled)[0]
+    score = -model.score_samples(features_scaled)[0]
+    return prediction == -1, score
+
+
+def score_after(model, scaler, row: np.ndarray):
+    score = -model.score_samples(scaler.transform(row))
+    return bool(is_outlier_score(model, score)[0]), score[0]
+
+
+def time_per_reading(fn, model, scaler, readings: np.ndarray, repeat: int) -> dict:
+    """Best-of-N mean latency per reading in microseconds"""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for row in readings:
+            fn(model, scaler, row.reshape(1, -1))
+        runs.append((time.perf_counter() - start) / len(readings) * 1e6)
+    return {"best_us": round(min(runs), 1), "mean_us": round(float(np.mean(runs)), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--readings', type=int, default=200, help='Readings scored per run')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per variant')
+    args = parser.parse_args()
+
+    model, scaler, features = build_model()
+    readings = features[:args.readings]
+
+    # Both paths must agree on every reading before timing means anything
+    for row in readings:
+        before, before_score = score_before(model, scaler, row.reshape(1, -1))
+        after, after_score = score_after(model, scaler, row.reshape(1, -1))
+        assert before == after and before_score == after_score, "scoring paths disagree"
+
+    before = time_per_reading(score_before, model, scaler, readings, args.repeat)
+    after = time_per_reading(score_after, model, scaler, readings, args.repeat)
+
+    print(f"Isolation Forest: {model.n_estimators} estimators, {len(readings)} readings, best of {args.repeat}")
+    print(f"  before (predict + score_samples): {before['best_us']:>8.1f} us/reading")
+    print(f"  after  (score_samples + offset_): {after['best_us']:>8.1f} us/reading")
+    print(f"  speedup: {before['best_us'] / after['best_us']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+In-Memory Supabase Fake
+=======================
+Stands in for the supabase-py client in benchmarks, answering the PostgREST
+queries the AI engine issues (table selects with gte / gt / lt / lte / eq /
+keyset or_ filters, order, limit, single) from pandas DataFrames.
+
+Tables can declare a sort key (sensor_logs: timestamp, id). Range and
+keyset filters on that key are answered with a binary search over the
+sorted rows, so paging through a large fleet's history costs about the same
+per page as PostgREST with an index does, and the benchmark measures the engine
+rather than the fake. Other filters are vectorized masks.
+
+RPCs are not implemented: their queries raise on execute(), which the engine
+treats like an unavailable database function (keep SERVER_AGGREGATION and
+ROLLUPS_ENABLED off).
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+# iter_pages() keyset condition: key > last, or key = last and tie > last_tie
+# (< for newest-first walks)
+_KEYSET = re.compile(r'(\w+)\.(gt|lt)\."(.*)",and\((\w+)\.eq\."(.*)",(\w+)\.(gt|lt)\."(.*)"\)')
+
+# Embedded resources in a select, e.g. "machine:machines(device_id, name)"
+_EMBEDDED = re.compile(r'\w+:\w+\([^)]*\)')
+
+
+class FakeResponse:
+    def __init__(self, data: Any):
+        self.data = data
+
+
+class FakeTable:
+    """One table's rows, optionally sorted by a key for fast range filters"""
+
+    def __init__(self, rows: pd.DataFrame, sort_key: Sequence[str] = ()):
+        self.sort_key = tuple(sort_key)
+        if self.sort_key:
+            rows = rows.sort_values(list(self.sort_key), kind='stable')
+        self.frame = rows.reset_index(drop=True)
+        self.keys = [self.frame[col].to_numpy() for col in self.sort_key]
+
+    def bound(self, value, side: str, lo: int, hi: int) -> int:
+        """searchsorted on the leading sort key within [lo, hi)"""
+        return lo + int(np.searchsorted(self.keys[0][lo:hi], _cast(self.keys[0], value), side=side))
+
+    def after(self, key, tie, lo: int, hi: int) -> int:
+        """First row after (key, tie) in sort-key order, within [lo, hi)"""
+        start = self.bound(key, 'left', lo, hi)
+        end = self.bound(key, 'right', start, hi)
+        ties = self.keys[1][start:end]
+        return start + int(np.searchsorted(ties, _cast(ties, tie), side='right'))
+
+    def before(self, key, tie, lo: int, hi: int) -> int:
+        """End of the rows before (key, tie) in sort-key order, within [lo, hi)"""
+        start = self.bound(key, 'left', lo, hi)
+        end = self.bound(key, 'right', start, hi)
+        ties = self.keys[1][start:end]
+        return start + int(np.searchsorted(ties, _cast(ties, tie), side='left'))
+
+
+class FakeQuery:
+    """Chainable query builder mirroring postgrest-py's, executed on execute()"""
+
+    def __init__(self, table: Optional[FakeTable], name: str):
+        self._table = table
+        self._name = name
+        self._columns: Optional[List[str]] = None
+        self._filters: List[Tuple[str, str, Any]] = []
+        self._order: List[Tuple[str, bool]] = []
+        self._limit: Optional[int] = None
+        self._single = False
+
+    def select(self, columns: str = '*', **kwargs) -> 'FakeQuery':
+        names = [col.strip() for col in _EMBEDDED.sub('', columns).split(',') if col.strip()]
+        self._columns = None if '*' in names else names
+        return self
+
+    def eq(self, column: str, value) -> 'FakeQuery':
+        return self._filter('eq', column, value)
+
+    def gt(self, column: str, value) -> 'FakeQuery':
+        return self._filter('gt', column, value)
+
+    def gte(self, column: str, value) -> 'FakeQuery':
+        return self._filter('gte', column, value)
+
+    def lt(self, column: str, value) -> 'FakeQuery':
+        return self._filter('lt', column, value)
+
+    def lte(self, column: str, value) -> 'FakeQuery':
+        return self._filter('lte', column, value)
+
+    def or_(self, filters: str) -> 'FakeQuery':
+        match = _KEYSET.fullmatch(filters)
+        if match is None:
+            raise NotImplementedError(f"FakeSupabase only supports keyset or_ filters, got {filters!r}")
+        key_column, direction, key, _, _, tie_column, _, tie = match.groups()
+        return self._filter('after' if direction == 'gt' else 'before', (key_column, tie_column), (key, tie))
+
+    def order(self, column: str, desc: bool = False) -> 'FakeQuery':
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, count: int) -> 'FakeQuery':
+        self._limit = count
+        return self
+
+    def single(self) -> 'FakeQuery':
+        self._single = True
+        return self
+
+    def execute(self) -> FakeResponse:
+        if self._table is None:
+            raise NotImplementedError(f"FakeSupabase has no table or function '{self._name}'")
+        table = self._table
+        frame = table.frame
+        lo, hi = 0, len(frame)
+
+        # Sort-key range filters narrow [lo, hi); everything else becomes a mask
+        masks = []
+        for op, column, value in self._filters:
+            if op == 'after' and column == table.sort_key[:2]:
+                lo = max(lo, table.after(value[0], value[1], lo, hi))
+            elif op == 'before' and column == table.sort_key[:2]:
+                hi = min(hi, table.before(value[0], value[1], lo, hi))
+            elif table.sort_key and column == table.sort_key[0] and op in ('gt', 'gte', 'lt', 'lte'):
+                if op in ('gt', 'gte'):
+                    lo = table.bound(value, 'right' if op == 'gt' else 'left', lo, hi)
+                else:
+                    hi = table.bound(value, 'left' if op == 'lt' else 'right', lo, hi)
+            else:
+                masks.append((op, column, value))
+
+        order_columns = [col for col, _ in self._order]
+        in_order = order_columns == list(table.sort_key[:len(self._order)])
+        descending = in_order and bool(self._order) and all(desc for _, desc in self._order)
+        in_order = in_order and not any(desc for _, desc in self._order)
+        if not masks and in_order and self._limit is not None:
+            hi = min(hi, lo + self._limit)
+        if not masks and descending and self._limit is not None:
+            lo = max(lo, hi - self._limit)
+        rows = frame.iloc[lo:hi]
+        if descending:
+            rows = rows.iloc[::-1]
+        for op, column, value in masks:
+            rows = rows[_mask(rows, op, column, value)]
+        if self._order and not in_order and not descending:
+            rows = rows.sort_values([col for col, _ in self._order],
+                                    ascending=[not desc for _, desc in self._order], kind='stable')
+        if self._limit is not None:
+            rows = rows.iloc[:self._limit]
+        if self._columns is not None:
+            rows = rows[[col for col in self._columns if col in rows.columns]]
+
+        data = rows.to_dict('records')
+        if self._single:
+            return FakeResponse(data[0] if data else None)
+        return FakeResponse(data)
+
+    def _filter(self, op: str, column, value) -> 'FakeQuery':
+        self._filters.append((op, column, value))
+        return self
+
+
+class FakeSupabase:
+    """
+    Minimal supabase-py Client stand-in backed by DataFrames.
+    """
+
+    def __init__(self, tables: Dict[str, pd.DataFrame],
+                 sort_keys: Optional[Dict[str, Sequence[str]]] = None):
+        """
+        Args:
+            tables: Table name -> rows
+            sort_keys: Table name -> sort key columns (leading key, tie breaker)
+        """
+        sort_keys = sort_keys or {}
+        self._tables = {name: FakeTable(rows, sort_keys.get(name, ())) for name, rows in tables.items()}
+
+    def table(self, name: str) -> FakeQuery:
+        if name not in self._tables:
+            raise NotImplementedError(f"FakeSupabase has no table '{name}'")
+        return FakeQuery(self._tables[name], name)
+
+    def rpc(self, name: str, params: Optional[dict] = None) -> FakeQuery:
+        return FakeQuery(None, name)
+
+    def row_count(self, name: str) -> int:
+        return len(self._tables[name].frame)
+
+
+def _cast(array: np.ndarray, value):
+    """A filter value (PostgREST sends strings) as the column's type"""
+    if array.dtype.kind in 'iu':
+        return int(value)
+    if array.dtype.kind == 'f':
+        return float(value)
+    return str(value)
+
+
+def _mask(rows: pd.DataFrame, op: str, column, value) -> np.ndarray:
+    if op in ('after', 'before'):
+        (key_column, tie_column), (key, tie) = column, value
+        keys, ties = rows[key_column].to_numpy(), rows[tie_column].to_numpy()
+        key, tie = _cast(keys, key), _cast(ties, tie)
+        if op == 'before':
+            return (keys < key) | ((keys == key) & (ties < tie))
+        return (keys > key) | ((keys == key) & (ties > tie))
+    values = rows[column].to_numpy()
+    value = _cast(values, value)
+    if op == 'eq':
+        return values == value
+    if op == 'gt':
+        return values > value
+    if op == 'gte':
+        return values >= value
+    if op == 'lt':
+        return values < value
+    return values <= value
@@ -0,0 +1,299 @@
+"""
+Per-Machine Change Detection
+============================
+Streaming baselines that judge each reading against its own machine's
+history, complementing the fleet-wide rule thresholds and Isolation Forest in
+detector.py. A bearing whose vibration creeps from 0.10 to 0.35 never crosses
+the global 0.5 threshold, but it is far outside that machine's normal range.
+
+State:
+------
+For every metric (temperature, vibration magnitude) the store keeps arrays
+indexed by the machine's interned index (see SensorRingBuffer.intern):
+
+    count     readings folded into the baseline
+    mean      EWMA mean
+    var       EWMA variance
+    cusum     upper CUSUM accumulator of standardized residuals
+
+The arrays and the lock come from an array store (see shared_state), so
+worker processes can share them; shared arrays have a fixed capacity of
+max_machines.
+
+Each reading costs O(1): z = (x - mean) / std against the baseline *before*
+the reading, then
+
+    cusum = max(0, cusum + z - k)          (change-point when cusum > h)
+    mean += alpha * r                      (r = x - mean, clipped to ±clip·std)
+    var   = (1 - alpha) * (var + alpha * r²)
+
+The CUSUM accumulates small, persistent excursions (slow degradation); a
+large single z catches sudden spikes. Only the upper side is tracked: a
+machine running cooler or smoother than usual is not a fault.
+
+A baseline that keeps learning would follow a slow drift and never see it,
+so the mean and variance are only updated while the machine is in control
+(cusum <= h / 2), and residuals are clipped so a single spike barely moves
+them. Once the CUSUM signals a change-point, the baseline restarts from the
+current reading: the change is reported once, and the new level becomes the
+reference (a drift that continues is reported again later). Until a machine
+has `warmup` readings since its last (re)start the baseline is a plain
+running mean and nothing is flagged.
+
+Only readings taken while moving (speed >= IDLE_SPEED) are scored, so the
+baseline describes the machine under load rather than a mix of working, idle
+and powered-off levels.
+
+Batches are folded in rounds: round r updates every machine's r-th reading
+in the batch, so each round is one vectorized step over distinct machines
+and per-machine order is preserved.
+"""
+
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from detector import IDLE_SPEED
+from shared_state import CapacityError, LocalArrays
+
+
+STATE_FIELDS = ('count', 'mean', 'var', 'cusum')
+
+# Standard-deviation floor per metric, so a very steady machine is not
+# flagged for ordinary sensor noise
+DEFAULT_MIN_STD = {'temperature': 0.5, 'vib_magnitude': 0.01}
+
+
+class MachineBaselines:
+    """
+    Per-machine EWMA baselines and CUSUM drift detection for a set of metrics.
+    """
+
+    def __init__(self, metrics: Sequence[str] = ('temperature', 'vib_magnitude'),
+                 alpha: float = 0.001, cusum_k: float = 0.5, cusum_h: float = 10.0,
+                 z_threshold: float = 6.0, clip: float = 3.0, warmup: int = 50,
+                 min_std: Optional[Dict[str, float]] = None, initial_machines: int = 64,
+                 arrays=None):
+        """
+        Args:
+            metrics: Metric names tracked per machine
+            alpha: EWMA weight of a new reading (~1/alpha readings of memory)
+            cusum_k: CUSUM allowance, in standard deviations
+            cusum_h: CUSUM decision threshold, in standard deviations
+            z_threshold: Flag a single reading this many standard deviations above the mean
+            clip: Residuals beyond this many standard deviations update the baseline as if at the limit
+            warmup: Readings per machine before anything is flagged
+            min_std: Standard-deviation floor per metric
+            initial_machines: Initial array capacity (grows as machines appear)
+            arrays: Array store (default: process-local; see shared_state)
+        """
+        self.metrics = tuple(metrics)
+        self.alpha = alpha
+        self.cusum_k = cusum_k
+        self.cusum_h = cusum_h
+        self.z_threshold = z_threshold
+        self.clip = clip
+        self.warmup = warmup
+        self.min_std = {metric: (min_std or DEFAULT_MIN_STD).get(metric, 0.0) for metric in self.metrics}
+        arrays = arrays or LocalArrays()
+        self._fixed_capacity = arrays.max_machines is not None
+        self._capacity = arrays.max_machines or initial_machines
+        self._lock = arrays.lock('baselines')
+
+        self._state = {
+            metric: {
+                field: arrays.array(f'{metric}.{field}', self._capacity,
+                                    np.int64 if field == 'count' else np.float64)
+                for field in STATE_FIELDS
+            }
+            for metric in self.metrics
+        }
+
+    # ───────────────────────────────────────────────────────────────
+    # Updates
+    # ───────────────────────────────────────────────────────────────
+
+    def update(self, machines: np.ndarray, values: Dict[str, np.ndarray],
+               speed: np.ndarray) -> Dict[str, Dict[str, np.ndarray]]:
+        """
+        Score a batch against each machine's baseline and fold it in.
+
+        Args:
+            machines: Interned machine index per reading, in arrival order
+            values: Metric name -> value per reading
+            speed: Speed per reading (readings below IDLE_SPEED are skipped)
+
+        Returns:
+            Metric name -> per-reading arrays z, cusum, baseline and flag
+            (see score_batch)
+        """
+        machines = np.asarray(machines, dtype=np.int64)
+        result = self._empty_result(len(machines))
+        rows = self._scored_rows(machines, values, speed)
+        if not len(rows):
+            return result
+
+        with self._lock:
+            self._ensure_capacity(int(machines[rows].max()) + 1)
+            for round_rows in self._rounds(machines[rows], rows):
+                codes = machines[round_rows]
+                for metric in self.metrics:
+                    x = np.asarray(values[metric], dtype=np.float64)[round_rows]
+                    self._step(metric, codes, x, round_rows, result[metric])
+        return result
+
+    def _step(self, metric: str, codes: np.ndarray, x: np.ndarray,
+              rows: np.ndarray, out: Dict[str, np.ndarray]):
+        """Score and fold one reading per machine (codes are distinct)"""
+        state = self._state[metric]
+        count = state['count'][codes]
+        mean = state['mean'][codes]
+        z, std, cusum, flag = self._evaluate(metric, codes, x)
+
+        out['z'][rows] = z
+        out['cusum'][rows] = cusum
+        out['baseline'][rows] = np.where(count > 0, mean, np.nan)
+        out['flag'][rows] = flag
+
+        # Running mean while warming up, EWMA afterwards; clipping only once
+        # the variance estimate is meaningful. Frozen while out of control.
+        warm = count >= self.warmup
+        learn = cusum <= self.cusum_h / 2
+        weight = np.where(learn, np.maximum(self.alpha, 1.0 / (count + 1)), 0.0)
+        residual = x - mean
+        residual = np.where(warm, np.clip(residual, -self.clip * std, self.clip * std), residual)
+        mean = mean + weight * residual
+        var = np.where(count > 0, (1 - weight) * (state['var'][codes] + weight * residual**2), 0.0)
+
+        # A change-point restarts the baseline at the current reading (the
+        # variance estimate is kept as a starting scale)
+        change = cusum > self.cusum_h
+        state['mean'][codes] = np.where(change, x, mean)
+        state['var'][codes] = var
+        state['cusum'][codes] = np.where(change, 0.0, cusum)
+        state['count'][codes] = np.where(change, 1, count + 1)
+
+    def _ensure_capacity(self, needed: int):
+        if needed <= self._capacity:
+            return
+        if self._fixed_capacity:
+            raise CapacityError(f"Shared baselines hold {self._capacity} machines; raise SHARED_MAX_MACHINES")
+        size = max(needed, 2 * self._capacity)
+        for state in self._state.values():
+            for field, array in state.items():
+                state[field] = np.concatenate([array, np.zeros(size - self._capacity, dtype=array.dtype)])
+        self._capacity = size
+
+    # ───────────────────────────────────────────────────────────────
+    # Queries
+    # ───────────────────────────────────────────────────────────────
+
+    def score_batch(self, machines: np.ndarray, values: Dict[str, np.ndarray],
+                    speed: np.ndarray) -> Dict[str, Dict[str, np.ndarray]]:
+        """
+        Score readings against the current baselines without updating them
+        (each reading is judged as if it were the machine's next one).
+
+        Returns:
+            Metric name -> per-reading arrays:
+                z         standard deviations above the machine's mean
+                cusum     CUSUM accumulator including this reading
+                baseline  machine's mean before the reading (NaN if unknown)
+                flag      drift detected (CUSUM change-point, or z over z_threshold)
+            Unscored readings (not moving, or warming up) have z = cusum = 0
+            and flag = False
+        """
+        machines = np.asarray(machines, dtype=np.int64)
+        result = self._empty_result(len(machines))
+        rows = self._scored_rows(machines, values, speed)
+
+        with self._lock:
+            rows = rows[machines[rows] < self._capacity]
+            codes = machines[rows]
+            for metric in self.metrics:
+                x = np.asarray(values[metric], dtype=np.float64)[rows]
+                z, _, cusum, flag = self._evaluate(metric, codes, x)
+                state = self._state[metric]
+                out = result[metric]
+                out['z'][rows] = z
+                out['cusum'][rows] = cusum
+                out['baseline'][rows] = np.where(state['count'][codes] > 0, state['mean'][codes], np.nan)
+                out['flag'][rows] = flag
+        return result
+
+    def machine_state(self, machine: int) -> Optional[Dict[str, dict]]:
+        """
+        Baseline of one machine.
+
+        Returns:
+            Metric name -> dict with readings, mean, std, cusum and warm, or
+            None if the machine has no scored readings
+        """
+        with self._lock:
+            if machine >= self._capacity or not any(
+                self._state[metric]['count'][machine] for metric in self.metrics
+            ):
+                return None
+            return {
+                metric: {
+                    "readings": int(state['count'][machine]),
+                    "mean": float(state['mean'][machine]),
+                    "std": float(np.sqrt(state['var'][machine])),
+                    "cusum": float(state['cusum'][machine]),
+                    "warm": bool(state['count'][machine] >= self.warmup),
+                }
+                for metric, state in self._state.items()
+            }
+
+    def machine_count(self) -> int:
+        """Number of machines with a baseline"""
+        with self._lock:
+            return int(np.count_nonzero(sum(self._state[m]['count'] for m in self.metrics)))
+
+    # ───────────────────────────────────────────────────────────────
+    # Helpers
+    # ───────────────────────────────────────────────────────────────
+
+    def _evaluate(self, metric: str, codes: np.ndarray, x: np.ndarray):
+        """z, std, CUSUM and flag for readings against the current state (caller holds the lock)"""
+        state = self._state[metric]
+        warm = state['count'][codes] >= self.warmup
+        std = np.maximum(np.sqrt(state['var'][codes]), self.min_std[metric])
+        z = np.where(warm, (x - state['mean'][codes]) / std, 0.0)
+        cusum = np.where(warm, np.maximum(0.0, state['cusum'][codes] + z - self.cusum_k), 0.0)
+        flag = (cusum > self.cusum_h) | (z > self.z_threshold)
+        return z, std, cusum, flag
+
+    def _empty_result(self, n: int) -> Dict[str, Dict[str, np.ndarray]]:
+        return {
+            metric: {
+                'z': np.zeros(n),
+                'cusum': np.zeros(n),
+                'baseline': np.full(n, np.nan),
+                'flag': np.zeros(n, dtype=bool),
+            }
+            for metric in self.metrics
+        }
+
+    def _scored_rows(self, machines: np.ndarray, values: Dict[str, np.ndarray],
+                     speed: np.ndarray) -> np.ndarray:
+        """Positions of moving readings with every metric present"""
+        scored = np.asarray(speed) >= IDLE_SPEED
+        for metric in self.metrics:
+            scored &= ~np.isnan(np.asarray(values[metric], dtype=np.float64))
+        return np.flatnonzero(scored)
+
+    @staticmethod
+    def _rounds(codes: np.ndarray, rows: np.ndarray):
+        """Split rows into rounds holding at most one reading per machine, in order"""
+        order = np.argsort(codes, kind='stable')
+        sorted_codes = codes[order]
+        starts = np.r_[True, sorted_codes[1:] != sorted_codes[:-1]]
+        position = np.arange(len(codes))
+        rank = np.empty(len(codes), dtype=np.int64)
+        rank[order] = position - np.maximum.accumulate(np.where(starts, position, 0))
+
+        by_round = np.argsort(rank, kind='stable')
+        bounds = np.searchsorted(rank[by_round], np.arange(int(rank.max()) + 2))
+        for r in range(len(bounds) - 1):
+            yield rows[by_round[bounds[r]:bounds[r + 1]]]
@@ -0,0 +1,204 @@
+"""
+Database Executor
+=================
+Runs blocking Supabase work off the event loop.
+
+supabase-py's client is synchronous: calling `.execute()` inside an
+`async def` endpoint blocks the whole event loop, so one slow analytics query
+stalls every concurrent request, /detect included. Endpoints instead hand
+their database work (query + aggregation) to a bounded thread pool:
+
+- `max_workers` caps concurrent database work, and with it the number of
+  connections the shared PostgREST session opens.
+- Each unit of work gets a timeout; when it expires the request fails with a
+  504 and the event loop moves on. The worker thread cannot be interrupted,
+  so the work itself stops at its next check_deadline(): paging loops (see
+  sensor_reader.iter_pages) call it between round trips, and work still
+  queued when its deadline passes never starts. A round trip already in
+  flight finishes on its own, bounded by the HTTP timeout configured on the
+  client.
+
+Query metrics:
+--------------
+InstrumentedClient wraps the Supabase client so every `.execute()` — on
+the pool or not — is counted and timed per table (RPCs as "rpc:<name>"),
+with the rows it returned, in the metrics registry (see metrics.py).
+"""
+
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+from fastapi import HTTPException
+
+from metrics import REGISTRY, LATENCY_BUCKETS, SIZE_BUCKETS
+
+
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    "agritrack_db_query_seconds", "Supabase request duration by table and outcome",
+    labels=("table", "outcome"), buckets=LATENCY_BUCKETS,
+)
+DB_ROWS_FETCHED = REGISTRY.counter(
+    "agritrack_db_rows_fetched_total", "Rows returned by Supabase requests", labels=("table",)
+)
+DB_ROWS_PER_QUERY = REGISTRY.histogram(
+    "agritrack_db_rows_per_query", "Rows returned per Supabase request", labels=("table",), buckets=SIZE_BUCKETS,
+)
+
+
+class DatabaseTimeout(HTTPException):
+    """Database work exceeded its timeout (served as 504 Gateway Timeout)"""
+
+    def __init__(self, timeout: float):
+        super().__init__(status_code=504, detail=f"Database query timed out after {timeout:g}s")
+
+
+# Deadline (time.monotonic()) and timeout of the call running on this pool thread
+_deadline = threading.local()
+
+
+def check_deadline():
+    """
+    Raise DatabaseTimeout if the executor call running on this thread is past
+    its timeout (its caller has already given up). Does nothing outside the
+    executor, e.g. in training jobs.
+    """
+    deadline = getattr(_deadline, "at", None)
+    if deadline is not None and time.monotonic() > deadline:
+        raise DatabaseTimeout(_deadline.timeout)
+
+
+class DatabaseExecutor:
+    """
+    Bounded thread pool for blocking database calls, awaited with a timeout.
+    """
+
+    def __init__(self, max_workers: int = 8, timeout: float = 30.0):
+        """
+        Args:
+            max_workers: Maximum concurrent database calls
+            timeout: Default seconds to wait for a call before failing with 504
+        """
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="supabase")
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "in_flight": 0, "timeouts": 0, "errors": 0}
+
+    async def run(self, fn: Callable[..., Any], *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) on the pool and await its result"""
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            self._executor, functools.partial(self._call, fn, args, kwargs, deadline, timeout)
+        )
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self._count("timeouts")
+            raise DatabaseTimeout(timeout) from None
+
+    async def gather(self, *calls: Callable[[], Any], timeout: Optional[float] = None) -> List[Any]:
+        """
+        Run independent zero-argument calls concurrently, so a composite
+        response waits for its slowest query rather than the sum of them.
+
+        Returns:
+            Results in call order; the first failure is raised once every
+            call has settled
+        """
+        results = await asyncio.gather(
+            *(self.run(call, timeout=timeout) for call in calls), return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return list(results)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"max_workers": self.max_workers, "timeout": self.timeout, **self._counters}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _call(self, fn: Callable[..., Any], args: tuple, kwargs: dict, deadline: float, timeout: float) -> Any:
+        _deadline.at, _deadline.timeout = deadline, timeout
+        self._count("calls")
+        self._count("in_flight")
+        try:
+            # Waited in the queue past the deadline: nobody wants the result
+            check_deadline()
+            return fn(*args, **kwargs)
+        except HTTPException:
+            raise
+        except Exception:
+            self._count("errors")
+            raise
+        finally:
+            self._count("in_flight", -1)
+            _deadline.at = None
+
+    def _count(self, name: str, delta: int = 1):
+        with self._lock:
+            self._counters[name] += delta
+
+
+class InstrumentedClient:
+    """
+    Supabase client proxy recording query metrics. Everything other than
+    table() and rpc() is passed through to the wrapped client.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def table(self, name: str, *args, **kwargs) -> "_InstrumentedQuery":
+        return _InstrumentedQuery(self.client.table(name, *args, **kwargs), name)
+
+    def rpc(self, name: str, *args, **kwargs) -> "_InstrumentedQuery":
+        return _InstrumentedQuery(self.client.rpc(name, *args, **kwargs), f"rpc:{name}")
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.client, name)
+
+
+class _InstrumentedQuery:
+    """Query builder proxy: keeps wrapping the chain, times execute()"""
+
+    __slots__ = ("_query", "_table")
+
+    def __init__(self, query, table: str):
+        self._query = query
+        self._table = table
+
+    def execute(self) -> Any:
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            response = self._query.execute()
+            outcome = "ok"
+        finally:
+            DB_QUERY_SECONDS.labels(self._table, outcome).observe(time.perf_counter() - start)
+        data = getattr(response, "data", None)
+        rows = len(data) if isinstance(data, list) else int(data is not None)
+        DB_ROWS_FETCHED.labels(self._table).inc(rows)
+        DB_ROWS_PER_QUERY.labels(self._table).observe(rows)
+        return response
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._query, name)
+        if hasattr(attr, "execute"):
+            # Builder-valued properties, e.g. .not_
+            return _InstrumentedQuery(attr, self._table)
+        if not callable(attr):
+            return attr
+
+        def chained(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            return _InstrumentedQuery(result, self._table) if hasattr(result, "execute") else result
+        return chained
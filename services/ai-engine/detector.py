@@ -0,0 +1,304 @@
+"""
+Batch Anomaly Detector
+======================
+Vectorized rule + ML anomaly detection over a whole SensorBatch.
+
+Pipeline:
+---------
+1. Build one feature matrix for the batch (temperature, vibration magnitude, speed)
+2. Apply the rule thresholds as NumPy masks, in priority order:
+   overheat_critical > overheat > vibration_critical > vibration > idle
+3. Mark per-machine drift (change_detection.py) on rows no rule flagged, when
+   the caller passes baseline scores
+4. Run the scaler and Isolation Forest on only the rows still unflagged: once
+   for the batch, or (with per-machine-type models) once per model, each on
+   its own rows. Models trained with sequence features also get each row's
+   window features (sequence_features.py) after the three instantaneous ones
+5. Emit one result row per reading, in input order (detect_batch), or rows
+   for the anomalous readings only (find_anomalies, for binary batches)
+
+The inlier/outlier decision is derived from a single score_samples() pass using
+the forest's fitted offset_, exactly as IsolationForest.predict() does
+internally, so the trees are walked once per row instead of twice.
+
+Every classified batch records its size, its result codes and the time
+spent in each model call in the metrics registry (see metrics.py).
+"""
+
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+from metrics import REGISTRY, SIZE_BUCKETS
+
+
+# Rule thresholds (REQ-AI-01 for idle)
+TEMP_CRITICAL = 100
+TEMP_WARNING = 90
+VIB_CRITICAL = 0.7
+VIB_WARNING = 0.5
+IDLE_SPEED = 1
+IDLE_VIBRATION = 0.02
+
+# Result codes, one per row
+NORMAL = 0
+OVERHEAT_CRITICAL = 1
+OVERHEAT = 2
+VIBRATION_CRITICAL = 3
+VIBRATION = 4
+IDLE = 5
+ML_DETECTED = 6
+TEMPERATURE_DRIFT = 7
+VIBRATION_DRIFT = 8
+
+ANOMALY_TYPES = {
+    NORMAL: None,
+    OVERHEAT_CRITICAL: "overheat_critical",
+    OVERHEAT: "overheat",
+    VIBRATION_CRITICAL: "vibration_critical",
+    VIBRATION: "vibration",
+    IDLE: "idle",
+    ML_DETECTED: "ml_detected",
+    TEMPERATURE_DRIFT: "temperature_drift",
+    VIBRATION_DRIFT: "vibration_drift",
+}
+
+# Baseline metric behind each drift code
+DRIFT_METRICS = {TEMPERATURE_DRIFT: 'temperature', VIBRATION_DRIFT: 'vib_magnitude'}
+
+# Stage that decided each result code
+DECISION_SOURCES = {
+    NORMAL: "none", OVERHEAT_CRITICAL: "rule", OVERHEAT: "rule", VIBRATION_CRITICAL: "rule",
+    VIBRATION: "rule", IDLE: "rule", ML_DETECTED: "ml", TEMPERATURE_DRIFT: "drift", VIBRATION_DRIFT: "drift",
+}
+
+BATCH_READINGS = REGISTRY.histogram(
+    "agritrack_detection_batch_readings", "Readings per classified batch", buckets=SIZE_BUCKETS
+)
+DECISIONS = REGISTRY.counter(
+    "agritrack_detection_decisions_total", "Classified readings by deciding stage and anomaly type",
+    labels=("source", "anomaly_type"),
+)
+MODEL_SCORING_SECONDS = REGISTRY.histogram(
+    "agritrack_model_scoring_seconds", "Scaler + forest time per model call (fleet or machine-type model)",
+    labels=("model",),
+)
+MODEL_SCORED_READINGS = REGISTRY.counter(
+    "agritrack_model_scored_readings_total", "Readings scored by an anomaly model", labels=("model",)
+)
+
+
+def vibration_magnitude(vib_x: np.ndarray, vib_y: np.ndarray, vib_z: np.ndarray) -> np.ndarray:
+    """Euclidean vibration magnitude per reading"""
+    return np.sqrt(vib_x**2 + vib_y**2 + vib_z**2)
+
+
+def is_outlier_score(model, raw_scores: np.ndarray) -> np.ndarray:
+    """
+    Outlier mask from negated score_samples() output.
+
+    Equivalent to model.predict(X) == -1, which flags rows where
+    score_samples(X) - offset_ < 0, without a second pass over the trees.
+    """
+    return -raw_scores - model.offset_ < 0
+
+
+def detect_batch(columns: Dict[str, np.ndarray], model=None, scaler=None,
+                 drift: Optional[Dict[str, Dict[str, np.ndarray]]] = None,
+                 models: Optional[Sequence[tuple]] = None,
+                 model_index: Optional[np.ndarray] = None,
+                 sequence: Optional[np.ndarray] = None) -> List[dict]:
+    """
+    Detect anomalies for a batch of readings.
+
+    Args:
+        columns: Column arrays with keys temp, vib_x, vib_y, vib_z, speed
+        model: Fitted IsolationForest (optional)
+        scaler: Fitted StandardScaler matching the model (optional)
+        drift: Per-machine baseline scores for the batch, as returned by
+            MachineBaselines.update / score_batch (optional)
+        models: Additional (model, scaler) pairs, e.g. per machine type (optional)
+        model_index: Per reading, the position in `models` of the pair that
+            scores it, or -1 for model/scaler (required with models)
+        sequence: Per-reading window features (sequence_features.py), for
+            models trained on them (required by those models)
+
+    Returns:
+        One dict per reading with keys is_anomaly, anomaly_score, anomaly_type,
+        details, severity (everything AnomalyResult needs except machine_id)
+    """
+    codes, scores, ml_scores, vib = classify_batch(columns, model, scaler, drift, models, model_index, sequence)
+    return _build_rows(codes, scores, ml_scores, columns['temp'], vib, columns['speed'], drift)
+
+
+def find_anomalies(columns: Dict[str, np.ndarray], model=None, scaler=None,
+                   drift: Optional[Dict[str, Dict[str, np.ndarray]]] = None,
+                   models: Optional[Sequence[tuple]] = None,
+                   model_index: Optional[np.ndarray] = None,
+                   sequence: Optional[np.ndarray] = None) -> Tuple[np.ndarray, List[dict]]:
+    """
+    Like detect_batch(), but only formats the anomalous readings.
+
+    Returns:
+        Tuple of (indices, rows): positions of the anomalous readings in the
+        batch and their result dicts
+    """
+    codes, scores, ml_scores, vib = classify_batch(columns, model, scaler, drift, models, model_index, sequence)
+    idx = np.flatnonzero(codes != NORMAL)
+    if drift is not None:
+        drift = {metric: {key: values[idx] for key, values in scored.items()} for metric, scored in drift.items()}
+    return idx, _build_rows(codes[idx], scores[idx], ml_scores[idx],
+                            columns['temp'][idx], vib[idx], columns['speed'][idx], drift)
+
+
+def classify_batch(columns: Dict[str, np.ndarray], model=None, scaler=None,
+                   drift: Optional[Dict[str, Dict[str, np.ndarray]]] = None,
+                   models: Optional[Sequence[tuple]] = None,
+                   model_index: Optional[np.ndarray] = None,
+                   sequence: Optional[np.ndarray] = None, record: bool = True
+                   ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Per-reading result codes and scores.
+
+    Args:
+        record: Count the batch in the detection metrics (off for readings
+            classified only to screen them, e.g. for online learning)
+
+    Returns:
+        Tuple of (codes, scores, ml_scores, vibration magnitude) arrays
+
+    Raises:
+        ValueError: A model was trained on sequence features and `sequence`
+            is missing
+    """
+    temp = columns['temp']
+    speed = columns['speed']
+    vib = vibration_magnitude(columns['vib_x'], columns['vib_y'], columns['vib_z'])
+    n = len(temp)
+
+    # Rule masks, evaluated in priority order (first match wins)
+    codes = np.select(
+        [
+            temp > TEMP_CRITICAL,
+            temp > TEMP_WARNING,
+            vib > VIB_CRITICAL,
+            vib > VIB_WARNING,
+            (speed < IDLE_SPEED) & (vib > IDLE_VIBRATION),
+        ],
+        [OVERHEAT_CRITICAL, OVERHEAT, VIBRATION_CRITICAL, VIBRATION, IDLE],
+        default=NORMAL,
+    )
+
+    scores = np.zeros(n)
+    scores[codes == OVERHEAT_CRITICAL] = 1.0
+    scores[codes == VIBRATION_CRITICAL] = 1.0
+    scores[codes == IDLE] = 0.3
+    overheat = codes == OVERHEAT
+    scores[overheat] = np.minimum(1.0, (temp[overheat] - TEMP_WARNING) / 30)
+    vibration = codes == VIBRATION
+    scores[vibration] = np.minimum(1.0, vib[vibration] / 1.0)
+
+    # Drift against the machine's own baseline, for rows inside the global limits
+    if drift is not None:
+        for code, metric in DRIFT_METRICS.items():
+            drifting = (codes == NORMAL) & drift[metric]['flag']
+            codes[drifting] = code
+            scores[drifting] = np.minimum(1.0, 0.5 + drift[metric]['z'][drifting] / 20)
+
+    # ML pass over rows the rules left unflagged, grouped by the model that scores them
+    ml_scores = np.zeros(n)
+    unflagged = np.flatnonzero(codes == NORMAL)
+    route = np.full(len(unflagged), -1) if models is None else np.asarray(model_index)[unflagged]
+    for group in np.unique(route).tolist():
+        group_model, group_scaler = (model, scaler) if group < 0 else models[group]
+        if group_model is None or group_scaler is None:
+            continue
+        rows = unflagged if models is None else unflagged[route == group]
+        features = np.column_stack([temp[rows], vib[rows], speed[rows]])
+        if group_scaler.n_features_in_ > features.shape[1]:
+            # Trained with window features appended (see sequence_features.py)
+            if sequence is None:
+                raise ValueError("Model expects sequence features, but none were given")
+            features = np.hstack([features, sequence[rows]])
+            # Incomplete windows (NaN) count as the training mean
+            features = np.where(np.isnan(features), group_scaler.mean_, features)
+        start = time.perf_counter()
+        raw_scores = -group_model.score_samples(group_scaler.transform(features))
+        kind = "fleet" if group < 0 else "machine_type"
+        MODEL_SCORING_SECONDS.labels(kind).observe(time.perf_counter() - start)
+        MODEL_SCORED_READINGS.labels(kind).inc(len(rows))
+        is_outlier = is_outlier_score(group_model, raw_scores)
+
+        outliers = rows[is_outlier]
+        outlier_scores = raw_scores[is_outlier]
+        codes[outliers] = ML_DETECTED
+        ml_scores[outliers] = outlier_scores
+        scores[outliers] = np.minimum(1.0, outlier_scores / 0.5)
+
+    if record:
+        _record_batch(codes)
+    return codes, scores, ml_scores, vib
+
+
+def _record_batch(codes: np.ndarray):
+    BATCH_READINGS.observe(len(codes))
+    counts = np.bincount(codes, minlength=len(ANOMALY_TYPES))
+    for code in np.flatnonzero(counts).tolist():
+        DECISIONS.labels(DECISION_SOURCES[code], ANOMALY_TYPES[code] or "normal").inc(int(counts[code]))
+
+
+def _build_rows(codes: np.ndarray, scores: np.ndarray, ml_scores: np.ndarray,
+                temp: np.ndarray, vib: np.ndarray, speed: np.ndarray,
+                drift: Optional[Dict[str, Dict[str, np.ndarray]]] = None) -> List[dict]:
+    """Format per-reading result rows (details are only rendered for anomalies)"""
+    codes = codes.tolist()
+    scores = scores.tolist()
+    rows = []
+
+    for i, code in enumerate(codes):
+        if code == NORMAL:
+            rows.append({
+                "is_anomaly": False,
+                "anomaly_score": 0.0,
+                "anomaly_type": None,
+                "details": "",
+                "severity": "warning",
+            })
+            continue
+
+        if code == OVERHEAT_CRITICAL:
+            details = f"CRITICAL: Temperature {float(temp[i])}°C exceeds 100°C"
+            severity = "critical"
+        elif code == OVERHEAT:
+            details = f"Temperature {float(temp[i])}°C exceeds 90°C threshold"
+            severity = "warning"
+        elif code == VIBRATION_CRITICAL:
+            details = f"CRITICAL: Vibration {vib[i]:.3f} indicates mechanical failure"
+            severity = "critical"
+        elif code == VIBRATION:
+            details = f"High vibration {vib[i]:.3f} - check machinery"
+            severity = "warning"
+        elif code == IDLE:
+            details = f"Machine idle with engine running (speed={float(speed[i])}, vib={vib[i]:.3f})"
+            severity = "info"
+        elif code in DRIFT_METRICS:
+            scored = drift[DRIFT_METRICS[code]]
+            value = f"Temperature {float(temp[i])}°C" if code == TEMPERATURE_DRIFT else f"Vibration {vib[i]:.3f}"
+            baseline = f"{scored['baseline'][i]:.1f}°C" if code == TEMPERATURE_DRIFT else f"{scored['baseline'][i]:.3f}"
+            details = (f"{value} drifting above this machine's baseline {baseline} "
+                       f"(z={scored['z'][i]:.1f}, CUSUM={scored['cusum'][i]:.1f})")
+            severity = "warning"
+        else:
+            score = float(ml_scores[i])
+            details = f"ML model detected unusual pattern (score={score:.3f})"
+            severity = "warning" if score < 0.3 else "critical"
+
+        rows.append({
+            "is_anomaly": True,
+            "anomaly_score": round(scores[i], 3),
+            "anomaly_type": ANOMALY_TYPES[code],
+            "details": details,
+            "severity": severity,
+        })
+
+    return rows
@@ -6,19 +6,43 @@ AgriTrack AI Engine v2.0
 - Real-time and historical analysis
 """
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, field_validator
+from typing import Any, Callable, Dict, List, Literal, Optional, Sequence
 import numpy as np
-from sklearn.ensemble import IsolationForest
-from sklearn.linear_model import LinearRegression
-from sklearn.preprocessing import StandardScaler
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+import asyncio
 import os
-from supabase import create_client, Client
+import sys
+import tempfile
+import time
+from supabase import create_client, Client, ClientOptions
 import pandas as pd
 
+from ring_buffer import SensorRingBuffer, MACHINE_ID_BYTES, MISSING_TIMESTAMP, readings_to_columns
+from detector import NORMAL, classify_batch, detect_batch, find_anomalies, vibration_magnitude
+from binary_batch import CONTENT_TYPE as BINARY_CONTENT_TYPE, BatchFormatError, decode_batch
+from training import (
+    ModelBundle, ReservoirSampler, RollingReservoir, TrainingJobManager, fit_anomaly_model, fit_anomaly_models
+)
+from forest_scorer import FlatForest
+from sensor_reader import RunningStats, iter_pages, iter_sensor_logs, vib_magnitude
+from rollups import ROLLUP_FIELDS, RollupAccumulator, combine_rollups, load_rollups, rollup_stats, total_rollups
+from aggregates import alert_counts, alert_type_totals, count_alert_rows, trend_grid, window_totals
+from model_store import ModelStore
+from trends import DAY_SECONDS, MIN_TREND_POINTS, epoch_seconds, group_rows, linear_trends, resample_grid, trend_alerts
+from streaming_trends import StreamingTrendStats
+from change_detection import MachineBaselines
+from sequence_features import FEATURE_NAMES as SEQUENCE_FEATURE_NAMES, MachineWindows
+from response_cache import ResponseCache
+from db_executor import DatabaseExecutor, InstrumentedClient
+from mqtt_consumer import MqttConsumer
+from alert_suppression import AlertSuppressor
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY, MetricsMiddleware
+from agritrack_common.profiler import install as install_profiler
+from shared_state import CapacityError, LeaderLock, LocalArrays, SharedArrays
+
 app = FastAPI(
     title="AgriTrack AI Engine",
     description="Anomaly detection, predictive maintenance, and analytics for CRM machinery",
@@ -36,14 +60,204 @@ app.add_middleware(
 # Supabase client
 supabase: Optional[Client] = None
 
-# ML Models
-anomaly_model: Optional[IsolationForest] = None
-scaler: Optional[StandardScaler] = None
-model_trained_at: Optional[datetime] = None
+# Multi-worker mode: `python main.py` with WORKERS > 1 serves from that many
+# uvicorn worker processes (as does `uvicorn main:app --workers N` with
+# WORKERS=N). Per-machine state (real-time buffer and machine IDs, drift
+# baselines, sequence windows, trend stats, online reservoir, open alerts)
+# then lives in memory-mapped arrays under SHARED_STATE_DIR, sized for
+# SHARED_MAX_MACHINES machines (~2 KB each, allocated as machines appear);
+# models are memory-mapped from the model store, whose current version every
+# worker checks every MODEL_SYNC_INTERVAL seconds. One worker, the leader,
+# runs the MQTT consumer, online refits and trend sync. The analytics cache
+# and /metrics stay per worker (without a database, another worker's cache
+# may lag an ingest by up to CACHE_TTL). The first worker to attach clears
+# state left in SHARED_STATE_DIR by a previous run (see shared_state)
+WORKERS = int(os.getenv("WORKERS", 1))
+SHARED_STATE_DIR = os.getenv("SHARED_STATE_DIR", os.path.join(
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "agritrack-ai-engine"
+))
+SHARED_MAX_MACHINES = int(os.getenv("SHARED_MAX_MACHINES", 20000))
+MODEL_SYNC_INTERVAL = float(os.getenv("MODEL_SYNC_INTERVAL", 2))  # seconds
+state_arrays = SharedArrays(SHARED_STATE_DIR, SHARED_MAX_MACHINES) if WORKERS > 1 else LocalArrays()
+leader_lock = LeaderLock(os.path.join(SHARED_STATE_DIR, "leader.lock")) if WORKERS > 1 else None
+
+# ML Models (scaler + forest are published together; swap the reference, never mutate)
+active_model: Optional[ModelBundle] = None
+training_jobs = TrainingJobManager(jobs_dir=os.path.join(SHARED_STATE_DIR, "jobs") if WORKERS > 1 else None)
+
+# Trained models are versioned on disk and warm-loaded on startup
+model_store = ModelStore(
+    os.getenv("MODEL_STORE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")),
+    keep=int(os.getenv("MODEL_STORE_KEEP", 10))
+)
+
+# Max feature rows a training run keeps; longer windows are reservoir-sampled
+TRAINING_ROW_BUDGET = int(os.getenv("TRAINING_ROW_BUDGET", 50000))
+
+# Per-machine-type models: /train also fits a forest for every machines.type
+# with at least MODEL_GROUP_MIN_ROWS readings (in parallel across
+# TRAINING_PROCESSES processes); /detect routes each reading to its type's model
+MODEL_GROUPING = os.getenv("MODEL_GROUPING", "true").lower() == "true"
+MODEL_GROUP_MIN_ROWS = int(os.getenv("MODEL_GROUP_MIN_ROWS", 2000))
+TRAINING_PROCESSES = int(os.getenv("TRAINING_PROCESSES", min(4, os.cpu_count() or 1)))
+machine_types: Dict[str, str] = {}  # device_id -> machines.type, refreshed on startup and /train
+
+# Sequence features: each machine's last SEQUENCE_WINDOW readings, kept on
+# ingest, add rates of change, spread and vibration spectra to the model's
+# instantaneous features. Models trained with them expect them at /detect
+SEQUENCE_FEATURES = os.getenv("SEQUENCE_FEATURES", "true").lower() == "true"
+SEQUENCE_WINDOW = int(os.getenv("SEQUENCE_WINDOW", 16))  # readings
+machine_windows = MachineWindows(window=SEQUENCE_WINDOW, arrays=state_arrays.scope("windows"))
+MODEL_FEATURES = 3 + (len(SEQUENCE_FEATURE_NAMES) if SEQUENCE_FEATURES else 0)
+
+# Online learning: periodic refit from recent /ingest + /detect feature rows.
+# Off by default: it only starts once a trained model exists, and keeps only
+# readings that neither the rules nor that model flag, so refits learn normal
+# operation rather than the faults they should detect
+ONLINE_LEARNING = os.getenv("ONLINE_LEARNING", "false").lower() == "true"
+ONLINE_RESERVOIR_SIZE = int(os.getenv("ONLINE_RESERVOIR_SIZE", 20000))
+ONLINE_UPDATE_INTERVAL = int(os.getenv("ONLINE_UPDATE_INTERVAL", 900))  # seconds
+ONLINE_MIN_NEW_ROWS = int(os.getenv("ONLINE_MIN_NEW_ROWS", 1000))
+online_reservoir = RollingReservoir(
+    ONLINE_RESERVOIR_SIZE, n_features=MODEL_FEATURES, arrays=state_arrays.scope("reservoir")
+)
+
+# Per-machine running trend statistics, seeded from the DB and updated on /ingest.
+# Trends regress on real time, resampled onto a TREND_BIN_SECONDS grid
+TREND_BIN_SECONDS = int(os.getenv("TREND_BIN_SECONDS", 60))
+TREND_DECAY = float(os.getenv("TREND_DECAY", 0.998))  # per grid step (~6h half-life at 60s)
+TREND_SYNC_DAYS = int(os.getenv("TREND_SYNC_DAYS", 7))
+TREND_SYNC_INTERVAL = int(os.getenv("TREND_SYNC_INTERVAL", 21600))  # seconds
+TREND_SYNC_TIMEOUT = float(os.getenv("TREND_SYNC_TIMEOUT", 600))  # seconds per replay on the DB executor
+trend_stats = StreamingTrendStats(
+    decay=TREND_DECAY, bin_seconds=TREND_BIN_SECONDS, arrays=state_arrays.scope("trends")
+)
+
+# Per-machine drift detection: EWMA baselines + CUSUM updated on ingest, so
+# /detect can judge a reading against its machine's own history in memory
+DRIFT_DETECTION = os.getenv("DRIFT_DETECTION", "true").lower() == "true"
+DRIFT_ALPHA = float(os.getenv("DRIFT_ALPHA", 0.001))  # ~1000 moving readings of memory
+DRIFT_CUSUM_H = float(os.getenv("DRIFT_CUSUM_H", 10))  # standard deviations
+DRIFT_WARMUP = int(os.getenv("DRIFT_WARMUP", 50))  # readings per machine
+machine_baselines = MachineBaselines(
+    alpha=DRIFT_ALPHA, cusum_h=DRIFT_CUSUM_H, warmup=DRIFT_WARMUP, arrays=state_arrays.scope("baselines")
+)
+
+# Dashboard analytics (/stats, /efficiency, /fleet/overview) are cached per
+# endpoint + params for CACHE_TTL. Without a database they are computed from
+# the ring buffer, and /ingest drops entries older than CACHE_INGEST_MIN_AGE
+CACHE_TTL = float(os.getenv("CACHE_TTL", 10))  # seconds, 0 disables
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 256))
+CACHE_INGEST_MIN_AGE = float(os.getenv("CACHE_INGEST_MIN_AGE", 2))  # seconds
+response_cache = ResponseCache(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
+
+# Per-device 1-min / 1-hour rollups (database/phase7-sensor-rollups.sql): fed
+# from exactly one ingest path, ROLLUP_FEED ("ingest" for /ingest and
+# /ingest/binary, "mqtt" for the MQTT consumer; see rollups.py), read by
+# analytics for windows longer than ROLLUP_MIN_HOURS
+ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "false").lower() == "true"
+ROLLUP_FEED = os.getenv(
+    "ROLLUP_FEED", "mqtt" if os.getenv("MQTT_ENABLED", "false").lower() == "true" else "ingest"
+)
+if ROLLUP_FEED not in ("ingest", "mqtt"):
+    raise ValueError(f"ROLLUP_FEED must be 'ingest' or 'mqtt', got {ROLLUP_FEED!r}")
+ROLLUP_MIN_HOURS = float(os.getenv("ROLLUP_MIN_HOURS", 1))
+ROLLUP_FLUSH_INTERVAL = int(os.getenv("ROLLUP_FLUSH_INTERVAL", 10))  # seconds
+ROLLUP_BACKFILL_STEP_HOURS = int(os.getenv("ROLLUP_BACKFILL_STEP_HOURS", 6))
+rollup_accumulator = RollupAccumulator()
+
+# Server-side aggregation (database/phase8-analytics-functions.sql): analytics
+# receive per-device aggregates from Postgres instead of raw sensor rows
+SERVER_AGGREGATION = os.getenv("SERVER_AGGREGATION", "false").lower() == "true"
+
+# Without either, /stats and /efficiency page through raw sensor_logs: they
+# read at most ANALYTICS_ROW_BUDGET rows, newest first, and report a window
+# cut short as truncated (a fleet's 24 h can be millions of rows)
+ANALYTICS_ROW_BUDGET = int(os.getenv("ANALYTICS_ROW_BUDGET", 100000))
+
+# The Supabase client is synchronous: endpoints run their database work on a
+# bounded thread pool so slow analytics never block the event loop (/detect)
+DB_MAX_WORKERS = int(os.getenv("DB_MAX_WORKERS", 8))
+DB_TIMEOUT = float(os.getenv("DB_TIMEOUT", 30))  # seconds per endpoint's database work
+DB_HTTP_TIMEOUT = float(os.getenv("DB_HTTP_TIMEOUT", 20))  # seconds per PostgREST request
+db_executor = DatabaseExecutor(max_workers=DB_MAX_WORKERS, timeout=DB_TIMEOUT)
+
+# Optional direct MQTT feed (paho-mqtt, see requirements-mqtt.txt): readings
+# from MQTT_TOPIC are micro-batched into ingest + detection, alerts published
+# to MQTT_ALERTS_TOPIC
+MQTT_ENABLED = os.getenv("MQTT_ENABLED", "false").lower() == "true"
+MQTT_BROKER_HOST = os.getenv("MQTT_BROKER_HOST", "localhost")
+MQTT_BROKER_PORT = int(os.getenv("MQTT_BROKER_PORT", 1883))
+MQTT_TOPIC = os.getenv("MQTT_TOPIC", "agritrack/live/sensors")
+MQTT_ALERTS_TOPIC = os.getenv("MQTT_ALERTS_TOPIC", "agritrack/live/alerts")
+MQTT_BATCH_SIZE = int(os.getenv("MQTT_BATCH_SIZE", 500))
+MQTT_BATCH_DELAY = float(os.getenv("MQTT_BATCH_DELAY", 0.1))  # seconds
+mqtt_consumer: Optional[MqttConsumer] = None
 
 # In-memory buffer for real-time data (supplement to DB)
-realtime_buffer: List[dict] = []
 MAX_BUFFER_SIZE = 5000
+realtime_buffer = SensorRingBuffer(MAX_BUFFER_SIZE, arrays=state_arrays.scope("buffer"))
+
+# Alert suppression: anomalous readings become one alert per (machine, anomaly
+# type) that is opened, escalated and resolved; repeats in between are not
+# re-sent. Used by /detect/alerts and (unless ALERT_DEDUP=false) MQTT alerts
+ALERT_DEDUP = os.getenv("ALERT_DEDUP", "true").lower() == "true"
+ALERT_RESOLVE_AFTER = float(os.getenv("ALERT_RESOLVE_AFTER", 60))  # seconds without the anomaly
+ALERT_COOLDOWN = float(os.getenv("ALERT_COOLDOWN", 300))  # seconds before a reopened alert is re-sent
+alert_suppressor = AlertSuppressor(
+    realtime_buffer.machine_id, resolve_after=ALERT_RESOLVE_AFTER, cooldown=ALERT_COOLDOWN,
+    arrays=state_arrays.scope("alerts")
+)
+
+# Prometheus-style metrics at /metrics. Detection batches, decisions and model
+# scoring time are always recorded; METRICS_ENABLED=false turns off per-request
+# latency and per-table Supabase query timing
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "agritrack_http_request_seconds", "HTTP request duration by route template",
+    labels=("method", "endpoint", "status"),
+)
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware, histogram=HTTP_REQUEST_SECONDS)
+
+# Occupancy and component totals, read at scrape time
+REGISTRY.gauge("agritrack_buffer_readings", "Readings in the real-time buffer", lambda: len(realtime_buffer))
+REGISTRY.gauge("agritrack_buffer_capacity", "Real-time buffer capacity", lambda: realtime_buffer.capacity)
+REGISTRY.gauge("agritrack_buffer_machines", "Machines interned by the real-time buffer",
+               lambda: len(realtime_buffer.machine_ids))
+REGISTRY.gauge("agritrack_online_reservoir_rows", "Feature rows held for online retraining",
+               lambda: len(online_reservoir))
+REGISTRY.gauge("agritrack_baseline_machines", "Machines with a drift baseline",
+               lambda: machine_baselines.machine_count())
+REGISTRY.gauge("agritrack_sequence_machines", "Machines with a sequence-feature history",
+               lambda: machine_windows.machine_count())
+REGISTRY.gauge("agritrack_rollups_pending", "Rollup partials waiting to be flushed", lambda: len(rollup_accumulator))
+REGISTRY.gauge("agritrack_cache_entries", "Cached analytics responses", lambda: response_cache.stats()["entries"])
+REGISTRY.counter_function(
+    "agritrack_cache_events_total", "Analytics cache events", labels=("event",),
+    function=lambda: {event: response_cache.stats()[event]
+                      for event in ("hits", "misses", "coalesced", "evictions", "invalidations")},
+)
+REGISTRY.gauge("agritrack_db_in_flight", "Database calls running on the executor",
+               lambda: db_executor.stats()["in_flight"])
+REGISTRY.counter_function(
+    "agritrack_db_executor_events_total", "Database executor calls, timeouts and errors", labels=("event",),
+    function=lambda: {event: db_executor.stats()[event] for event in ("calls", "timeouts", "errors")},
+)
+REGISTRY.gauge("agritrack_alerts_open", "Open suppressed alerts", lambda: alert_suppressor.stats()["open"])
+REGISTRY.gauge("agritrack_mqtt_pending", "MQTT readings waiting for the next micro-batch",
+               lambda: mqtt_consumer.stats()["pending"] if mqtt_consumer else None)
+REGISTRY.gauge("agritrack_model_age_seconds", "Seconds since the active model was trained",
+               lambda: (datetime.now() - active_model.trained_at).total_seconds() if active_model else None)
+REGISTRY.gauge("agritrack_model_groups", "Machine-type models in the active model",
+               lambda: len(active_model.group_models) if active_model else None)
+
+# Admin-only sampling profiler (agritrack_common.profiler): POST /admin/profile
+# samples live traffic, an "X-Profile: 1" header profiles one request; both
+# return collapsed stacks and need X-Admin-Token == PROFILER_TOKEN. Unset = off
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN", "")
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", 60))
+install_profiler(app, PROFILER_TOKEN, max_seconds=PROFILER_MAX_SECONDS)
 
 
 def get_supabase() -> Optional[Client]:
@@ -53,7 +267,10 @@ def get_supabase() -> Optional[Client]:
         url = os.getenv("SUPABASE_URL")
         key = os.getenv("SUPABASE_SERVICE_KEY")
         if url and key:
-            supabase = create_client(url, key)
+            supabase = create_client(url, key, options=ClientOptions(postgrest_client_timeout=DB_HTTP_TIMEOUT))
+            supabase.postgrest  # One pooled HTTP session, created before worker threads share it
+            if METRICS_ENABLED:
+                supabase = InstrumentedClient(supabase)
             print("✅ Connected to Supabase")
         else:
             print("⚠️ Supabase credentials not configured")
@@ -73,6 +290,14 @@ class SensorData(BaseModel):
     speed: float
     timestamp: Optional[int] = None
 
+    @field_validator('id')
+    @classmethod
+    def id_fits_machine_table(cls, value: str) -> str:
+        # Interned IDs are stored in fixed-width slots (see ring_buffer.py)
+        if len(value.encode()) > MACHINE_ID_BYTES:
+            raise ValueError(f"Machine IDs are limited to {MACHINE_ID_BYTES} bytes of UTF-8")
+        return value
+
 
 class SensorBatch(BaseModel):
     data: List[SensorData]
@@ -109,7 +334,7 @@ class MaintenanceAlert(BaseModel):
 # HEALTH & UTILITY ENDPOINTS
 # ═══════════════════════════════════════════════════════════════════
 
-from fastapi.responses import RedirectResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse
 
 @app.get("/", include_in_schema=False)
 async def root():
@@ -123,12 +348,44 @@ async def health():
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "database_connected": db_connected,
-        "model_trained": anomaly_model is not None,
-        "model_trained_at": model_trained_at.isoformat() if model_trained_at else None,
-        "buffer_size": len(realtime_buffer)
+        "model_trained": active_model is not None,
+        "model_trained_at": active_model.trained_at.isoformat() if active_model else None,
+        "model_source": active_model.source if active_model else None,
+        "model_version": active_model.version if active_model else None,
+        "model_groups": sorted(active_model.group_models) if active_model else [],
+        "model_features": active_model.scaler.n_features_in_ if active_model else None,
+        "buffer_size": len(realtime_buffer),
+        "online_reservoir_size": len(online_reservoir),
+        "cache": response_cache.stats(),
+        "rollups_enabled": ROLLUPS_ENABLED,
+        "rollup_feed": ROLLUP_FEED,
+        "rollups_pending": len(rollup_accumulator),
+        "server_aggregation": SERVER_AGGREGATION,
+        "drift_detection": DRIFT_DETECTION,
+        "baseline_machines": machine_baselines.machine_count(),
+        "sequence_features": SEQUENCE_FEATURES,
+        "sequence_machines": machine_windows.machine_count(),
+        "db_executor": db_executor.stats(),
+        "mqtt": mqtt_consumer.stats() if mqtt_consumer else None,
+        "alert_suppression": alert_suppressor.stats(),
+        "workers": WORKERS,
+        "worker_pid": os.getpid(),
+        "leader": leader_lock is None or leader_lock.held
     }
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Metrics in the Prometheus text exposition format (see metrics.py)"""
+    return PlainTextResponse(REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+@app.exception_handler(CapacityError)
+async def shared_state_full(request: Request, exc: CapacityError):
+    """A machine beyond SHARED_MAX_MACHINES (multi-worker mode) cannot be tracked"""
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+
 # ═══════════════════════════════════════════════════════════════════
 # DATA INGESTION (Real-time supplement)
 # ═══════════════════════════════════════════════════════════════════
@@ -136,75 +393,497 @@ async def health():
 @app.post("/ingest")
 async def ingest_data(batch: SensorBatch):
     """Ingest real-time sensor data for immediate analysis"""
-    global realtime_buffer
-    
-    for data in batch.data:
-        realtime_buffer.append(data.dict())
-        
-    # Trim buffer if too large
-    if len(realtime_buffer) > MAX_BUFFER_SIZE:
-        realtime_buffer = realtime_buffer[-MAX_BUFFER_SIZE:]
+    if batch.data:
+        columns = readings_to_columns(batch.data)
+        device_ids = [data.id for data in batch.data]
+        columns['machine'] = realtime_buffer.intern_many(device_ids)
+        _ingest_columns(columns, device_ids)
         
     return {"ingested": len(batch.data), "buffer_size": len(realtime_buffer)}
 
 
+@app.post("/ingest/binary")
+async def ingest_binary(request: Request):
+    """Ingest a binary reading batch (see binary_batch.py), same effect as /ingest"""
+    dictionary, columns, machines = _decode_binary(request, await request.body())
+    if len(machines):
+        # Intern each machine ID once per batch, then map every reading through the table
+        columns['machine'] = realtime_buffer.intern_many(dictionary)[machines]
+        _ingest_columns(columns, np.asarray(dictionary, dtype=object)[machines])
+    
+    return {"ingested": len(machines), "buffer_size": len(realtime_buffer)}
+
+
+def _ingest_columns(columns: Dict[str, np.ndarray], device_ids, observe: bool = True,
+                    source: str = "ingest") -> Dict[str, Any]:
+    """
+    Feed a decoded batch ('machine' holds interned indices) to the buffer,
+    trends, drift baselines, sequence windows, rollups (only if `source` is
+    the ROLLUP_FEED) and (unless the caller runs detection and observes the
+    batch itself) the online-learning reservoir. Returns the batch's
+    per-machine scores as detector arguments (see _history_scores).
+    """
+    realtime_buffer.extend_columns(columns)
+    seconds = _reading_seconds(columns['timestamp'])
+    vib = vibration_magnitude(columns['vib_x'], columns['vib_y'], columns['vib_z'])
+    metrics = {'temperature': columns['temp'], 'vib_magnitude': vib}
+    trend_stats.update(columns['machine'], seconds, metrics)
+    scores = {
+        "drift": machine_baselines.update(columns['machine'], metrics, columns['speed']) if DRIFT_DETECTION else None,
+        "sequence": machine_windows.update(columns['machine'], columns, seconds) if SEQUENCE_FEATURES else None,
+    }
+    if observe:
+        _observe_features(columns, scores)
+    if ROLLUPS_ENABLED and source == ROLLUP_FEED:
+        # A device may reach both paths (MQTT and the backend's /ingest): one feed counts it once
+        rollup_accumulator.add(device_ids, seconds, columns['temp'], columns['speed'], vib)
+    # Analytics read the database when one is connected (/ingest does not
+    # write it), so CACHE_TTL bounds their staleness. Only the in-memory
+    # fallbacks see new readings; the age floor keeps a high ingest rate from
+    # recomputing them on every dashboard poll
+    if supabase is None:
+        response_cache.invalidate(older_than=CACHE_INGEST_MIN_AGE)
+    return scores
+
+
+def _history_scores(columns: Dict[str, np.ndarray], machines: np.ndarray) -> Dict[str, Any]:
+    """
+    Score readings against their machines' history without updating it.
+
+    Returns:
+        Detector arguments: drift (baseline scores) and sequence (window
+        features), each None if that feature is off
+    """
+    drift = sequence = None
+    if DRIFT_DETECTION:
+        vib = vibration_magnitude(columns['vib_x'], columns['vib_y'], columns['vib_z'])
+        drift = machine_baselines.score_batch(
+            machines, {'temperature': columns['temp'], 'vib_magnitude': vib}, columns['speed']
+        )
+    if SEQUENCE_FEATURES:
+        sequence = machine_windows.score_batch(machines, columns, _reading_seconds(columns['timestamp']))
+    return {"drift": drift, "sequence": sequence}
+
+
+def _handle_mqtt_batch(device_ids: List[str], columns: Dict[str, np.ndarray]) -> List[dict]:
+    """
+    Ingest + detect one MQTT micro-batch; returns alert transitions (or, with
+    ALERT_DEDUP off, one alert per anomalous reading)
+    """
+    columns['machine'] = realtime_buffer.intern_many(device_ids)
+    scores = _ingest_columns(columns, device_ids, observe=False, source="mqtt")
+    indices, rows = find_anomalies(columns, **scores, **_model_args(active_model, columns['machine']))
+    _observe_features(columns, scores, anomalous=indices)
+    if ALERT_DEDUP:
+        return alert_suppressor.observe(columns['machine'], _reading_seconds(columns['timestamp']), indices, rows)
+    
+    timestamps = columns['timestamp'][indices].tolist()
+    return [
+        {"machine_id": device_ids[i], "timestamp": None if ts == MISSING_TIMESTAMP else ts, **row}
+        for i, ts, row in zip(indices.tolist(), timestamps, rows)
+    ]
+
+
+def _model_args(bundle: Optional[ModelBundle], machines: np.ndarray) -> dict:
+    """
+    Detector model arguments for a batch: the fleet model plus, if the bundle
+    has per-type models, each reading's route to its machine type's model
+    """
+    if bundle is None:
+        return {"model": None, "scaler": None}
+    if not bundle.group_models:
+        return {"model": bundle.scoring_model, "scaler": bundle.scaler}
+    
+    # Resolve each distinct machine once, then map every reading through the table
+    groups = list(bundle.group_models)
+    position = {group: i for i, group in enumerate(groups)}
+    codes, inverse = np.unique(machines, return_inverse=True)
+    table = np.fromiter(
+        (position.get(machine_types.get(realtime_buffer.machine_id(code)), -1) for code in codes.tolist()),
+        dtype=np.int64, count=len(codes)
+    )
+    return {
+        "model": bundle.scoring_model,
+        "scaler": bundle.scaler,
+        "models": [bundle.scoring_group_models[group] for group in groups],
+        "model_index": table[inverse]
+    }
+
+
+def _fetch_machine_types(db) -> Dict[str, str]:
+    """device_id -> type for every registered machine"""
+    types = {}
+    for chunk in iter_pages(lambda: db.table('machines').select('device_id, type'), 'device_id'):
+        types.update(zip(chunk['device_id'], chunk['type']))
+    return types
+
+
+def _refresh_machine_types(db) -> Dict[str, str]:
+    """Reload the machine type map (kept as-is if the query fails)"""
+    global machine_types
+    try:
+        machine_types = _fetch_machine_types(db)
+    except Exception as e:
+        print(f"⚠️ Could not load machine types, keeping {len(machine_types)} known: {e}")
+    return machine_types
+
+
+def _decode_binary(request: Request, body: bytes):
+    """decode_batch() for a request body, as HTTP errors"""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type != BINARY_CONTENT_TYPE:
+        raise HTTPException(status_code=415, detail=f"Expected Content-Type: {BINARY_CONTENT_TYPE}")
+    try:
+        return decode_batch(body)
+    except BatchFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _reading_seconds(timestamps: np.ndarray) -> np.ndarray:
+    """Epoch seconds for ingested millisecond timestamps (arrival time when missing)"""
+    return np.where(timestamps == MISSING_TIMESTAMP, time.time() * 1000, timestamps) / 1000
+
+
+def _observe_features(columns: Dict[str, np.ndarray], scores: Dict[str, Any],
+                      anomalous: Optional[np.ndarray] = None):
+    """
+    Feed the batch's normal readings (and their window features) into the
+    online-learning reservoir. Nothing is kept until a trained model exists.
+
+    Args:
+        columns: Decoded batch; needs 'machine' when `anomalous` is omitted
+        scores: The batch's drift and sequence scores (see _history_scores)
+        anomalous: Positions of the readings detection flagged; when omitted
+            the batch is classified here (rules, drift and the active model)
+    """
+    bundle = active_model
+    if not ONLINE_LEARNING or bundle is None:
+        return
+    if anomalous is None:
+        codes = classify_batch(columns, **scores, **_model_args(bundle, columns['machine']), record=False)[0]
+        normal = codes == NORMAL
+    else:
+        normal = np.ones(len(columns['temp']), dtype=bool)
+        normal[anomalous] = False
+    if not normal.any():
+        return
+    
+    vib = vibration_magnitude(columns['vib_x'][normal], columns['vib_y'][normal], columns['vib_z'][normal])
+    features = np.column_stack([columns['temp'][normal], vib, columns['speed'][normal]])
+    if scores["sequence"] is not None:
+        features = np.hstack([features, scores["sequence"][normal]])
+    online_reservoir.add(features)
+
+
+def _chunk_sequence_features(windows: MachineWindows, codes: Dict[str, int], chunk: pd.DataFrame) -> np.ndarray:
+    """Window features for a page of sensor_logs rows (pages in time order, codes grows per new device)"""
+    machines = np.fromiter(
+        (codes.setdefault(device_id, len(codes)) for device_id in chunk['device_id']),
+        dtype=np.int64, count=len(chunk)
+    )
+    values = chunk[['temperature', 'vibration_x', 'vibration_y', 'vibration_z']].fillna(0).values
+    columns = dict(zip(('temp', 'vib_x', 'vib_y', 'vib_z'), values.T))
+    return windows.update(machines, columns, epoch_seconds(chunk['timestamp']))
+
+
 # ═══════════════════════════════════════════════════════════════════
 # MODEL TRAINING (from Database)
 # ═══════════════════════════════════════════════════════════════════
 
 @app.post("/train")
-async def train_model(hours: int = Query(default=24, description="Hours of historical data to use")):
-    """Train anomaly detection model on persisted sensor data from Supabase"""
-    global anomaly_model, scaler, model_trained_at
+async def train_model(
+    hours: int = Query(default=24, description="Hours of historical data to use"),
+    wait: bool = Query(default=False, description="Wait for training to finish before responding")
+):
+    """Train anomaly detection model on persisted sensor data from Supabase (background job)"""
+    
+    if not get_supabase():
+        raise HTTPException(status_code=503, detail="Database not connected")
+    
+    job = training_jobs.submit(_train_from_db, hours=hours)
+    
+    if wait:
+        # Awaiting the job future keeps the event loop free for /detect and /ingest
+        job = await training_jobs.wait(job["job_id"])
+        if job["status"] == "failed":
+            raise HTTPException(status_code=job["status_code"], detail=job["error"])
+    
+    return job
+
+
+@app.get("/train/jobs")
+async def list_training_jobs():
+    """List recent training jobs"""
+    return {"jobs": training_jobs.list()}
+
+
+@app.get("/train/jobs/{job_id}")
+async def get_training_job(job_id: str):
+    """Get status of a training job"""
+    job = training_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Training job {job_id} not found")
+    return job
+
+
+@app.post("/train/online")
+async def train_online(
+    wait: bool = Query(default=False, description="Wait for training to finish before responding")
+):
+    """Refit the model now from the online reservoir of recent readings (no DB query)"""
+
+    if active_model is None:
+        raise HTTPException(status_code=400, detail="No trained model to refit. Train one with /train first")
+    if len(online_reservoir) < 100:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Insufficient live data for training. Reservoir holds {len(online_reservoir)} rows (need 100+)"
+        )
     
+    job = training_jobs.submit(_train_from_reservoir)
+    
+    if wait:
+        job = await training_jobs.wait(job["job_id"])
+        if job["status"] == "failed":
+            raise HTTPException(status_code=job["status_code"], detail=job["error"])
+    
+    return job
+
+
+def _train_from_db(hours: int) -> dict:
+    """Fetch history, fit a new model and publish it (runs in a training worker thread)"""
     db = get_supabase()
     if not db:
         raise HTTPException(status_code=503, detail="Database not connected")
     
-    # Fetch historical sensor logs
+    # Stream the whole window page by page; keep a uniform sample (fleet-wide
+    # and per machine type) if it exceeds the budget. Window features are
+    # computed before sampling, over each machine's full history
     since = (datetime.now() - timedelta(hours=hours)).isoformat()
-    
-    response = db.table('sensor_logs').select('*').gte('timestamp', since).limit(10000).execute()
-    
-    if not response.data or len(response.data) < 100:
+    sampler = ReservoirSampler(TRAINING_ROW_BUDGET, n_features=MODEL_FEATURES)
+    group_samplers: Dict[str, ReservoirSampler] = {}
+    types = _refresh_machine_types(db) if MODEL_GROUPING else {}
+    windows = MachineWindows(window=SEQUENCE_WINDOW) if SEQUENCE_FEATURES else None
+    machine_codes: Dict[str, int] = {}
+    
+    for chunk in iter_sensor_logs(db, since):
+        chunk['vib_magnitude'] = vib_magnitude(chunk)
+        features = chunk[['temperature', 'vib_magnitude', 'speed']].fillna(0).values
+        if windows is not None:
+            features = np.hstack([features, _chunk_sequence_features(windows, machine_codes, chunk)])
+        sampler.add(features)
+        if types:
+            for group, rows in chunk.groupby(chunk['device_id'].map(types)).indices.items():
+                group_samplers.setdefault(
+                    group, ReservoirSampler(TRAINING_ROW_BUDGET, n_features=MODEL_FEATURES)
+                ).add(features[rows])
+    
+    if sampler.seen < 100:
         raise HTTPException(
             status_code=400, 
-            detail=f"Insufficient data for training. Found {len(response.data) if response.data else 0} records (need 100+)"
+            detail=f"Insufficient data for training. Found {sampler.seen} records (need 100+)"
         )
     
-    # Convert to DataFrame for easier manipulation
-    df = pd.DataFrame(response.data)
+    features = sampler.rows
+    groups = sorted(group for group, s in group_samplers.items() if s.seen >= MODEL_GROUP_MIN_ROWS)
     
-    # Calculate features
-    df['vib_magnitude'] = np.sqrt(
-        df['vibration_x'].fillna(0)**2 + 
-        df['vibration_y'].fillna(0)**2 + 
-        df['vibration_z'].fillna(0)**2
-    )
+    # Fleet model and per-type models are independent fits: one process each
+    fitted = fit_anomaly_models([features] + [group_samplers[g].rows for g in groups], processes=TRAINING_PROCESSES)
+    (model, fitted_scaler), group_models = fitted[0], dict(zip(groups, fitted[1:]))
+    bundle = _publish_model(model, fitted_scaler, samples=len(features), source="database", group_models=group_models)
     
-    features = df[['temperature', 'vib_magnitude', 'speed']].fillna(0).values
+    print(f"✅ Model trained on {len(features)} samples ({sampler.seen} rows) from last {hours} hours"
+          + (f", plus {len(groups)} machine-type models" if groups else ""))
     
-    # Scale features
-    scaler = StandardScaler()
-    features_scaled = scaler.fit_transform(features)
+    return {
+        "status": "trained",
+        "samples": len(features),
+        "rows_in_window": sampler.seen,
+        "sampled": sampler.seen > len(features),
+        "time_range_hours": hours,
+        "sequence_features": SEQUENCE_FEATURES,
+        "group_samples": {g: len(group_samplers[g].rows) for g in groups},
+        "groups_skipped": {g: s.seen for g, s in sorted(group_samplers.items()) if g not in group_models},
+        "trained_at": bundle.trained_at.isoformat(),
+        "version": bundle.version
+    }
+
+
+def _train_from_reservoir() -> dict:
+    """Refit on the online reservoir and publish the result (runs in a training worker thread)"""
+    features = online_reservoir.snapshot()
+    if len(features) < 100:
+        raise HTTPException(status_code=400, detail=f"Insufficient live data ({len(features)} rows)")
     
-    # Train Isolation Forest
-    anomaly_model = IsolationForest(
-        contamination=0.05,  # Expect 5% anomalies
-        random_state=42,
-        n_estimators=150,
-        max_samples='auto'
+    # The reservoir has no machine identity: refit the fleet model and keep
+    # the current per-type models
+    model, fitted_scaler = fit_anomaly_model(features)
+    bundle = _publish_model(
+        model, fitted_scaler, samples=len(features), source="online",
+        group_models=active_model.group_models if active_model else None
     )
-    anomaly_model.fit(features_scaled)
-    model_trained_at = datetime.now()
     
-    print(f"✅ Model trained on {len(features)} samples from last {hours} hours")
+    print(f"🔄 Model refit online on {len(features)} recent samples")
     
     return {
         "status": "trained",
+        "source": "online",
         "samples": len(features),
-        "time_range_hours": hours,
-        "trained_at": model_trained_at.isoformat()
+        "trained_at": bundle.trained_at.isoformat(),
+        "version": bundle.version
+    }
+
+
+def _publish_model(model, fitted_scaler, samples: int, source: str,
+                   group_models: Optional[Dict[str, tuple]] = None) -> ModelBundle:
+    """Save a freshly fitted model (and per-type models) as a new version and swap it in"""
+    global active_model
+    
+    group_models = dict(group_models or {})
+    trained_at = datetime.now()
+    # Flattened before saving, so the stored version carries them (see model_store.py)
+    flat_model = FlatForest(model)
+    flat_groups = {group: FlatForest(group_model) for group, (group_model, _) in group_models.items()}
+    try:
+        version = model_store.save(
+            model, fitted_scaler, trained_at=trained_at, samples=samples, source=source, groups=group_models,
+            scoring={"model": flat_model, "groups": flat_groups},
+            # Full trainings survive any number of online refits (see model_store.py)
+            pinned=source == "database"
+        )
+    except OSError as e:
+        if leader_lock is not None:
+            # Workers share models through the store only: this one would
+            # serve the model alone, until its next sync reverted it
+            raise HTTPException(status_code=503, detail=f"Could not persist model: {e}")
+        # A read-only or full disk must not stop the new model from serving
+        print(f"⚠️ Could not persist model: {e}")
+        version = None
+    
+    bundle = ModelBundle(
+        model=model,
+        scaler=fitted_scaler,
+        trained_at=trained_at,
+        samples=samples,
+        source=source,
+        version=version,
+        group_models=group_models,
+        flat_model=flat_model,
+        flat_group_models=flat_groups
+    )
+    # Atomic swap: detection picks up the new pair on its next request
+    active_model = _warmed(bundle)
+    return active_model
+
+
+def _load_model_version(version: Optional[str] = None) -> ModelBundle:
+    """
+    Load a stored version (default: current) and swap it in.
+
+    Raises:
+        HTTPException: 409 if the version was trained with sequence features
+            and SEQUENCE_FEATURES is off (or the reverse); the active model
+            is kept
+    """
+    global active_model
+    
+    model, fitted_scaler, metadata, group_models, scoring = model_store.load(version)
+    # /detect only computes window features with SEQUENCE_FEATURES on
+    widths = {fitted_scaler.n_features_in_, *(scaler.n_features_in_ for _, scaler in group_models.values())}
+    if widths != {MODEL_FEATURES}:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Model version {metadata['version']} expects {max(widths)} features, but this engine "
+                   f"computes {MODEL_FEATURES} (SEQUENCE_FEATURES={'true' if SEQUENCE_FEATURES else 'false'})"
+        )
+    bundle = ModelBundle(
+        model=model,
+        scaler=fitted_scaler,
+        trained_at=datetime.fromisoformat(metadata["trained_at"]),
+        samples=metadata["samples"],
+        source=metadata["source"],
+        version=metadata["version"],
+        group_models=group_models,
+        flat_model=scoring.get("model"),
+        flat_group_models=scoring.get("groups")
+    )
+    active_model = _warmed(bundle)
+    return active_model
+
+
+def _warmed(bundle: ModelBundle) -> ModelBundle:
+    """Build the bundle's flattened scoring forests before it serves requests"""
+    bundle.scoring_model
+    bundle.scoring_group_models
+    return bundle
+
+
+async def _online_update_loop():
+    """Periodically refit from the reservoir once enough new readings have arrived"""
+    while True:
+        await asyncio.sleep(ONLINE_UPDATE_INTERVAL)
+        # A refit only refreshes a trained model: without one the reservoir is unscreened
+        if (active_model is not None
+                and online_reservoir.new_rows >= ONLINE_MIN_NEW_ROWS
+                and len(online_reservoir) >= 100
+                and not training_jobs.busy):
+            training_jobs.submit(_train_from_reservoir)
+
+
+async def _worker_sync_loop():
+    """
+    Multi-worker mode: follow the model version other workers publish or
+    activate, and take over the leader's duties if the leader exits
+    """
+    failed = None  # Version that could not be loaded, not retried until CURRENT moves
+    while True:
+        await asyncio.sleep(MODEL_SYNC_INTERVAL)
+        current = model_store.current_version()
+        if current and current != failed and (active_model is None or active_model.version != current):
+            try:
+                bundle = await asyncio.to_thread(_load_model_version, current)
+                print(f"🔁 Worker {os.getpid()} switched to model version {bundle.version}")
+                db = get_supabase()
+                if db and MODEL_GROUPING and bundle.group_models:
+                    await db_executor.run(_refresh_machine_types, db)
+            except Exception as e:
+                failed = current
+                print(f"⚠️ Could not load model version {current}: {getattr(e, 'detail', e)}")
+        if not leader_lock.held and leader_lock.try_acquire():
+            await _start_leader_tasks()
+
+
+# ═══════════════════════════════════════════════════════════════════
+# MODEL VERSIONS
+# ═══════════════════════════════════════════════════════════════════
+
+@app.get("/models")
+async def list_model_versions():
+    """List stored model versions, newest first"""
+    return {
+        "versions": model_store.list_versions(),
+        "active_version": active_model.version if active_model else None
+    }
+
+
+@app.post("/models/{version}/activate")
+async def activate_model_version(version: str):
+    """Roll back (or forward) to a stored model version"""
+    if not model_store.has_version(version):
+        raise HTTPException(status_code=404, detail=f"Model version {version} not found")
+    
+    # Loading unpickles the forests: keep it off the event loop
+    bundle = await asyncio.to_thread(_load_model_version, version)
+    model_store.set_current(version)
+    print(f"⏪ Activated model version {version}")
+    
+    return {
+        "status": "activated",
+        "version": bundle.version,
+        "trained_at": bundle.trained_at.isoformat(),
+        "samples": bundle.samples,
+        "source": bundle.source,
+        "groups": sorted(bundle.group_models)
     }
 
 
@@ -216,78 +895,84 @@ async def train_model(hours: int = Query(default=24, description="Hours of histo
 async def detect_anomalies(batch: SensorBatch):
     """Detect anomalies in incoming sensor data using rules + ML"""
     
-    results = []
+    if not batch.data:
+        return []
     
-    for data in batch.data:
-        vib_magnitude = np.sqrt(data.vib_x**2 + data.vib_y**2 + data.vib_z**2)
-        
-        # Rule-based detection (always active)
-        is_anomaly = False
-        anomaly_type = None
-        details = ""
-        anomaly_score = 0.0
-        severity = "warning"
-        
-        # Critical: Overheat
-        if data.temp > 100:
-            is_anomaly = True
-            anomaly_type = "overheat_critical"
-            details = f"CRITICAL: Temperature {data.temp}°C exceeds 100°C"
-            anomaly_score = 1.0
-            severity = "critical"
-        elif data.temp > 90:
-            is_anomaly = True
-            anomaly_type = "overheat"
-            details = f"Temperature {data.temp}°C exceeds 90°C threshold"
-            anomaly_score = min(1.0, (data.temp - 90) / 30)
-            severity = "warning"
-            
-        # High vibration - potential mechanical failure
-        elif vib_magnitude > 0.7:
-            is_anomaly = True
-            anomaly_type = "vibration_critical"
-            details = f"CRITICAL: Vibration {vib_magnitude:.3f} indicates mechanical failure"
-            anomaly_score = 1.0
-            severity = "critical"
-        elif vib_magnitude > 0.5:
-            is_anomaly = True
-            anomaly_type = "vibration"
-            details = f"High vibration {vib_magnitude:.3f} - check machinery"
-            anomaly_score = min(1.0, vib_magnitude / 1.0)
-            severity = "warning"
-            
-        # Idle detection (REQ-AI-01)
-        elif data.speed < 1 and vib_magnitude > 0.02:
-            is_anomaly = True
-            anomaly_type = "idle"
-            details = f"Machine idle with engine running (speed={data.speed}, vib={vib_magnitude:.3f})"
-            anomaly_score = 0.3
-            severity = "info"
-            
-        # ML-based detection (if model trained)
-        if anomaly_model is not None and scaler is not None and not is_anomaly:
-            features = np.array([[data.temp, vib_magnitude, data.speed]])
-            features_scaled = scaler.transform(features)
-            prediction = anomaly_model.predict(features_scaled)[0]
-            score = -anomaly_model.score_samples(features_scaled)[0]
-            
-            if prediction == -1:  # Anomaly
-                is_anomaly = True
-                anomaly_type = "ml_detected"
-                anomaly_score = min(1.0, score / 0.5)  # Normalize score
-                details = f"ML model detected unusual pattern (score={score:.3f})"
-                severity = "warning" if score < 0.3 else "critical"
-                
-        results.append(AnomalyResult(
-            machine_id=data.id,
-            is_anomaly=is_anomaly,
-            anomaly_score=round(anomaly_score, 3),
-            anomaly_type=anomaly_type,
-            details=details,
-            severity=severity
-        ))
-        
-    return results
+    # Rules and ML are applied to the whole batch at once (see detector.py)
+    columns = readings_to_columns(batch.data)
+    machines = realtime_buffer.intern_many(data.id for data in batch.data)
+    scores = _history_scores(columns, machines)
+    rows = detect_batch(columns, **scores, **_model_args(active_model, machines))
+    _observe_features(columns, scores, anomalous=np.flatnonzero([row["is_anomaly"] for row in rows]))
+    
+    return [
+        AnomalyResult(machine_id=data.id, **row)
+        for data, row in zip(batch.data, rows)
+    ]
+
+
+@app.post("/detect/binary")
+async def detect_binary(request: Request):
+    """
+    Detect anomalies in a binary reading batch (see binary_batch.py).
+    Only anomalous readings are returned, with their position in the batch.
+    """
+    dictionary, columns, machines = _decode_binary(request, await request.body())
+    if not len(machines):
+        return {"readings": 0, "anomalies": []}
+    
+    codes = realtime_buffer.intern_many(dictionary)[machines]
+    scores = _history_scores(columns, codes)
+    indices, rows = find_anomalies(columns, **scores, **_model_args(active_model, codes))
+    _observe_features(columns, scores, anomalous=indices)
+    
+    return {
+        "readings": len(machines),
+        "anomalies": [
+            {"index": i, "machine_id": dictionary[machine], **row}
+            for i, machine, row in zip(indices.tolist(), machines[indices].tolist(), rows)
+        ]
+    }
+
+
+@app.post("/detect/alerts")
+async def detect_alerts(batch: SensorBatch):
+    """
+    Detect anomalies and return only alert transitions: an alert per machine
+    and anomaly type is opened, escalated (higher severity) or resolved (no
+    recurrence for ALERT_RESOLVE_AFTER seconds); repeats are suppressed
+    """
+    if not batch.data:
+        return {"readings": 0, "anomalies": 0, "transitions": []}
+    
+    columns = readings_to_columns(batch.data)
+    machines = realtime_buffer.intern_many(data.id for data in batch.data)
+    scores = _history_scores(columns, machines)
+    indices, rows = find_anomalies(columns, **scores, **_model_args(active_model, machines))
+    _observe_features(columns, scores, anomalous=indices)
+    
+    return {
+        "readings": len(batch.data),
+        "anomalies": len(rows),
+        "transitions": alert_suppressor.observe(machines, _reading_seconds(columns['timestamp']), indices, rows)
+    }
+
+
+@app.get("/alerts/open")
+async def get_open_alerts():
+    """Alerts currently open in the suppression stage (see /detect/alerts)"""
+    alerts = alert_suppressor.open_alerts()
+    return {"alerts": alerts, "total": len(alerts)}
+
+
+@app.get("/baselines/{machine_id}")
+async def get_machine_baseline(machine_id: str):
+    """Per-machine drift baseline (EWMA mean / std and CUSUM per metric) used by /detect"""
+    code = realtime_buffer.lookup(machine_id)
+    state = machine_baselines.machine_state(code) if code is not None else None
+    if state is None:
+        raise HTTPException(status_code=404, detail=f"No baseline for machine {machine_id} yet")
+    return {"machine_id": machine_id, "warmup": machine_baselines.warmup, "metrics": state}
 
 
 @app.get("/anomalies")
@@ -304,9 +989,11 @@ async def get_anomalies_from_db(
     
     since = (datetime.now() - timedelta(hours=hours)).isoformat()
     
-    response = db.table('alerts').select(
-        '*, machine:machines(device_id, name, type)'
-    ).gte('created_at', since).order('created_at', desc=True).limit(limit).execute()
+    response = await db_executor.run(
+        lambda: db.table('alerts').select(
+            '*, machine:machines(device_id, name, type)'
+        ).gte('created_at', since).order('created_at', desc=True).limit(limit).execute()
+    )
     
     return {
         "anomalies": response.data or [],
@@ -318,179 +1005,223 @@ async def get_anomalies_from_db(
 
 def _get_anomalies_from_buffer():
     """Fallback: Get anomalies from in-memory buffer"""
+    window = realtime_buffer.view(last=500)
+    vib_magnitude = realtime_buffer.vib_magnitude(window)
+    overheat = window['temp'] > 90
+    hits = np.flatnonzero(overheat | (vib_magnitude > 0.5))
+    
     anomalies = []
-    for data in realtime_buffer[-500:]:
-        vib_magnitude = np.sqrt(data.get('vib_x', 0)**2 + data.get('vib_y', 0)**2 + data.get('vib_z', 0)**2)
-        if data.get('temp', 0) > 90 or vib_magnitude > 0.5:
-            anomalies.append({
-                "machine_id": data.get('id'),
-                "temp": data.get('temp'),
-                "vibration": round(vib_magnitude, 4),
-                "timestamp": data.get('timestamp'),
-                "type": "overheat" if data.get('temp', 0) > 90 else "vibration"
-            })
-    return {"anomalies": anomalies[-50:], "total": len(anomalies), "source": "buffer"}
+    for i in hits[-50:]:
+        timestamp = int(window['timestamp'][i])
+        anomalies.append({
+            "machine_id": realtime_buffer.machine_id(window['machine'][i]),
+            "temp": float(window['temp'][i]),
+            "vibration": round(float(vib_magnitude[i]), 4),
+            "timestamp": None if timestamp == MISSING_TIMESTAMP else timestamp,
+            "type": "overheat" if overheat[i] else "vibration"
+        })
+    return {"anomalies": anomalies, "total": len(hits), "source": "buffer"}
 
 
 # ═══════════════════════════════════════════════════════════════════
 # PREDICTIVE MAINTENANCE
 # ═══════════════════════════════════════════════════════════════════
 
+# Where predictions read trends from; anything else is rejected with 422
+TrendSource = Literal["auto", "stream", "database"]
+
 @app.get("/predict/maintenance", response_model=List[MaintenanceAlert])
 async def predict_maintenance(
-    machine_id: Optional[str] = Query(default=None, description="Specific machine or all")
+    machine_id: Optional[str] = Query(default=None, description="Specific machine or all"),
+    source: TrendSource = Query(default="auto", description="auto | stream (in-memory trend stats) | database")
 ):
     """Predict maintenance needs based on historical sensor trends"""
     
+    if source == "stream" or (source == "auto" and machine_id is not None and _stream_has_history(machine_id)):
+        return _maintenance_from_stream(machine_id)
+    
     db = get_supabase()
+    if source == "auto" and machine_id is None and trend_stats.machine_count() > 0:
+        if not db:
+            return _maintenance_from_stream()
+        # Fleet-wide: each machine from the stream if it has enough history there, else from the database
+        return await db_executor.run(_maintenance_from_stream_and_db, db)
+    
     if not db:
         raise HTTPException(status_code=503, detail="Database required for predictions")
     
+    return await db_executor.run(_maintenance_from_db, db, machine_id)
+
+
+def _maintenance_from_db(db: Client, machine_id: Optional[str] = None) -> List[MaintenanceAlert]:
+    """Maintenance alerts from the last 7 days of sensor_logs"""
     # Get last 7 days of sensor data
     since = (datetime.now() - timedelta(days=7)).isoformat()
     
-    query = db.table('sensor_logs').select('*').gte('timestamp', since)
-    if machine_id:
-        query = query.eq('device_id', machine_id)
+    if SERVER_AGGREGATION:
+        try:
+            return _maintenance_from_grid(trend_grid(db, since, TREND_BIN_SECONDS, device_id=machine_id))
+        except Exception as e:
+            print(f"⚠️ Server-side aggregation failed, using sensor_logs: {e}")
+    
+    # Read the full window, keeping only the columns the trend analysis needs
+    chunks = []
+    for chunk in iter_sensor_logs(
+        db, since, device_id=machine_id,
+        columns=('device_id', 'temperature', 'vibration_x', 'vibration_y', 'vibration_z')
+    ):
+        chunk['vib_magnitude'] = vib_magnitude(chunk)
+        chunks.append(chunk[['device_id', 'timestamp', 'temperature', 'vib_magnitude']])
+    
+    if not chunks:
+        return []
+    
+    df = pd.concat(chunks, ignore_index=True)
     
-    response = query.order('timestamp', desc=False).limit(5000).execute()
+    # Group every machine at once, then fit each metric against real time on a fixed grid
+    order, codes, device_ids = group_rows(df['device_id'])
+    n_machines = len(device_ids)
+    enough_history = np.bincount(codes, minlength=n_machines) >= 20
+    seconds = epoch_seconds(df['timestamp'].values[order])
     
-    if not response.data:
+    return _maintenance_alerts(
+        _grid_trends(codes, seconds, df['temperature'].values[order], n_machines),
+        _grid_trends(codes, seconds, df['vib_magnitude'].values[order], n_machines),
+        enough_history, device_ids
+    )
+
+
+def _maintenance_from_grid(grid: pd.DataFrame) -> List[MaintenanceAlert]:
+    """Maintenance alerts from a server-side trend grid (aggregates.trend_grid)"""
+    if grid.empty:
         return []
     
-    df = pd.DataFrame(response.data)
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    df['vib_magnitude'] = np.sqrt(
-        df['vibration_x'].fillna(0)**2 + 
-        df['vibration_y'].fillna(0)**2 + 
-        df['vibration_z'].fillna(0)**2
+    # Rows are sorted by device then bin, so codes come out contiguous and ascending
+    codes, device_ids = pd.factorize(grid['device_id'])
+    n_machines = len(device_ids)
+    enough_history = np.bincount(codes, weights=grid['readings'], minlength=n_machines) >= 20
+    x = (grid['bin'].to_numpy() + 0.5) * TREND_BIN_SECONDS / DAY_SECONDS
+    
+    return _maintenance_alerts(
+        linear_trends(codes, x, grid['temp_mean'].to_numpy(), n_machines),
+        linear_trends(codes, x, grid['vib_mean'].to_numpy(), n_machines),
+        enough_history, np.asarray(device_ids)
+    )
+
+
+def _grid_trends(codes: np.ndarray, seconds: np.ndarray, values: np.ndarray,
+                 n_machines: int) -> Dict[str, np.ndarray]:
+    """Per-machine trends of a metric, resampled onto the trend grid"""
+    grid_codes, x, means = resample_grid(codes, seconds, values, TREND_BIN_SECONDS)
+    return linear_trends(grid_codes, x, means, n_machines)
+
+
+def _maintenance_alerts(temp_trends: Dict[str, np.ndarray], vib_trends: Dict[str, np.ndarray],
+                        eligible: np.ndarray, device_ids) -> List[MaintenanceAlert]:
+    """Assemble temperature + vibration alerts per machine from fleet-wide trend arrays"""
+    temp_alerts = trend_alerts(
+        temp_trends, eligible,
+        warning_threshold=80, critical_threshold=95,
+        component="Cooling System"
+    )
+    vib_alerts = trend_alerts(
+        vib_trends, eligible,
+        warning_threshold=0.3, critical_threshold=0.5,
+        component="Mechanical Components"
     )
     
     alerts = []
-    
-    # Analyze each machine
-    for device_id in df['device_id'].unique():
-        machine_df = df[df['device_id'] == device_id].copy()
-        
-        if len(machine_df) < 20:
-            continue
-        
-        # Calculate time-based index for trend analysis
-        machine_df['time_idx'] = range(len(machine_df))
-        
-        # Analyze temperature trend
-        temp_alert = _analyze_trend(
-            machine_df, 'temperature', device_id,
-            warning_threshold=80, critical_threshold=95,
-            component="Cooling System"
-        )
-        if temp_alert:
-            alerts.append(temp_alert)
-        
-        # Analyze vibration trend
-        vib_alert = _analyze_trend(
-            machine_df, 'vib_magnitude', device_id,
-            warning_threshold=0.3, critical_threshold=0.5,
-            component="Mechanical Components"
-        )
-        if vib_alert:
-            alerts.append(vib_alert)
+    for code in np.flatnonzero(eligible).tolist():
+        for found in (temp_alerts, vib_alerts):
+            if code in found:
+                alerts.append(MaintenanceAlert(machine_id=device_ids[code], **found[code]))
     
     return alerts
 
 
-def _analyze_trend(df: pd.DataFrame, column: str, device_id: str, 
-                   warning_threshold: float, critical_threshold: float,
-                   component: str) -> Optional[MaintenanceAlert]:
-    """Analyze trend for a specific metric and predict maintenance needs"""
-    
-    values = df[column].dropna().values
-    if len(values) < 10:
-        return None
-    
-    # Calculate trend using linear regression
-    X = np.arange(len(values)).reshape(-1, 1)
-    y = values
-    
-    model = LinearRegression()
-    model.fit(X, y)
-    
-    slope = model.coef_[0]
-    current_value = values[-1]
-    avg_value = np.mean(values[-20:])  # Recent average
+def _stream_has_history(machine_id: str, min_readings: int = 20) -> bool:
+    """Whether the in-memory trend stats can answer for a machine"""
+    code = realtime_buffer.lookup(machine_id)
+    reg = trend_stats.regression(code, 'vib_magnitude') if code is not None else None
+    return reg is not None and reg["readings"] >= min_readings and reg["points"] >= MIN_TREND_POINTS
+
+
+def _stream_machines(min_readings: int = 20) -> set:
+    """Machines the in-memory trend stats can answer for"""
+    trends = trend_stats.trends('vib_magnitude')
+    enough = (trends["readings"] >= min_readings) & (trends["count"] >= MIN_TREND_POINTS)
+    machine_ids = realtime_buffer.machine_ids
+    return {machine_ids[code] for code in np.flatnonzero(enough).tolist() if code < len(machine_ids)}
+
+
+def _maintenance_from_stream_and_db(db: Client) -> List[MaintenanceAlert]:
+    """
+    Fleet-wide alerts: from the trend stats for machines with enough stream
+    history, from sensor_logs for the rest (skipped when the machines table
+    shows there is no rest)
+    """
+    streamed = _stream_machines()
+    alerts = _maintenance_from_stream()
     
-    # Predict when threshold will be reached
-    if slope > 0:
-        steps_to_warning = (warning_threshold - current_value) / slope if slope > 0 else float('inf')
-        steps_to_critical = (critical_threshold - current_value) / slope if slope > 0 else float('inf')
-    else:
-        return None  # Trend is stable or decreasing
-    
-    # Estimate days (assuming ~720 readings per day at 5s intervals)
-    readings_per_day = 720
-    days_to_warning = max(0, steps_to_warning / readings_per_day)
-    days_to_critical = max(0, steps_to_critical / readings_per_day)
-    
-    # Determine risk level
-    if current_value > critical_threshold:
-        risk_level = "critical"
-        recommendation = f"IMMEDIATE: {component} requires urgent attention"
-        predicted_days = 0
-    elif current_value > warning_threshold or days_to_critical < 3:
-        risk_level = "high"
-        recommendation = f"Schedule maintenance for {component} within 2-3 days"
-        predicted_days = int(days_to_critical)
-    elif days_to_warning < 7:
-        risk_level = "medium"
-        recommendation = f"Monitor {component} closely, maintenance may be needed soon"
-        predicted_days = int(days_to_warning)
-    else:
-        return None  # No immediate concern
+    machines = db.table('machines').select('device_id').execute().data or []
+    if machines and all(machine['device_id'] in streamed for machine in machines):
+        return alerts
+    return alerts + [alert for alert in _maintenance_from_db(db) if alert.machine_id not in streamed]
+
+
+def _maintenance_from_stream(machine_id: Optional[str] = None) -> List[MaintenanceAlert]:
+    """Maintenance alerts from running trend statistics (no DB query)"""
+    temp_trends = trend_stats.trends('temperature')
+    vib_trends = trend_stats.trends('vib_magnitude')
     
-    confidence = min(0.95, 0.5 + (len(values) / 1000) * 0.45)  # More data = higher confidence
+    # Vibration magnitude is never NaN, so its readings are the machine's reading count
+    eligible = vib_trends["readings"] >= 20
+    if machine_id is not None:
+        code = realtime_buffer.lookup(machine_id)
+        only = np.zeros_like(eligible)
+        if code is not None and code < len(only):
+            only[code] = True
+        eligible &= only
     
-    return MaintenanceAlert(
-        machine_id=device_id,
-        component=component,
-        risk_level=risk_level,
-        predicted_failure_days=predicted_days,
-        recommendation=recommendation,
-        confidence=round(confidence, 2)
-    )
+    return _maintenance_alerts(temp_trends, vib_trends, eligible, realtime_buffer.machine_ids)
 
 
 @app.get("/predict/temperature/{machine_id}")
 async def predict_temperature(
     machine_id: str,
-    hours_ahead: int = Query(default=1, description="Hours to predict ahead")
+    hours_ahead: int = Query(default=1, description="Hours to predict ahead"),
+    source: TrendSource = Query(default="auto", description="auto | stream (in-memory trend stats) | database")
 ):
     """Predict future temperature for a specific machine"""
     
+    if source == "stream" or (source == "auto" and _stream_has_history(machine_id)):
+        return _temperature_from_stream(machine_id, hours_ahead)
+    
     db = get_supabase()
     if not db:
         raise HTTPException(status_code=503, detail="Database required")
     
-    # Get recent data
+    return await db_executor.run(_temperature_from_db, db, machine_id, hours_ahead)
+
+
+def _temperature_from_db(db: Client, machine_id: str, hours_ahead: int) -> PredictionResult:
+    """Temperature forecast from the last 24 hours of sensor_logs"""
+    # Get recent data, page by page (one machine's day fits in memory)
     since = (datetime.now() - timedelta(hours=24)).isoformat()
-    response = db.table('sensor_logs').select(
-        'temperature, timestamp'
-    ).eq('device_id', machine_id).gte('timestamp', since).order('timestamp').execute()
+    chunks = list(iter_sensor_logs(db, since, columns=('temperature',), device_id=machine_id))
     
-    if not response.data or len(response.data) < 20:
+    df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+    if len(df) < 20:
         raise HTTPException(status_code=400, detail="Insufficient data for prediction")
     
-    df = pd.DataFrame(response.data)
     temps = df['temperature'].dropna().values
     
-    # Simple linear prediction
-    X = np.arange(len(temps)).reshape(-1, 1)
-    model = LinearRegression()
-    model.fit(X, temps)
-    
-    # Predict future
-    steps_ahead = int(hours_ahead * 720)  # ~720 readings per hour at 5s interval
-    future_X = np.array([[len(temps) + steps_ahead]])
-    predicted_temp = model.predict(future_X)[0]
+    # Linear trend against real time, resampled onto the trend grid
+    trend = _grid_trends(np.zeros(len(df), dtype=np.int64), epoch_seconds(df['timestamp']),
+                         pd.to_numeric(df['temperature']).values, 1)
+    if trend["count"][0] < MIN_TREND_POINTS:
+        raise HTTPException(status_code=400, detail="Insufficient data for prediction")
+    predicted_temp = _forecast(trend["y_mean"][0], trend["slope"][0], trend["x_mean"][0], hours_ahead)
     
     # Calculate confidence based on variance
     variance = np.var(temps[-100:]) if len(temps) > 100 else np.var(temps)
@@ -506,6 +1237,199 @@ async def predict_temperature(
     )
 
 
+def _temperature_from_stream(machine_id: str, hours_ahead: int) -> PredictionResult:
+    """Temperature forecast from running trend statistics (no DB query)"""
+    code = realtime_buffer.lookup(machine_id)
+    reg = trend_stats.regression(code, 'temperature') if code is not None else None
+    # Enough readings, spread over enough grid bins to extrapolate hours ahead
+    if reg is None or reg["readings"] < 20 or reg["points"] < MIN_TREND_POINTS:
+        raise HTTPException(status_code=400, detail="Insufficient data for prediction")
+    
+    predicted_temp = _forecast(reg["mean"], reg["slope"], reg["x_mean"], hours_ahead)
+    
+    # Recent spread comes from the decayed variant
+    variance = trend_stats.regression(code, 'temperature', 'decayed')["variance"]
+    confidence = max(0.5, 1 - (variance / 100))
+    
+    return PredictionResult(
+        machine_id=machine_id,
+        prediction_type="temperature",
+        predicted_value=round(predicted_temp, 1),
+        confidence=round(confidence, 2),
+        time_horizon=f"{hours_ahead} hours",
+        recommendation="Monitor closely" if predicted_temp > 85 else "Normal operation expected"
+    )
+
+
+def _forecast(mean: float, slope: float, x_mean: float, hours_ahead: float) -> float:
+    """
+    Evaluate a fitted trend line `hours_ahead` from now. Time since the last
+    reading counts toward the horizon, so stale series are extrapolated further.
+    """
+    target = time.time() / DAY_SECONDS + hours_ahead / 24
+    return float(mean + slope * (target - x_mean))
+
+
+@app.post("/trends/sync")
+async def sync_trends(
+    days: int = Query(default=TREND_SYNC_DAYS, description="Days of history to rebuild trend stats from")
+):
+    """Rebuild the in-memory trend statistics from the database and wait for the result"""
+    if not get_supabase():
+        raise HTTPException(status_code=503, detail="Database not connected")
+    return await db_executor.run(_sync_trends_from_db, days, timeout=TREND_SYNC_TIMEOUT)
+
+
+def _sync_trends_from_db(days: int) -> dict:
+    """
+    Replay sensor_logs into fresh trend stats and load them in place, merged
+    with the readings ingested during the replay (runs on the DB executor)
+    """
+    db = get_supabase()
+    if not db:
+        raise HTTPException(status_code=503, detail="Database not connected")
+    
+    # The replay stops at the current grid bin; from there on trend_stats
+    # collects the live readings itself (see StreamingTrendStats.begin_rebuild)
+    rebuild, cutoff = trend_stats.begin_rebuild(time.time())
+    until = datetime.fromtimestamp(cutoff)
+    fresh = StreamingTrendStats(decay=TREND_DECAY, bin_seconds=TREND_BIN_SECONDS)
+    rows = 0
+    try:
+        for chunk in iter_sensor_logs(
+            db, (until - timedelta(days=days)).isoformat(), until=until.isoformat(),
+            columns=('device_id', 'temperature', 'vibration_x', 'vibration_y', 'vibration_z')
+        ):
+            machines = realtime_buffer.intern_many(chunk['device_id'])
+            fresh.update(machines, epoch_seconds(chunk['timestamp']), {
+                'temperature': pd.to_numeric(chunk['temperature']).values,
+                'vib_magnitude': vib_magnitude(chunk).values
+            })
+            rows += len(chunk)
+    except BaseException:
+        trend_stats.end_rebuild(rebuild)
+        raise
+    
+    # In place rather than swapping objects: in multi-worker mode the state is shared
+    if not trend_stats.end_rebuild(rebuild, fresh):
+        raise HTTPException(status_code=409, detail="Superseded by a newer trend sync")
+    print(f"📈 Trend stats rebuilt from {rows} readings over {days} days")
+    return {"status": "synced", "rows": rows, "machines": fresh.machine_count(), "days": days}
+
+
+async def _trend_sync_loop():
+    """Periodically re-base the trend stats on the database window"""
+    while True:
+        if get_supabase():
+            try:
+                await db_executor.run(_sync_trends_from_db, TREND_SYNC_DAYS, timeout=TREND_SYNC_TIMEOUT)
+            except Exception as e:
+                print(f"⚠️ Trend sync failed: {getattr(e, 'detail', e)}")
+        await asyncio.sleep(TREND_SYNC_INTERVAL)
+
+
+# ═══════════════════════════════════════════════════════════════════
+# ROLLUPS
+# ═══════════════════════════════════════════════════════════════════
+
+def _use_rollups(hours: float) -> bool:
+    """Whether analytics over a window of `hours` should read rollups instead of sensor_logs"""
+    return ROLLUPS_ENABLED and hours > ROLLUP_MIN_HOURS
+
+
+def _window_totals(db: Client, since: datetime, hours: float, device_id: Optional[str] = None,
+                   columns: Sequence[str] = ROLLUP_FIELDS) -> Optional[pd.DataFrame]:
+    """
+    Per-device totals (rollup fields, indexed by device_id) over the last
+    `hours`, from rollups or server-side aggregation. None if neither is
+    available; the caller then reads sensor_logs itself.
+    """
+    if _use_rollups(hours):
+        try:
+            return combine_rollups(load_rollups(db, since, device_id=device_id, columns=columns))
+        except Exception as e:
+            print(f"⚠️ Rollup read failed, using sensor_logs: {e}")
+    if SERVER_AGGREGATION:
+        try:
+            return window_totals(db, since.isoformat(), device_id=device_id)
+        except Exception as e:
+            print(f"⚠️ Server-side aggregation failed, using sensor_logs: {e}")
+    return None
+
+
+def _alert_counts(db: Client, since: str) -> pd.DataFrame:
+    """Alerts created since `since`, counted per machine (aggregates.alert_counts shape)"""
+    if SERVER_AGGREGATION:
+        try:
+            return alert_counts(db, since)
+        except Exception as e:
+            print(f"⚠️ Server-side aggregation failed, using alerts: {e}")
+    response = db.table('alerts').select('machine_id, type, severity').gte('created_at', since).execute()
+    return count_alert_rows(response.data or [])
+
+
+@app.post("/rollups/backfill")
+async def backfill_rollups(
+    days: int = Query(default=7, description="Days of sensor_logs to rebuild rollups from")
+):
+    """Rebuild 1-min / 1-hour rollups from sensor_logs (background job)"""
+    if not get_supabase():
+        raise HTTPException(status_code=503, detail="Database not connected")
+    return training_jobs.submit(_backfill_rollups, days=days)
+
+
+def _backfill_rollups(days: int) -> dict:
+    """
+    Rebuild closed hours of rollups server-side, a few hours per call so no
+    single statement runs long. The current hour is left to the ingest feed.
+    """
+    db = get_supabase()
+    if not db:
+        raise HTTPException(status_code=503, detail="Database not connected")
+    
+    until = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    start = until - timedelta(days=days)
+    step = timedelta(hours=ROLLUP_BACKFILL_STEP_HOURS)
+    buckets = 0
+    while start < until:
+        end = min(start + step, until)
+        response = db.rpc('rebuild_sensor_rollups', {
+            'p_since': start.isoformat(), 'p_until': end.isoformat()
+        }).execute()
+        buckets += response.data or 0
+        start = end
+    
+    print(f"🧮 Rollups rebuilt: {buckets} minute buckets over {days} days")
+    return {"status": "completed", "minute_buckets": buckets, "days": days, "until": until.isoformat()}
+
+
+def _flush_rollups() -> int:
+    """Merge pending rollup partials into the database (runs in a worker thread)"""
+    partials = rollup_accumulator.drain()
+    db = get_supabase()
+    if not partials or not db:
+        rollup_accumulator.merge(partials)
+        return 0
+    try:
+        db.rpc('merge_sensor_rollups', {'p_rows': RollupAccumulator.to_rows(partials)}).execute()
+    except Exception as e:
+        # Keep the partials; they are merged again on the next flush
+        rollup_accumulator.merge(partials)
+        print(f"⚠️ Rollup flush failed ({len(partials)} pending): {e}")
+        return 0
+    return len(partials)
+
+
+async def _rollup_flush_loop():
+    """Periodically push ingested readings' rollup partials to the database"""
+    while True:
+        await asyncio.sleep(ROLLUP_FLUSH_INTERVAL)
+        try:
+            await db_executor.run(_flush_rollups)
+        except HTTPException as e:
+            print(f"⚠️ Rollup flush: {e.detail}")
+
+
 # ═══════════════════════════════════════════════════════════════════
 # EFFICIENCY & ANALYTICS
 # ═══════════════════════════════════════════════════════════════════
@@ -515,42 +1439,87 @@ async def get_efficiency_metrics(
     hours: int = Query(default=24, description="Hours to analyze")
 ):
     """Calculate efficiency metrics from persisted sensor data"""
-    
+    return await response_cache.get_or_compute(("efficiency", hours), lambda: _efficiency(hours))
+
+
+async def _efficiency(hours: int):
     db = get_supabase()
     
     if db:
-        return await _efficiency_from_db(db, hours)
+        return await db_executor.run(_efficiency_from_db, db, hours)
     else:
         return _efficiency_from_buffer()
 
 
-async def _efficiency_from_db(db: Client, hours: int):
+def _efficiency_from_db(db: Client, hours: int):
     """Calculate efficiency from database"""
-    
-    since = (datetime.now() - timedelta(hours=hours)).isoformat()
-    
-    response = db.table('sensor_logs').select(
-        'device_id, speed, state, timestamp'
-    ).gte('timestamp', since).execute()
-    
-    if not response.data:
+    since = datetime.now() - timedelta(hours=hours)
+    
+    totals = _window_totals(db, since, hours,
+                            columns=('count', 'active_count', 'moving_count', 'moving_speed_sum'))
+    if totals is not None:
+        return _efficiency_report(_efficiency_tallies(totals), hours)
+    
+    # Per-device tallies, accumulated page by page
+    parts = []
+    
+    def tally(chunk: pd.DataFrame):
+        speed = chunk['speed']
+        moving = speed > 0
+        parts.append(pd.DataFrame({
+            'device_id': chunk['device_id'],
+            'total': 1,
+            'active': (speed > 1).astype(int),
+            'moving': moving.astype(int),
+            'moving_speed': speed.where(moving, 0),
+        }).groupby('device_id', sort=False).sum())
+    
+    truncated = _fold_newest_logs(db, since, ('device_id', 'speed'), tally)
+    totals = pd.concat(parts).groupby(level=0).sum() if parts else None
+    return _efficiency_report(totals, hours, truncated)
+
+
+def _efficiency_tallies(totals: pd.DataFrame) -> Optional[pd.DataFrame]:
+    """Per-device efficiency tallies from window totals (same columns as _efficiency_from_db)"""
+    if totals.empty:
+        return None
+    return totals.rename(columns={
+        'count': 'total', 'active_count': 'active',
+        'moving_count': 'moving', 'moving_speed_sum': 'moving_speed'
+    })
+
+
+def _fold_newest_logs(db: Client, since: datetime, columns: Sequence[str],
+                      fold: Callable[[pd.DataFrame], None]) -> bool:
+    """
+    Feed the window's sensor_logs to fold() page by page, newest first, up to
+    ANALYTICS_ROW_BUDGET rows. Returns whether the budget cut the window short.
+    """
+    rows = 0
+    for chunk in iter_sensor_logs(db, since.isoformat(), columns=columns, newest_first=True):
+        if rows >= ANALYTICS_ROW_BUDGET:
+            return True
+        chunk = chunk.iloc[:ANALYTICS_ROW_BUDGET - rows]
+        fold(chunk)
+        rows += len(chunk)
+    return False
+
+
+def _efficiency_report(totals: Optional[pd.DataFrame], hours: int, truncated: bool = False) -> dict:
+    """Efficiency response from per-device total / active / moving / moving_speed tallies"""
+    if totals is None:
         return {"message": "No data available", "source": "database"}
     
-    df = pd.DataFrame(response.data)
-    
-    # Group by machine
     efficiencies = []
-    for device_id in df['device_id'].unique():
-        machine_df = df[df['device_id'] == device_id]
-        
-        total_readings = len(machine_df)
-        active_readings = len(machine_df[machine_df['speed'] > 1])
+    for device_id, row in totals.iterrows():
+        total_readings = int(row['total'])
+        active_readings = int(row['active'])
         
         if total_readings > 0:
             efficiency = (active_readings / total_readings) * 100
             
             # Estimate distance (speed * time interval)
-            avg_speed = machine_df[machine_df['speed'] > 0]['speed'].mean()
+            avg_speed = row['moving_speed'] / row['moving'] if row['moving'] else np.nan
             estimated_hours = total_readings * 5 / 3600  # 5s per reading
             distance = avg_speed * estimated_hours if not np.isnan(avg_speed) else 0
             
@@ -563,8 +1532,9 @@ async def _efficiency_from_db(db: Client, hours: int):
                 "operating_hours": round(estimated_hours, 2)
             })
     
-    # Sort by efficiency
-    efficiencies.sort(key=lambda x: x["efficiency"], reverse=True)
+    # Sort by efficiency; ties by machine, since neither the tallies nor the
+    # rollups or server aggregates keep the readings' arrival order
+    efficiencies.sort(key=lambda x: (-x["efficiency"], x["machine_id"]))
     
     avg_eff = np.mean([e["efficiency"] for e in efficiencies]) if efficiencies else 0
     
@@ -574,6 +1544,7 @@ async def _efficiency_from_db(db: Client, hours: int):
         "lowPerformers": efficiencies[-5:] if len(efficiencies) > 5 else [],
         "totalMachines": len(efficiencies),
         "timeRangeHours": hours,
+        "truncated": truncated,
         "source": "database"
     }
 
@@ -583,20 +1554,19 @@ def _efficiency_from_buffer():
     if len(realtime_buffer) < 10:
         return {"message": "Insufficient data", "source": "buffer"}
     
-    machine_data = {}
-    for data in realtime_buffer:
-        mid = data.get('id')
-        if mid not in machine_data:
-            machine_data[mid] = {"active": 0, "total": 0}
-        machine_data[mid]["total"] += 1
-        if data.get('speed', 0) > 1:
-            machine_data[mid]["active"] += 1
+    window = realtime_buffer.view()
+    machines = window['machine']
+    n_machines = len(realtime_buffer.machine_ids)
+    totals = np.bincount(machines, minlength=n_machines)
+    actives = np.bincount(machines, weights=window['speed'] > 1, minlength=n_machines)
+    
+    # Report machines in order of first appearance in the window
+    present, first_seen = np.unique(machines, return_index=True)
     
     efficiencies = []
-    for mid, stats in machine_data.items():
-        if stats["total"] > 0:
-            eff = (stats["active"] / stats["total"]) * 100
-            efficiencies.append({"machine_id": mid, "efficiency": round(eff, 1)})
+    for idx in present[np.argsort(first_seen)]:
+        eff = (actives[idx] / totals[idx]) * 100
+        efficiencies.append({"machine_id": realtime_buffer.machine_id(idx), "efficiency": round(float(eff), 1)})
     
     efficiencies.sort(key=lambda x: x["efficiency"], reverse=True)
     avg = np.mean([e["efficiency"] for e in efficiencies]) if efficiencies else 0
@@ -612,78 +1582,107 @@ def _efficiency_from_buffer():
 @app.get("/stats")
 async def get_stats(hours: int = Query(default=24)):
     """Get comprehensive statistics from database"""
-    
+    return await response_cache.get_or_compute(("stats", hours), lambda: _stats(hours))
+
+
+async def _stats(hours: int):
     db = get_supabase()
     
     if db:
-        since = (datetime.now() - timedelta(hours=hours)).isoformat()
-        response = db.table('sensor_logs').select('*').gte('timestamp', since).limit(5000).execute()
-        
-        if response.data:
-            df = pd.DataFrame(response.data)
-            
-            temps = df['temperature'].dropna()
-            speeds = df['speed'].dropna()
-            df['vib_mag'] = np.sqrt(
-                df['vibration_x'].fillna(0)**2 + 
-                df['vibration_y'].fillna(0)**2 + 
-                df['vibration_z'].fillna(0)**2
-            )
-            vibs = df['vib_mag']
-            
-            # Get alert counts
-            alert_response = db.table('alerts').select('type').gte('created_at', since).execute()
-            alert_counts = {}
-            if alert_response.data:
-                for alert in alert_response.data:
-                    t = alert.get('type', 'unknown')
-                    alert_counts[t] = alert_counts.get(t, 0) + 1
-            
-            return {
-                "records_analyzed": len(df),
-                "unique_machines": df['device_id'].nunique(),
-                "time_range_hours": hours,
-                "temperature": {
-                    "min": round(temps.min(), 1) if len(temps) else 0,
-                    "max": round(temps.max(), 1) if len(temps) else 0,
-                    "avg": round(temps.mean(), 1) if len(temps) else 0,
-                    "std": round(temps.std(), 2) if len(temps) else 0
-                },
-                "speed": {
-                    "min": round(speeds.min(), 1) if len(speeds) else 0,
-                    "max": round(speeds.max(), 1) if len(speeds) else 0,
-                    "avg": round(speeds.mean(), 1) if len(speeds) else 0
-                },
-                "vibration": {
-                    "min": round(vibs.min(), 4) if len(vibs) else 0,
-                    "max": round(vibs.max(), 4) if len(vibs) else 0,
-                    "avg": round(vibs.mean(), 4) if len(vibs) else 0
-                },
-                "alerts": alert_counts,
-                "model_trained": anomaly_model is not None,
-                "source": "database"
-            }
+        stats = await db_executor.run(_stats_from_db, db, hours)
+        if stats is not None:
+            return stats
     
     # Fallback to buffer
     return _stats_from_buffer()
 
 
+def _stats_from_db(db: Client, hours: int) -> Optional[dict]:
+    """Statistics from database (None when the window holds no readings)"""
+    since = datetime.now() - timedelta(hours=hours)
+    
+    totals = _window_totals(db, since, hours)
+    truncated = False
+    if totals is not None:
+        summary = _stats_summary_from_totals(totals)
+    else:
+        summary, truncated = _stats_summary_from_db(db, since)
+    records, devices, temps, speeds, vibs = summary
+    
+    if not records:
+        return None
+    
+    # Get alert counts
+    alert_counts = alert_type_totals(_alert_counts(db, since.isoformat()))
+    
+    return {
+        "records_analyzed": records,
+        "unique_machines": devices,
+        "time_range_hours": hours,
+        "temperature": temps.summary(digits=1, include_std=True),
+        "speed": speeds.summary(digits=1),
+        "vibration": vibs.summary(digits=4),
+        "alerts": alert_counts,
+        "model_trained": active_model is not None,
+        "truncated": truncated,
+        "source": "database"
+    }
+
+
+def _stats_summary_from_db(db: Client, since: datetime):
+    """
+    ((records, unique machines, temperature, speed, vibration stats), truncated)
+    in one streaming pass over the newest ANALYTICS_ROW_BUDGET rows
+    """
+    records = 0
+    devices = set()
+    temps, speeds, vibs = RunningStats(), RunningStats(), RunningStats()
+    
+    def summarise(chunk: pd.DataFrame):
+        nonlocal records
+        records += len(chunk)
+        devices.update(chunk['device_id'].dropna().unique())
+        temps.update(chunk['temperature'].values)
+        speeds.update(chunk['speed'].values)
+        vibs.update(vib_magnitude(chunk).values)
+    
+    truncated = _fold_newest_logs(
+        db, since, ('device_id', 'temperature', 'vibration_x', 'vibration_y', 'vibration_z', 'speed'), summarise
+    )
+    return (records, len(devices), temps, speeds, vibs), truncated
+
+
+def _stats_summary_from_totals(per_device: pd.DataFrame):
+    """Same summary as _stats_summary_from_db, from per-device window totals"""
+    if per_device.empty:
+        return 0, 0, RunningStats(), RunningStats(), RunningStats()
+    totals = total_rollups(per_device.reset_index())
+    return (
+        int(totals['count']),
+        int((per_device['count'] > 0).sum()),
+        rollup_stats(totals, 'temp', 'temp_count'),
+        rollup_stats(totals, 'speed', 'speed_count'),
+        rollup_stats(totals, 'vib', 'count'),
+    )
+
+
 def _stats_from_buffer():
     """Fallback stats from buffer"""
-    if not realtime_buffer:
+    if not len(realtime_buffer):
         return {"message": "No data available", "source": "buffer"}
     
-    temps = [d.get('temp', 0) for d in realtime_buffer]
-    speeds = [d.get('speed', 0) for d in realtime_buffer]
-    vibs = [np.sqrt(d.get('vib_x', 0)**2 + d.get('vib_y', 0)**2 + d.get('vib_z', 0)**2) for d in realtime_buffer]
+    window = realtime_buffer.view()
+    temps = window['temp']
+    speeds = window['speed']
+    vibs = realtime_buffer.vib_magnitude(window)
     
     return {
         "buffer_size": len(realtime_buffer),
-        "unique_machines": len(set(d.get('id') for d in realtime_buffer)),
-        "temperature": {"min": round(min(temps), 1), "max": round(max(temps), 1), "avg": round(np.mean(temps), 1)},
-        "speed": {"min": round(min(speeds), 1), "max": round(max(speeds), 1), "avg": round(np.mean(speeds), 1)},
-        "vibration": {"min": round(min(vibs), 4), "max": round(max(vibs), 4), "avg": round(np.mean(vibs), 4)},
-        "model_trained": anomaly_model is not None,
+        "unique_machines": len(np.unique(window['machine'])),
+        "temperature": {"min": round(float(temps.min()), 1), "max": round(float(temps.max()), 1), "avg": round(float(temps.mean()), 1)},
+        "speed": {"min": round(float(speeds.min()), 1), "max": round(float(speeds.max()), 1), "avg": round(float(speeds.mean()), 1)},
+        "vibration": {"min": round(float(vibs.min()), 4), "max": round(float(vibs.max()), 4), "avg": round(float(vibs.mean()), 4)},
+        "model_trained": active_model is not None,
         "source": "buffer"
     }
 
@@ -705,35 +1704,45 @@ async def get_machine_insights(
     
     since = (datetime.now() - timedelta(days=days)).isoformat()
     
-    # Get machine info first
+    # Machine info (then its alerts) and the sensor summary are independent
+    (machine_response, alert_response), metrics = await db_executor.gather(
+        lambda: _machine_with_alerts(db, machine_id, since),
+        lambda: _insight_metrics(db, machine_id, days, since)
+    )
+    return _insights_report(machine_id, days, machine_response, alert_response, metrics)
+
+
+def _machine_with_alerts(db: Client, machine_id: str, since: str):
+    """(machine, alerts) responses; alerts are keyed by the machine's UUID, so they follow the lookup"""
     machine_response = db.table('machines').select('*').eq('device_id', machine_id).single().execute()
     
-    # Get sensor data
-    sensor_response = db.table('sensor_logs').select('*').eq(
-        'device_id', machine_id
-    ).gte('timestamp', since).order('timestamp').execute()
-    
     # Get alerts using machine UUID if available
     alert_response = None
     if machine_response.data:
         alert_response = db.table('alerts').select('*').eq(
             'machine_id', machine_response.data['id']
         ).gte('created_at', since).execute()
+    return machine_response, alert_response
+
+
+def _insight_metrics(db: Client, machine_id: str, days: int, since: str) -> dict:
+    """Sensor data summary for one machine, from rollups / server-side aggregates when enabled"""
+    totals = _window_totals(db, datetime.fromisoformat(since), days * 24, device_id=machine_id)
+    if totals is not None:
+        return _insight_metrics_from_totals(totals)
+    return _insight_metrics_from_db(db, machine_id, since)
+
+
+def _insights_report(machine_id: str, days: int, machine_response, alert_response, metrics: dict) -> dict:
+    """Insights response from the machine, alert and sensor summary queries"""
     
-    if not sensor_response.data:
+    if not metrics["total_readings"]:
         raise HTTPException(status_code=404, detail=f"No data found for machine {machine_id}")
     
-    df = pd.DataFrame(sensor_response.data)
-    df['vib_magnitude'] = np.sqrt(
-        df['vibration_x'].fillna(0)**2 + 
-        df['vibration_y'].fillna(0)**2 + 
-        df['vibration_z'].fillna(0)**2
-    )
-    
     # Calculate insights
-    total_readings = len(df)
-    active_readings = len(df[df['speed'] > 1])
-    idle_readings = len(df[(df['speed'] < 1) & (df['vib_magnitude'] > 0.01)])
+    total_readings = metrics["total_readings"]
+    active_readings = metrics["active_readings"]
+    idle_readings = metrics["idle_readings"]
     off_readings = total_readings - active_readings - idle_readings
     
     # Time calculations (5s per reading)
@@ -742,8 +1751,8 @@ async def get_machine_insights(
     idle_hours = idle_readings * 5 / 3600
     
     # Health score (0-100)
-    avg_temp = df['temperature'].mean()
-    avg_vib = df['vib_magnitude'].mean()
+    avg_temp = metrics["avg_temperature"]
+    avg_vib = metrics["avg_vibration"]
     alert_count = len(alert_response.data) if alert_response and alert_response.data else 0
     
     health_score = 100
@@ -771,15 +1780,66 @@ async def get_machine_insights(
         },
         "metrics": {
             "avg_temperature": round(avg_temp, 1) if not np.isnan(avg_temp) else 0,
-            "max_temperature": round(df['temperature'].max(), 1),
+            "max_temperature": round(metrics["max_temperature"], 1),
             "avg_vibration": round(avg_vib, 4) if not np.isnan(avg_vib) else 0,
-            "max_vibration": round(df['vib_magnitude'].max(), 4),
-            "avg_speed_when_active": round(df[df['speed'] > 1]['speed'].mean(), 1) if len(df[df['speed'] > 1]) > 0 else 0
+            "max_vibration": round(metrics["max_vibration"], 4),
+            "avg_speed_when_active": round(metrics["avg_active_speed"], 1) if active_readings > 0 else 0
         },
         "recent_alerts": alert_response.data[:10] if alert_response and alert_response.data else []
     }
 
 
+def _insight_metrics_from_db(db: Client, machine_id: str, since: str) -> dict:
+    """Reading counts and metric summaries for one machine, streamed page by page from raw sensor_logs"""
+    total = active_count = idle_count = 0
+    temps, vibs, active_speeds = RunningStats(), RunningStats(), RunningStats()
+    
+    for chunk in iter_sensor_logs(db, since, device_id=machine_id,
+                                  columns=('temperature', 'speed', 'vibration_x', 'vibration_y', 'vibration_z')):
+        vib = vib_magnitude(chunk)
+        active = chunk['speed'] > 1
+        total += len(chunk)
+        active_count += int(active.sum())
+        idle_count += int(((chunk['speed'] < 1) & (vib > 0.01)).sum())
+        temps.update(chunk['temperature'].values)
+        vibs.update(vib.values)
+        active_speeds.update(chunk.loc[active, 'speed'].values)
+    
+    if not total:
+        return {"total_readings": 0}
+    
+    return {
+        "total_readings": total,
+        "active_readings": active_count,
+        "idle_readings": idle_count,
+        "avg_temperature": temps.mean if temps.count else np.nan,
+        "max_temperature": temps.max if temps.count else np.nan,
+        "avg_vibration": vibs.mean if vibs.count else np.nan,
+        "max_vibration": vibs.max if vibs.count else np.nan,
+        "avg_active_speed": active_speeds.mean if active_speeds.count else np.nan,
+    }
+
+
+def _insight_metrics_from_totals(per_device: pd.DataFrame) -> dict:
+    """Same summary as _insight_metrics_from_db, from window totals"""
+    if per_device.empty:
+        return {"total_readings": 0}
+    
+    totals = total_rollups(per_device.reset_index())
+    count, active = int(totals['count']), int(totals['active_count'])
+    temp_count = totals['temp_count']
+    return {
+        "total_readings": count,
+        "active_readings": active,
+        "idle_readings": int(totals['idle_count']),
+        "avg_temperature": totals['temp_sum'] / temp_count if temp_count else np.nan,
+        "max_temperature": totals['temp_max'],
+        "avg_vibration": totals['vib_sum'] / count if count else np.nan,
+        "max_vibration": totals['vib_max'],
+        "avg_active_speed": totals['active_speed_sum'] / active if active else np.nan,
+    }
+
+
 # ═══════════════════════════════════════════════════════════════════
 # FLEET OVERVIEW
 # ═══════════════════════════════════════════════════════════════════
@@ -787,55 +1847,58 @@ async def get_machine_insights(
 @app.get("/fleet/overview")
 async def get_fleet_overview():
     """Get overview of entire fleet health and status"""
-    
+    return await response_cache.get_or_compute(("fleet_overview",), _fleet_overview)
+
+
+async def _fleet_overview():
     db = get_supabase()
     if not db:
         raise HTTPException(status_code=503, detail="Database required")
     
-    # Get all machines
-    machines_response = db.table('machines').select('*').execute()
-    
-    # Get recent alerts (last 24 hours)
     since = (datetime.now() - timedelta(hours=24)).isoformat()
-    alerts_response = db.table('alerts').select('machine_id, type, severity').gte('created_at', since).execute()
     
-    # Get recent sensor data summary
-    sensor_response = db.table('sensor_logs').select(
-        'device_id, temperature, speed'
-    ).gte('timestamp', since).execute()
+    # All machines, recent alerts (last 24 hours) and active machines, queried concurrently
+    machines_response, alert_counts, (active_devices, truncated) = await db_executor.gather(
+        lambda: db.table('machines').select('status, type').execute(),
+        lambda: _alert_counts(db, since),
+        lambda: _active_devices(db, since)
+    )
     
     machines = machines_response.data or []
-    alerts = alerts_response.data or []
-    sensors = sensor_response.data or []
-    
-    # Count alerts by machine
-    alert_counts = {}
-    critical_machines = set()
-    for alert in alerts:
-        mid = alert.get('machine_id')
-        alert_counts[mid] = alert_counts.get(mid, 0) + 1
-        if alert.get('severity') == 'critical':
-            critical_machines.add(mid)
-    
-    # Calculate active machines
-    active_devices = set()
-    if sensors:
-        df = pd.DataFrame(sensors)
-        active_devices = set(df[df['speed'] > 1]['device_id'].unique())
+    critical_machines = int((alert_counts['critical_count'] > 0).sum())
     
     return {
         "total_machines": len(machines),
         "active_machines": len(active_devices),
         "machines_with_alerts": len(alert_counts),
-        "critical_alerts": len(critical_machines),
-        "total_alerts_24h": len(alerts),
-        "fleet_health": "Good" if len(critical_machines) == 0 else "At Risk" if len(critical_machines) < 3 else "Critical",
+        "critical_alerts": critical_machines,
+        "total_alerts_24h": int(alert_counts['count'].sum()),
+        "fleet_health": "Good" if critical_machines == 0 else "At Risk" if critical_machines < 3 else "Critical",
         "machines_by_status": _count_by_field(machines, 'status'),
         "machines_by_type": _count_by_field(machines, 'type'),
-        "alerts_by_type": _count_by_field(alerts, 'type')
+        "alerts_by_type": alert_type_totals(alert_counts),
+        "truncated": truncated
     }
 
 
+def _active_devices(db: Client, since: str):
+    """
+    (devices that moved (speed > 1) since the given time, truncated); raw
+    sensor_logs are read newest first up to ANALYTICS_ROW_BUDGET rows
+    """
+    totals = _window_totals(db, datetime.fromisoformat(since), 24, columns=('active_count',))
+    if totals is not None:
+        return set(totals.index[totals['active_count'] > 0]), False
+    
+    active_devices = set()
+    
+    def collect(chunk: pd.DataFrame):
+        active_devices.update(chunk.loc[chunk['speed'] > 1, 'device_id'].dropna().unique())
+    
+    truncated = _fold_newest_logs(db, datetime.fromisoformat(since), ('device_id', 'speed'), collect)
+    return active_devices, truncated
+
+
 def _count_by_field(items: List[dict], field: str) -> Dict[str, int]:
     """Count items by a specific field"""
     counts = {}
@@ -852,14 +1915,87 @@ def _count_by_field(items: List[dict], field: str) -> Dict[str, int]:
 @app.on_event("startup")
 async def startup():
     """Initialize on startup"""
-    get_supabase()
+    global mqtt_consumer
+    db = get_supabase()
+    
+    # Machine types route readings to per-type models
+    if db and MODEL_GROUPING:
+        try:
+            types = await db_executor.run(_refresh_machine_types, db)
+            print(f"✅ Loaded types for {len(types)} machines")
+        except Exception as e:
+            print(f"⚠️ Could not load machine types: {e}")
+    
+    # Warm-load the last trained model so ML detection is live immediately
+    if model_store.current_version():
+        try:
+            bundle = _load_model_version()
+            print(f"✅ Loaded model version {bundle.version} ({bundle.samples} samples, {bundle.source})")
+        except Exception as e:
+            print(f"⚠️ Could not load stored model: {getattr(e, 'detail', e)}")
+    
+    # Each worker flushes its own rollup partials (merges are additive)
+    if ROLLUPS_ENABLED:
+        app.state.rollup_flush_task = asyncio.create_task(_rollup_flush_loop())
+    if leader_lock is None or leader_lock.try_acquire():
+        await _start_leader_tasks()
+    if leader_lock is not None:
+        app.state.worker_sync_task = asyncio.create_task(_worker_sync_loop())
     print("🤖 AgriTrack AI Engine v2.0 started")
     print("   - Anomaly Detection: Rule-based + ML (Isolation Forest)")
     print("   - Predictive Maintenance: Trend Analysis")
     print("   - Data Source: Supabase PostgreSQL")
+    if ONLINE_LEARNING:
+        print(f"   - Online Learning: refit every {ONLINE_UPDATE_INTERVAL}s from live readings")
+    if ROLLUPS_ENABLED:
+        print(f"   - Rollups: fed from {ROLLUP_FEED} (ROLLUP_FEED), flushed every {ROLLUP_FLUSH_INTERVAL}s")
+    if mqtt_consumer:
+        print(f"   - MQTT: {MQTT_TOPIC} -> {MQTT_ALERTS_TOPIC} via {MQTT_BROKER_HOST}:{MQTT_BROKER_PORT}")
+    if leader_lock is not None:
+        print(f"   - Worker {os.getpid()} of {WORKERS}, shared state in {SHARED_STATE_DIR}")
+
+
+async def _start_leader_tasks():
+    """Start the background work only one process may run: online refits, trend sync and the MQTT feed"""
+    global mqtt_consumer
+    if leader_lock is not None:
+        print(f"👑 Worker {os.getpid()} is the leader")
+    if ONLINE_LEARNING:
+        app.state.online_update_task = asyncio.create_task(_online_update_loop())
+    app.state.trend_sync_task = asyncio.create_task(_trend_sync_loop())
+    if MQTT_ENABLED:
+        try:
+            mqtt_consumer = MqttConsumer(
+                _handle_mqtt_batch, MQTT_BROKER_HOST, MQTT_BROKER_PORT,
+                topic=MQTT_TOPIC, alerts_topic=MQTT_ALERTS_TOPIC,
+                max_batch=MQTT_BATCH_SIZE, max_delay=MQTT_BATCH_DELAY
+            )
+            await mqtt_consumer.start()
+        except Exception as e:
+            mqtt_consumer = None
+            print(f"⚠️ MQTT consumer not started: {e}")
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Drain the MQTT feed, push pending rollup partials and stop the database pool before exiting"""
+    if mqtt_consumer:
+        await mqtt_consumer.stop()
+    if ROLLUPS_ENABLED:
+        await asyncio.to_thread(_flush_rollups)
+    db_executor.shutdown()
 
 
 if __name__ == "__main__":
-    import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # Hand over to the uvicorn CLI, so this script is never the __main__ of a
+    # server process: spawned children (uvicorn workers, training fit
+    # workers) re-run __main__'s module-level code, which here is the whole
+    # engine setup
+    args = [
+        sys.executable, "-m", "uvicorn", "main:app", "--app-dir", os.path.dirname(os.path.abspath(__file__)),
+        "--host", "0.0.0.0", "--port", str(port),
+    ]
+    if WORKERS > 1:
+        args += ["--workers", str(WORKERS)]
+    os.execv(sys.executable, args)
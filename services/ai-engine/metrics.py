@@ -0,0 +1,302 @@
+"""
+Metrics
+=======
+In-process counters, histograms and gauges, served at /metrics in the
+Prometheus text exposition format (version 0.0.4).
+
+Metrics are registered once at import time by the module that owns them:
+
+    DB_ROWS = REGISTRY.counter("agritrack_db_rows_fetched_total",
+                               "Rows returned by Supabase", labels=("table",))
+    DB_ROWS.labels("sensor_logs").inc(len(rows))
+
+Cost:
+-----
+Recording is meant to stay on in production. A labelled series is looked up
+once per call in a dict, and an observation is a bisect over the bucket
+bounds plus two additions under the metric's lock (a few microseconds per
+/detect request in total). Gauges take a function that is called at scrape
+time, so buffer occupancy and queue depths cost nothing between scrapes
+(counter_function() does the same for totals a component already keeps).
+
+Label values must come from a small fixed set (route templates, table names,
+anomaly types) — never machine or reading IDs.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, from sub-millisecond /detect batches to multi-second analytics
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Readings per batch
+SIZE_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 50000)
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values) -> object:
+        """The series for these label values (in label_names order)"""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.label_names):
+                raise ValueError(f"{self.name} expects labels {self.label_names}, got {key}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        """(sample name, labels, value) for every series"""
+        with self._lock:
+            children = sorted(self._children.items())
+            return [sample for key, child in children
+                    for sample in self._child_samples(dict(zip(self.label_names, key)), child)]
+
+    def _new_child(self) -> object:
+        raise NotImplementedError
+
+    def _child_samples(self, labels: Dict[str, str], child) -> List[Tuple[str, Dict[str, str], float]]:
+        raise NotImplementedError
+
+
+class _CounterChild:
+    __slots__ = ("_lock", "value")
+
+    def __init__(self, lock: threading.Lock):
+        self._lock = lock
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    """Monotonically increasing total (name should end in _total)"""
+
+    type = "counter"
+
+    def inc(self, amount: float = 1.0):
+        """Increment the unlabelled series"""
+        self.labels().inc(amount)
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild(self._lock)
+
+    def _child_samples(self, labels, child):
+        return [(self.name, labels, child.value)]
+
+
+class _HistogramChild:
+    __slots__ = ("_lock", "_bounds", "counts", "sum")
+
+    def __init__(self, lock: threading.Lock, bounds: Tuple[float, ...]):
+        self._lock = lock
+        self._bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot: above every bound
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        slot = bisect_left(self._bounds, value)
+        with self._lock:
+            self.counts[slot] += 1
+            self.sum += value
+
+    def time(self) -> "_Timer":
+        """Context manager observing the seconds spent in its block"""
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("_child", "_start")
+
+    def __init__(self, child: _HistogramChild):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._child.observe(time.perf_counter() - self._start)
+
+
+class Histogram(_Metric):
+    """Observation counts in cumulative buckets, plus their sum and count"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(float(bound) for bound in buckets))
+
+    def observe(self, value: float):
+        """Observe on the unlabelled series"""
+        self.labels().observe(value)
+
+    def time(self) -> _Timer:
+        return self.labels().time()
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self._lock, self.buckets)
+
+    def _child_samples(self, labels, child):
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            samples.append((f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+        samples.append((f"{self.name}_sum", labels, child.sum))
+        samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+class Gauge(_Metric):
+    """
+    Current value, read from a function at scrape time. With labels, the
+    function returns {label value tuple: value}.
+    """
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, function: Callable[[], object], labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self.function = function
+
+    def samples(self):
+        value = self.function()
+        if value is None:
+            return []
+        if not self.label_names:
+            return [(self.name, {}, float(value))]
+        return [
+            (self.name, dict(zip(self.label_names, key if isinstance(key, tuple) else (key,))), float(series))
+            for key, series in sorted(value.items())
+        ]
+
+
+class CounterFunction(Gauge):
+    """Like Gauge, for totals a component already keeps (e.g. in its stats())"""
+
+    type = "counter"
+
+
+class Registry:
+    """Named metrics, rendered together"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name: str, help: str, function: Callable[[], object], labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, function, labels))
+
+    def counter_function(self, name: str, help: str, function: Callable[[], object],
+                         labels: Sequence[str] = ()) -> CounterFunction:
+        return self._register(CounterFunction(name, help, function, labels))
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                # One broken gauge must not take the whole scrape down
+                print(f"⚠️ Metric {metric.name} failed: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {_escape(metric.help, quote=False)}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in samples:
+                if labels:
+                    rendered = ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+                    lines.append(f"{name}{{{rendered}}} {_format_value(value)}")
+                else:
+                    lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric: _Metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+
+# Process-wide registry: modules register their metrics here at import time
+REGISTRY = Registry()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware observing each HTTP request's duration (until the
+    response body is sent) by method, route template and status code.
+    """
+
+    def __init__(self, app, histogram: Histogram):
+        """
+        Args:
+            app: Wrapped ASGI application
+            histogram: Histogram with labels (method, endpoint, status)
+        """
+        self.app = app
+        self.histogram = histogram
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router stores the matched route in the scope; the template
+            # (/predict/maintenance/{machine_id}) keeps label values bounded
+            route = scope.get("route")
+            endpoint = getattr(route, "path", None) or "unmatched"
+            self.histogram.labels(scope["method"], endpoint, status).observe(time.perf_counter() - start)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str, quote: bool = True) -> str:
+    value = str(value).replace("\\", "\\\\").replace("\n", "\\n")
+    return value.replace('"', '\\"') if quote else value
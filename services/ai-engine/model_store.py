@@ -0,0 +1,167 @@
+"""
+Model Store
+===========
+Versioned on-disk storage for trained anomaly models.
+
+Layout:
+-------
+    MODEL_STORE_DIR/
+        CURRENT                         <- name of the active version
+        20250101-120000-a1b2c3/
+            model.joblib                <- {"model": IsolationForest, "scaler": StandardScaler,
+                                            "groups": {machine type: (IsolationForest, StandardScaler)},
+                                            "scoring": {"model": FlatForest, "groups": {machine type: FlatForest}}}
+            metadata.json               <- version, trained_at, samples, source, groups, pinned,
+                                            sklearn_version
+
+Versions are written to a temporary directory and renamed into place, and
+CURRENT is swapped with os.replace, so a crash never leaves a half-written
+version active. Models are dumped uncompressed so joblib can memory-map the
+arrays on load. That sharing covers the flattened scoring forests
+(forest_scorer.py), stored alongside so loading a version builds nothing:
+every worker process that loads it maps the same file, and their node arrays
+are shared through the page cache. The sklearn estimators are not shared
+(Tree.__setstate__ copies the mapped node arrays into the tree). Versions
+saved without scoring forests build them on first use.
+
+Pruning keeps the newest `keep` unpinned versions and, separately, the
+newest `keep` pinned versions (the ones trained on the database history),
+plus the current version whatever its age. Counting the two apart means a
+stream of online refits cannot push the last full trainings out of the
+store, while repeated full retrains are still capped.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import datetime
+from typing import Dict, List, Mapping, Optional, Tuple
+
+import joblib
+import sklearn
+
+
+MODEL_FILE = "model.joblib"
+METADATA_FILE = "metadata.json"
+CURRENT_FILE = "CURRENT"
+
+
+class ModelStore:
+    """
+    Saves, lists and loads model versions under a directory.
+    """
+
+    def __init__(self, directory: str, keep: int = 10):
+        """
+        Args:
+            directory: Root directory for model versions (created on first save)
+            keep: Number of unpinned versions, and separately of pinned
+                versions, retained; older ones are pruned on save
+        """
+        self.directory = directory
+        self.keep = keep
+
+    def save(self, model, scaler, trained_at: datetime, samples: int, source: str,
+             groups: Optional[Mapping[str, tuple]] = None, scoring: Optional[dict] = None,
+             pinned: bool = False) -> str:
+        """
+        Persist a model (plus optional per-machine-type (model, scaler) pairs
+        and flattened scoring forests, {"model": ..., "groups": {...}}) as a
+        new version, mark it current and return its name. Pinned versions are
+        pruned only against other pinned versions.
+        """
+        groups = dict(groups or {})
+        version = f"{trained_at:%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+        metadata = {
+            "version": version,
+            "trained_at": trained_at.isoformat(),
+            "samples": samples,
+            "source": source,
+            "groups": sorted(groups),
+            "pinned": pinned,
+            "sklearn_version": sklearn.__version__,
+            "saved_at": datetime.now().isoformat(),
+        }
+
+        os.makedirs(self.directory, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=".staging-", dir=self.directory)
+        try:
+            joblib.dump({"model": model, "scaler": scaler, "groups": groups, "scoring": scoring or {}},
+                        os.path.join(staging, MODEL_FILE))
+            with open(os.path.join(staging, METADATA_FILE), "w") as f:
+                json.dump(metadata, f, indent=2)
+            os.rename(staging, os.path.join(self.directory, version))
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        self.set_current(version)
+        self._prune()
+        return version
+
+    def list_versions(self) -> List[dict]:
+        """Metadata for every stored version, newest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        current = self.current_version()
+        versions = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name, METADATA_FILE)
+            if name.startswith(".") or not os.path.isfile(path):
+                continue
+            with open(path) as f:
+                metadata = json.load(f)
+            metadata["active"] = name == current
+            versions.append(metadata)
+        versions.sort(key=lambda m: m["saved_at"], reverse=True)
+        return versions
+
+    def has_version(self, version: str) -> bool:
+        return version in {m["version"] for m in self.list_versions()}
+
+    def current_version(self) -> Optional[str]:
+        path = os.path.join(self.directory, CURRENT_FILE)
+        if not os.path.isfile(path):
+            return None
+        with open(path) as f:
+            return f.read().strip() or None
+
+    def set_current(self, version: str):
+        """Atomically point CURRENT at a version"""
+        fd, tmp = tempfile.mkstemp(prefix=".current-", dir=self.directory)
+        with os.fdopen(fd, "w") as f:
+            f.write(version)
+        os.replace(tmp, os.path.join(self.directory, CURRENT_FILE))
+
+    def load(self, version: Optional[str] = None,
+             mmap: bool = True) -> Tuple[object, object, dict, Dict[str, tuple], dict]:
+        """
+        Load a version (default: CURRENT).
+
+        Returns:
+            Tuple of (model, scaler, metadata, groups, scoring); groups maps
+            machine type to (model, scaler) and is empty for fleet-only
+            versions; scoring holds the flattened forests as saved, or is
+            empty
+        """
+        version = version or self.current_version()
+        if not version or not self.has_version(version):
+            raise FileNotFoundError(f"Model version {version!r} not found")
+
+        path = os.path.join(self.directory, version)
+        payload = joblib.load(os.path.join(path, MODEL_FILE), mmap_mode="r" if mmap else None)
+        with open(os.path.join(path, METADATA_FILE)) as f:
+            metadata = json.load(f)
+        return payload["model"], payload["scaler"], metadata, payload.get("groups", {}), payload.get("scoring", {})
+
+    def _prune(self):
+        """Delete the oldest pinned and unpinned versions beyond `keep` each (never the current one)"""
+        current = self.current_version()
+        versions = self.list_versions()
+        for pinned in (False, True):
+            kind = [metadata for metadata in versions if metadata.get("pinned", False) == pinned]
+            for metadata in kind[self.keep:]:
+                if metadata["version"] != current:
+                    shutil.rmtree(os.path.join(self.directory, metadata["version"]), ignore_errors=True)
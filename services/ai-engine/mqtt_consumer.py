@@ -0,0 +1,241 @@
+"""
+MQTT Consumer
+=============
+Optional direct feed from the broker: subscribes to the simulator / device
+topic (`agritrack/live/sensors`), runs readings through the same ingest and
+detection pipeline as POST /ingest + /detect, and publishes anomalies to an
+alerts topic. Readings skip the HTTP hop and JSON re-encoding entirely.
+
+Micro-batching:
+---------------
+paho-mqtt delivers messages on its own network thread, which only appends the
+raw payload to a pending list. The asyncio task flushes that list as one
+batch when either
+
+- `max_batch` messages are pending, or
+- `max_delay` seconds have passed since the first pending message,
+
+so a quiet fleet still sees sub-second detection latency while a busy one is
+processed in vectorized batches. At most `max_pending` messages are held;
+beyond that new messages are dropped (and counted) until the engine catches
+up.
+
+Requires paho-mqtt >= 2.0 (requirements-mqtt.txt, installed in the Docker
+image). The import is optional, so the engine runs without it when the
+consumer is disabled.
+"""
+
+import asyncio
+import json
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ring_buffer import FLOAT_COLUMNS, MACHINE_ID_BYTES, MISSING_TIMESTAMP
+
+try:
+    import paho.mqtt.client as mqtt
+except ImportError:  # Optional dependency
+    mqtt = None
+
+
+# Handler for a decoded batch: (device_ids, columns) -> alert messages to publish
+BatchHandler = Callable[[List[str], Dict[str, np.ndarray]], List[dict]]
+
+
+def payloads_to_columns(payloads: List[bytes]) -> Tuple[List[str], Dict[str, np.ndarray], int]:
+    """
+    Decode JSON reading payloads (simulator format: id, temp, vib_x, vib_y,
+    vib_z, speed, timestamp in epoch ms; other fields ignored).
+
+    Returns:
+        Tuple of (device_ids, columns, invalid): one device ID per valid
+        reading, column arrays in readings_to_columns() layout, and the number
+        of payloads that were not valid readings
+    """
+    device_ids = []
+    values = []
+    timestamps = []
+    for payload in payloads:
+        try:
+            reading = json.loads(payload)
+            row = [float(reading[col]) for col in FLOAT_COLUMNS]
+            timestamp = reading.get('timestamp')
+            timestamp = MISSING_TIMESTAMP if timestamp is None else int(timestamp)
+            device_id = str(reading['id'])
+        except (ValueError, KeyError, TypeError, AttributeError):
+            continue
+        if not np.isfinite(row).all() or len(device_id.encode()) > MACHINE_ID_BYTES:
+            continue
+        device_ids.append(device_id)
+        values.append(row)
+        timestamps.append(timestamp)
+
+    matrix = np.array(values, dtype=np.float64).reshape(len(values), len(FLOAT_COLUMNS))
+    columns = {col: matrix[:, i] for i, col in enumerate(FLOAT_COLUMNS)}
+    columns['timestamp'] = np.array(timestamps, dtype=np.int64)
+    return device_ids, columns, len(payloads) - len(device_ids)
+
+
+class MqttConsumer:
+    """
+    Subscribes to a sensor topic and feeds micro-batches to a handler on the
+    event loop.
+    """
+
+    def __init__(self, handler: BatchHandler, host: str, port: int = 1883,
+                 topic: str = "agritrack/live/sensors", alerts_topic: Optional[str] = "agritrack/live/alerts",
+                 max_batch: int = 500, max_delay: float = 0.1, max_pending: int = 50000,
+                 qos: int = 1, client_id: Optional[str] = None):
+        """
+        Args:
+            handler: Called on the event loop with each decoded batch; returns
+                alert messages to publish
+            host, port: MQTT broker
+            topic: Sensor topic to subscribe to
+            alerts_topic: Topic alerts are published to (None disables publishing)
+            max_batch: Flush once this many messages are pending
+            max_delay: Flush this many seconds after the first pending message
+            max_pending: Messages held before new ones are dropped
+            qos: Subscription / publish QoS
+            client_id: MQTT client ID (random if None)
+        """
+        if mqtt is None:
+            raise RuntimeError("paho-mqtt is required for the MQTT consumer (pip install -r requirements-mqtt.txt)")
+
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self.topic = topic
+        self.alerts_topic = alerts_topic
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.qos = qos
+        self.client_id = client_id or ""
+
+        self._client = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+        self._pending: List[bytes] = []
+        self._first_at = 0.0
+        self._has_data = asyncio.Event()
+        self._full = asyncio.Event()
+        self._connected = False
+        self._counters = {"received": 0, "processed": 0, "invalid": 0, "dropped": 0,
+                          "batches": 0, "alerts_published": 0, "errors": 0}
+
+    async def start(self):
+        """Connect (in the background, with automatic reconnects) and start batching"""
+        self._loop = asyncio.get_running_loop()
+        client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2, client_id=self.client_id)
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        client.on_message = self._on_message
+        client.reconnect_delay_set(min_delay=1, max_delay=30)
+        client.connect_async(self.host, self.port, keepalive=60)
+        client.loop_start()
+        self._client = client
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Process whatever is still pending, then disconnect"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        with self._lock:
+            payloads, self._pending = self._pending, []
+        self._process_all(payloads)
+        if self._client is not None:
+            self._client.disconnect()
+            self._client.loop_stop()
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {"connected": self._connected, "topic": self.topic, "pending": pending, **self._counters}
+
+    # ───────────────────────────────────────────────────────────────
+    # paho network thread
+    # ───────────────────────────────────────────────────────────────
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            print(f"⚠️ MQTT connection refused: {reason_code}")
+            return
+        self._connected = True
+        # (Re)subscribe on every connect; subscriptions do not survive a reconnect
+        client.subscribe(self.topic, qos=self.qos)
+        print(f"📡 MQTT consumer subscribed to {self.topic} at {self.host}:{self.port}")
+
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties):
+        self._connected = False
+
+    def _on_message(self, client, userdata, message):
+        with self._lock:
+            self._counters["received"] += 1
+            if len(self._pending) >= self.max_pending:
+                self._counters["dropped"] += 1
+                return
+            self._pending.append(message.payload)
+            pending = len(self._pending)
+        # Wake the event loop only when a batch starts or fills up
+        if pending == 1 or pending == self.max_batch:
+            self._loop.call_soon_threadsafe(self._wake, pending)
+
+    # ───────────────────────────────────────────────────────────────
+    # Event loop
+    # ───────────────────────────────────────────────────────────────
+
+    def _wake(self, pending: int):
+        if pending == 1:
+            self._first_at = self._loop.time()
+            self._has_data.set()
+        else:
+            self._full.set()
+
+    async def _run(self):
+        while True:
+            await self._has_data.wait()
+            remaining = self.max_delay - (self._loop.time() - self._first_at)
+            if remaining > 0 and not self._full.is_set():
+                try:
+                    await asyncio.wait_for(self._full.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+
+            with self._lock:
+                payloads, self._pending = self._pending, []
+                self._has_data.clear()
+                self._full.clear()
+            self._process_all(payloads)
+            # Let HTTP requests in between back-to-back batches
+            await asyncio.sleep(0)
+
+    def _process_all(self, payloads: List[bytes]):
+        for start in range(0, len(payloads), self.max_batch):
+            self._process(payloads[start:start + self.max_batch])
+
+    def _process(self, payloads: List[bytes]):
+        device_ids, columns, invalid = payloads_to_columns(payloads)
+        self._counters["invalid"] += invalid
+        if not device_ids:
+            return
+        try:
+            alerts = self.handler(device_ids, columns)
+        except Exception as e:
+            self._counters["errors"] += 1
+            print(f"⚠️ MQTT batch failed ({len(device_ids)} readings): {e}")
+            return
+        self._counters["processed"] += len(device_ids)
+        self._counters["batches"] += 1
+
+        if self.alerts_topic and self._client is not None:
+            for alert in alerts:
+                self._client.publish(self.alerts_topic, json.dumps(alert), qos=self.qos)
+            self._counters["alerts_published"] += len(alerts)
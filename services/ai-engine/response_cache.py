@@ -0,0 +1,126 @@
+"""
+Response Cache
+==============
+TTL + LRU cache for expensive analytics responses, with single-flight
+request coalescing.
+
+Dashboards poll /stats, /efficiency and /fleet/overview every few seconds.
+Entries are keyed by endpoint and parameters:
+
+- A fresh entry is returned without touching the database.
+- On a miss, the value is computed in a task of its own; identical requests
+  that arrive meanwhile await the same task instead of issuing their own
+  query. Cancelling a request (e.g. the client disconnects) only stops that
+  request's wait: the computation finishes for the others and is cached.
+- Entries expire after `ttl` seconds; the least recently used entry is
+  evicted once `max_entries` is reached.
+- invalidate() drops entries explicitly (e.g. from /ingest, for responses
+  computed from the ring buffer). A computation
+  that was in flight during an invalidation still answers its waiters but is
+  not stored, so stale data never outlives the invalidation.
+
+Database load is therefore bounded by the number of distinct keys per TTL,
+not by the number of open dashboards. The cache lives on the event loop and
+is not thread-safe.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class ResponseCache:
+    """
+    Async TTL/LRU cache with single-flight misses.
+    """
+
+    def __init__(self, ttl: float = 10.0, max_entries: int = 256):
+        """
+        Args:
+            ttl: Seconds an entry stays fresh (<= 0 disables storing; misses are still coalesced)
+            max_entries: Maximum number of cached entries (LRU eviction)
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()  # key -> (computed_at, value)
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        # Endpoint (None = all) -> values computed before this time are stale
+        self._stale_before: Dict[Optional[str], float] = {}
+        self._counters = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "invalidations": 0}
+
+    async def get_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for key, computing it at most once per miss"""
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl:
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return entry[1]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self._counters["coalesced"] += 1
+        else:
+            self._counters["misses"] += 1
+            # The computation runs as its own task and every caller, the first
+            # included, awaits it through a shield: a cancelled caller (e.g. a
+            # disconnected client) never cancels it for the others
+            task = asyncio.ensure_future(self._compute(key, compute, time.monotonic()))
+            task.add_done_callback(_retrieve_exception)
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]], started: float) -> Any:
+        try:
+            value = await compute()
+        finally:
+            self._inflight.pop(key, None)
+        if started >= self._cutoff(key):
+            self._store(key, started, value)
+        return value
+
+    def invalidate(self, endpoint: Optional[str] = None, older_than: float = 0.0) -> int:
+        """
+        Drop cached entries.
+
+        Args:
+            endpoint: Only drop keys whose first element is this endpoint (default: all)
+            older_than: Only drop entries computed more than this many seconds ago
+
+        Returns:
+            Number of entries dropped
+        """
+        now = time.monotonic()
+        cutoff = now - older_than
+        self._stale_before[endpoint] = max(self._stale_before.get(endpoint, cutoff), cutoff)
+        stale = [
+            key for key, (computed_at, _) in self._entries.items()
+            if (endpoint is None or (isinstance(key, tuple) and key[0] == endpoint))
+            and computed_at <= cutoff
+        ]
+        for key in stale:
+            del self._entries[key]
+        self._counters["invalidations"] += len(stale)
+        return len(stale)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "inflight": len(self._inflight), "ttl": self.ttl, **self._counters}
+
+    def _cutoff(self, key: Hashable) -> float:
+        endpoint = key[0] if isinstance(key, tuple) else None
+        return max(self._stale_before.get(None, -1.0), self._stale_before.get(endpoint, -1.0))
+
+    def _store(self, key: Hashable, computed_at: float, value: Any):
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        self._entries[key] = (computed_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+
+def _retrieve_exception(task: asyncio.Future):
+    """Mark a failed computation's exception retrieved when every waiter is gone"""
+    if not task.cancelled():
+        task.exception()
@@ -0,0 +1,276 @@
+"""
+Sensor Ring Buffer
+==================
+Fixed-capacity, columnar store for the AI engine's real-time sensor readings.
+
+Layout:
+-------
+Every column (temp, vib_x, vib_y, vib_z, speed, timestamp, machine index) is a
+NumPy array of length 2 * capacity. Each reading is written twice, at position
+`head` and `head + capacity`, so the most recent N readings (N <= capacity)
+always sit in one contiguous slice. That makes appends O(1) and windowed
+reads zero-copy views, regardless of how full the buffer is.
+
+Machine IDs are interned: the buffer stores a small integer per reading and
+keeps the id <-> index mapping on the side.
+
+Shared mode:
+------------
+Given a SharedArrays store (see shared_state), the columns, the write cursor
+and a table of interned IDs live in shared memory, so every worker process
+appends to and reads from the same buffer. Each process keeps a dict cache of
+the ID table and catches up when it meets an index or ID it has not seen.
+Writes take a cross-process lock, and view() returns copies taken under it
+(another worker may overwrite a view's slots at any time). Machine IDs are
+limited to MACHINE_ID_BYTES of UTF-8 and the table to the store's
+max_machines.
+"""
+
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+
+from shared_state import CapacityError, LocalArrays
+
+
+# Stored in the timestamp column when a reading carries no timestamp
+MISSING_TIMESTAMP = -1
+
+FLOAT_COLUMNS = ('temp', 'vib_x', 'vib_y', 'vib_z', 'speed')
+
+# Longest machine ID (UTF-8 bytes) a shared ID table holds
+MACHINE_ID_BYTES = 64
+
+
+def readings_to_columns(readings: List) -> Dict[str, np.ndarray]:
+    """
+    Convert reading objects (id/temp/vib_x/vib_y/vib_z/speed/timestamp attributes,
+    e.g. SensorData) into float and timestamp column arrays.
+    """
+    n = len(readings)
+    columns = {
+        col: np.fromiter((getattr(r, col) for r in readings), dtype=np.float64, count=n)
+        for col in FLOAT_COLUMNS
+    }
+    columns['timestamp'] = np.fromiter(
+        (MISSING_TIMESTAMP if r.timestamp is None else r.timestamp for r in readings),
+        dtype=np.int64, count=n
+    )
+    return columns
+
+
+class SensorRingBuffer:
+    """
+    Columnar ring buffer of sensor readings with interned machine IDs.
+    """
+
+    def __init__(self, capacity: int, arrays=None):
+        """
+        Args:
+            capacity: Maximum number of readings retained (oldest are overwritten)
+            arrays: Array store (default: process-local; see shared_state)
+        """
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        arrays = arrays or LocalArrays()
+
+        self.capacity = capacity
+        self._columns: Dict[str, np.ndarray] = {
+            col: arrays.array(col, 2 * capacity, np.float64) for col in FLOAT_COLUMNS
+        }
+        self._columns['timestamp'] = arrays.array('timestamp', 2 * capacity, np.int64, MISSING_TIMESTAMP)
+        self._columns['machine'] = arrays.array('machine', 2 * capacity, np.int32)
+
+        # [next write position in [0, capacity), number of valid readings]
+        self._cursor = arrays.array('cursor', 2, np.int64)
+        self._lock = arrays.lock('buffer')
+        self._shared = arrays.max_machines is not None
+
+        self._machine_ids: List[str] = []
+        self._machine_lookup: Dict[str, int] = {}
+        self._intern_lock = arrays.lock('machines')
+        if self._shared:
+            self._id_table = arrays.array('machine_ids', arrays.max_machines, f'S{MACHINE_ID_BYTES}')
+            self._id_count = arrays.array('machine_count', 1, np.int64)
+
+    def __len__(self) -> int:
+        return int(self._cursor[1])
+
+    # ───────────────────────────────────────────────────────────────
+    # Machine ID interning
+    # ───────────────────────────────────────────────────────────────
+
+    def intern(self, machine_id: str) -> int:
+        """Return the integer index for a machine ID, allocating one if new"""
+        idx = self._machine_lookup.get(machine_id)
+        if idx is None:
+            # Background jobs (and other workers) intern too; allocate new indices under a lock
+            with self._intern_lock:
+                self._catch_up()
+                idx = self._machine_lookup.get(machine_id)
+                if idx is None:
+                    idx = len(self._machine_ids)
+                    if self._shared:
+                        self._publish(idx, machine_id)
+                    self._machine_ids.append(machine_id)
+                    self._machine_lookup[machine_id] = idx
+        return idx
+
+    def intern_many(self, machine_ids: Iterable[str]) -> np.ndarray:
+        """Interned indices for a sequence of machine IDs"""
+        return np.fromiter((self.intern(mid) for mid in machine_ids), dtype=np.int32)
+
+    def lookup(self, machine_id: str) -> Optional[int]:
+        """Interned index for a machine ID, or None if it has never been seen"""
+        idx = self._machine_lookup.get(machine_id)
+        if idx is None and self._behind():
+            with self._intern_lock:
+                self._catch_up()
+            idx = self._machine_lookup.get(machine_id)
+        return idx
+
+    def machine_id(self, idx: int) -> str:
+        """Resolve an interned index back to its machine ID"""
+        if idx >= len(self._machine_ids) and self._behind():
+            with self._intern_lock:
+                self._catch_up()
+        return self._machine_ids[idx]
+
+    @property
+    def machine_ids(self) -> List[str]:
+        """All machine IDs seen so far, indexed by their interned index"""
+        if self._behind():
+            with self._intern_lock:
+                self._catch_up()
+        return self._machine_ids
+
+    def _behind(self) -> bool:
+        """Whether other workers have interned IDs this process has not cached"""
+        return self._shared and int(self._id_count[0]) > len(self._machine_ids)
+
+    def _catch_up(self):
+        """Cache IDs interned by other workers (caller holds the intern lock)"""
+        if not self._shared:
+            return
+        for idx in range(len(self._machine_ids), int(self._id_count[0])):
+            machine_id = self._id_table[idx].decode()
+            self._machine_ids.append(machine_id)
+            self._machine_lookup[machine_id] = idx
+
+    def _publish(self, idx: int, machine_id: str):
+        """Write a new ID to the shared table (caller holds the intern lock)"""
+        encoded = machine_id.encode()
+        if len(encoded) > MACHINE_ID_BYTES:
+            raise ValueError(f"Machine ID longer than {MACHINE_ID_BYTES} bytes: {machine_id[:80]!r}")
+        if idx >= len(self._id_table):
+            raise CapacityError(f"Shared state holds {len(self._id_table)} machines; raise SHARED_MAX_MACHINES")
+        self._id_table[idx] = encoded
+        self._id_count[0] = idx + 1
+
+    # ───────────────────────────────────────────────────────────────
+    # Writes
+    # ───────────────────────────────────────────────────────────────
+
+    def append(self, machine_id: str, temp: float, vib_x: float, vib_y: float,
+               vib_z: float, speed: float, timestamp: Optional[int] = None):
+        """Append a single reading in O(1)"""
+        idx = self.intern(machine_id)
+        ts = MISSING_TIMESTAMP if timestamp is None else timestamp
+        cols = self._columns
+        cursor = self._cursor
+
+        with self._lock:
+            lo = int(cursor[0])
+            hi = lo + self.capacity
+            for col, value in (('temp', temp), ('vib_x', vib_x), ('vib_y', vib_y), ('vib_z', vib_z),
+                               ('speed', speed), ('timestamp', ts), ('machine', idx)):
+                cols[col][lo] = value
+                cols[col][hi] = value
+
+            cursor[0] = (lo + 1) % self.capacity
+            cursor[1] = min(cursor[1] + 1, self.capacity)
+
+    def extend(self, readings: Iterable) -> int:
+        """
+        Append a batch of readings (objects with id/temp/vib_x/vib_y/vib_z/speed/timestamp
+        attributes, e.g. SensorData). Written column-wise in one pass.
+
+        Returns:
+            Number of readings appended
+        """
+        readings = list(readings)
+        if not readings:
+            return 0
+
+        columns = readings_to_columns(readings)
+        columns['machine'] = self.intern_many(r.id for r in readings)
+        self.extend_columns(columns)
+        return len(readings)
+
+    def extend_columns(self, columns: Dict[str, np.ndarray]):
+        """
+        Append a batch given as column arrays of equal length. The 'machine'
+        column must already hold interned indices.
+        """
+        n = len(columns['temp'])
+        if n == 0:
+            return
+        cursor = self._cursor
+
+        with self._lock:
+            head = int(cursor[0])
+            # Only the newest `capacity` readings can survive the write
+            if n > self.capacity:
+                columns = {col: values[-self.capacity:] for col, values in columns.items()}
+                head = (head + n - self.capacity) % self.capacity
+                n = self.capacity
+
+            positions = (head + np.arange(n)) % self.capacity
+            for col, values in columns.items():
+                self._columns[col][positions] = values
+                self._columns[col][positions + self.capacity] = values
+
+            cursor[0] = (head + n) % self.capacity
+            cursor[1] = min(cursor[1] + n, self.capacity)
+
+    def clear(self):
+        """Drop all readings (interned machine IDs are kept)"""
+        with self._lock:
+            self._cursor[:] = 0
+
+    # ───────────────────────────────────────────────────────────────
+    # Reads
+    # ───────────────────────────────────────────────────────────────
+
+    def view(self, last: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """
+        Zero-copy views over the most recent readings, oldest first (copies
+        in shared mode).
+
+        Args:
+            last: Window size (defaults to every reading in the buffer)
+
+        Returns:
+            Dict of column name -> read-only NumPy array
+        """
+        if self._shared:
+            with self._lock:
+                return self._window(last, copy=True)
+        return self._window(last, copy=False)
+
+    def _window(self, last: Optional[int], copy: bool) -> Dict[str, np.ndarray]:
+        head, size = (int(value) for value in self._cursor)
+        n = size if last is None else max(0, min(last, size))
+        end = head + self.capacity
+        window = {}
+        for col, values in self._columns.items():
+            segment = values[end - n:end]
+            if copy:
+                segment = segment.copy()
+            segment.flags.writeable = False
+            window[col] = segment
+        return window
+
+    @staticmethod
+    def vib_magnitude(window: Dict[str, np.ndarray]) -> np.ndarray:
+        """Vibration magnitude for a window returned by view()"""
+        return np.sqrt(window['vib_x'] ** 2 + window['vib_y'] ** 2 + window['vib_z'] ** 2)
@@ -0,0 +1,253 @@
+"""
+Sensor Rollups
+==============
+Per-device 1-minute and 1-hour aggregates of sensor readings
+(tables `sensor_rollups_1m` / `sensor_rollups_1h`, see
+database/phase7-sensor-rollups.sql).
+
+Every rollup field is additive (counts and sums) or idempotent (min / max),
+so partial aggregates merge in any order:
+
+- Feed: live readings are folded into a RollupAccumulator of 1-minute
+  partials, which is drained to the `merge_sensor_rollups` RPC periodically.
+- Backfill: the `rebuild_sensor_rollups` RPC recomputes whole hours from
+  sensor_logs server-side.
+- Reads: load_rollups() covers a window with 1-minute buckets up to the first
+  hour boundary and 1-hour buckets after it, so a 7-day window is ~170 rows
+  per device instead of every reading.
+
+Contract:
+---------
+Merges are additive, so every reading must reach the rollups exactly once:
+
+- One feed. Only the ingest path named by ROLLUP_FEED feeds the accumulator
+  ("ingest": POST /ingest and /ingest/binary; "mqtt": the MQTT consumer).
+  A device publishing over MQTT while the backend also POSTs its readings
+  to /ingest is then counted once, not twice.
+- Rebuilt hours are closed. sensor_logs is the source of truth: a rebuild
+  replaces an hour's totals with everything logged for it and records the
+  hour, and merge_sensor_rollups drops partials for recorded hours (locking
+  out a concurrent rebuild), so late flushes never add on top of rebuilt
+  totals. A reading that arrives for an hour after its rebuild is counted
+  by the next rebuild of that hour, not by the feed.
+"""
+
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from sensor_reader import RunningStats, iter_keyset
+
+
+# Fields per rollup row, by how they combine
+SUM_FIELDS = (
+    'count', 'active_count', 'idle_count', 'moving_count',
+    'active_speed_sum', 'moving_speed_sum',
+    'temp_count', 'temp_sum', 'temp_sumsq',
+    'speed_count', 'speed_sum', 'speed_sumsq',
+    'vib_sum', 'vib_sumsq',
+)
+MIN_FIELDS = ('temp_min', 'speed_min', 'vib_min')
+MAX_FIELDS = ('temp_max', 'speed_max', 'vib_max')
+ROLLUP_FIELDS = SUM_FIELDS + MIN_FIELDS + MAX_FIELDS
+COUNT_FIELDS = ('count', 'active_count', 'idle_count', 'moving_count', 'temp_count', 'speed_count')
+
+_SUM = slice(0, len(SUM_FIELDS))
+_MIN = slice(len(SUM_FIELDS), len(SUM_FIELDS) + len(MIN_FIELDS))
+_MAX = slice(len(SUM_FIELDS) + len(MIN_FIELDS), len(ROLLUP_FIELDS))
+
+# Same activity thresholds as the analytics endpoints
+ACTIVE_SPEED = 1
+IDLE_VIBRATION = 0.01
+
+
+def aggregate_readings(seconds: np.ndarray, temp: np.ndarray, speed: np.ndarray,
+                       vib: np.ndarray, groups: np.ndarray,
+                       bucket_seconds: int = 60) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Aggregate readings per (group, time bucket).
+
+    Args:
+        seconds: Reading time in seconds since the epoch
+        temp, speed, vib: Metric per reading (NaN temperature / speed are not counted)
+        groups: Integer group (e.g. machine index) per reading
+        bucket_seconds: Bucket width
+
+    Returns:
+        Tuple of (groups, buckets, values): one entry per (group, bucket), with
+        `buckets` as bucket start in epoch seconds and `values` an (n, fields)
+        matrix in ROLLUP_FIELDS order (missing min/max are +/-inf)
+    """
+    buckets = (np.floor(np.asarray(seconds, dtype=np.float64) / bucket_seconds) * bucket_seconds).astype(np.int64)
+    order = np.lexsort((buckets, groups))
+    groups, buckets = np.asarray(groups)[order], buckets[order]
+    temp, speed, vib = temp[order], speed[order], vib[order]
+
+    starts = np.flatnonzero(np.r_[True, (groups[1:] != groups[:-1]) | (buckets[1:] != buckets[:-1])])
+    has_temp = ~np.isnan(temp)
+    has_speed = ~np.isnan(speed)
+    active = speed > ACTIVE_SPEED
+    moving = speed > 0
+
+    def total(values):
+        return np.add.reduceat(np.asarray(values, dtype=np.float64), starts)
+
+    columns = {
+        'count': np.diff(np.r_[starts, len(groups)]).astype(np.float64),
+        'active_count': total(active),
+        'idle_count': total((speed < ACTIVE_SPEED) & (vib > IDLE_VIBRATION)),
+        'moving_count': total(moving),
+        'active_speed_sum': total(np.where(active, speed, 0)),
+        'moving_speed_sum': total(np.where(moving, speed, 0)),
+        'temp_count': total(has_temp),
+        'temp_sum': total(np.where(has_temp, temp, 0)),
+        'temp_sumsq': total(np.where(has_temp, temp * temp, 0)),
+        'speed_count': total(has_speed),
+        'speed_sum': total(np.where(has_speed, speed, 0)),
+        'speed_sumsq': total(np.where(has_speed, speed * speed, 0)),
+        'vib_sum': total(vib),
+        'vib_sumsq': total(vib * vib),
+        'temp_min': np.minimum.reduceat(np.where(has_temp, temp, np.inf), starts),
+        'speed_min': np.minimum.reduceat(np.where(has_speed, speed, np.inf), starts),
+        'vib_min': np.minimum.reduceat(vib, starts),
+        'temp_max': np.maximum.reduceat(np.where(has_temp, temp, -np.inf), starts),
+        'speed_max': np.maximum.reduceat(np.where(has_speed, speed, -np.inf), starts),
+        'vib_max': np.maximum.reduceat(vib, starts),
+    }
+    values = np.column_stack([columns[field] for field in ROLLUP_FIELDS])
+    return groups[starts], buckets[starts], values
+
+
+class RollupAccumulator:
+    """
+    1-minute partial aggregates of live readings, waiting to be merged into
+    the rollup tables. Fed from the event loop, drained from a worker thread.
+    """
+
+    def __init__(self):
+        self._partials: Dict[Tuple[str, int], np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._partials)
+
+    def add(self, device_ids: Sequence[str], seconds: np.ndarray, temp: np.ndarray,
+            speed: np.ndarray, vib: np.ndarray):
+        """Fold a batch of readings in (device_ids holds one ID per reading)"""
+        if not len(seconds):
+            return
+        codes, labels = pd.factorize(pd.Series(device_ids))
+        groups, buckets, values = aggregate_readings(seconds, temp, speed, vib, codes)
+        self.merge({
+            (labels[code], int(bucket)): row
+            for code, bucket, row in zip(groups.tolist(), buckets.tolist(), values)
+        })
+
+    def merge(self, partials: Dict[Tuple[str, int], np.ndarray]):
+        """Combine partial aggregates (e.g. a drained batch that failed to flush) back in"""
+        with self._lock:
+            for key, row in partials.items():
+                current = self._partials.get(key)
+                if current is None:
+                    self._partials[key] = row.copy()
+                else:
+                    current[_SUM] += row[_SUM]
+                    current[_MIN] = np.minimum(current[_MIN], row[_MIN])
+                    current[_MAX] = np.maximum(current[_MAX], row[_MAX])
+
+    def drain(self) -> Dict[Tuple[str, int], np.ndarray]:
+        """Take every pending partial, leaving the accumulator empty"""
+        with self._lock:
+            partials, self._partials = self._partials, {}
+            return partials
+
+    @staticmethod
+    def to_rows(partials: Dict[Tuple[str, int], np.ndarray]) -> List[dict]:
+        """JSON rows for the merge_sensor_rollups RPC"""
+        rows = []
+        for (device_id, bucket), values in partials.items():
+            row = {"device_id": device_id,
+                   "bucket": datetime.fromtimestamp(bucket, tz=timezone.utc).isoformat()}
+            for field, value in zip(ROLLUP_FIELDS, values.tolist()):
+                if np.isinf(value):
+                    value = None
+                elif field in COUNT_FIELDS:
+                    value = int(value)
+                row[field] = value
+            rows.append(row)
+        return rows
+
+
+def load_rollups(db, since: datetime, until: Optional[datetime] = None,
+                 device_id: Optional[str] = None,
+                 columns: Sequence[str] = ROLLUP_FIELDS) -> pd.DataFrame:
+    """
+    Rollup rows covering [since, until): 1-minute buckets up to the first hour
+    boundary, 1-hour buckets after it.
+
+    Args:
+        db: Supabase client
+        since: Window start (naive datetimes are local time, like datetime.now())
+        until: Window end, open-ended if None
+        device_id: Restrict to one device
+        columns: Rollup fields to fetch
+
+    Returns:
+        DataFrame with device_id, bucket and the requested fields (numeric),
+        one row per bucket; empty if nothing was rolled up
+    """
+    since = since.astimezone(timezone.utc)
+    until = until.astimezone(timezone.utc) if until else None
+    first_hour = since.replace(minute=0, second=0, microsecond=0)
+    if first_hour < since:
+        first_hour += timedelta(hours=1)
+    if until is not None and until < first_hour:
+        first_hour = until
+
+    columns = ['device_id', *columns]
+    pieces = [(
+        'sensor_rollups_1m',
+        since.replace(second=0, microsecond=0).isoformat(),
+        first_hour.isoformat()
+    )]
+    if until is None or first_hour < until:
+        pieces.append(('sensor_rollups_1h', first_hour.isoformat(), until.isoformat() if until else None))
+
+    chunks = [
+        chunk
+        for table, start, end in pieces
+        for chunk in iter_keyset(db, table, start, end, columns,
+                                 time_column='bucket', id_column='device_id', device_id=device_id)
+    ]
+    if not chunks:
+        return pd.DataFrame(columns=[*columns, 'bucket'])
+
+    df = pd.concat(chunks, ignore_index=True)
+    fields = [c for c in columns if c != 'device_id']
+    df[fields] = df[fields].apply(pd.to_numeric)
+    return df
+
+
+def combine_rollups(df: pd.DataFrame) -> pd.DataFrame:
+    """Per-device totals of rollup rows (indexed by device_id, order of first appearance)"""
+    aggregations = {
+        field: 'sum' if field in SUM_FIELDS else 'min' if field in MIN_FIELDS else 'max'
+        for field in ROLLUP_FIELDS if field in df.columns
+    }
+    return df.groupby('device_id', sort=False).agg(aggregations)
+
+
+def total_rollups(df: pd.DataFrame) -> pd.Series:
+    """Fleet-wide totals of rollup rows"""
+    return combine_rollups(df.assign(device_id='*')).iloc[0]
+
+
+def rollup_stats(totals: pd.Series, prefix: str, count_field: str) -> RunningStats:
+    """RunningStats for one metric (temp / speed / vib) from combined rollup fields"""
+    return RunningStats.from_sums(
+        totals[count_field], totals[f'{prefix}_min'], totals[f'{prefix}_max'],
+        totals[f'{prefix}_sum'], totals[f'{prefix}_sumsq']
+    )
@@ -0,0 +1,211 @@
+"""
+Sensor Log Reader
+=================
+Keyset-paginated, streaming access to the `sensor_logs` table.
+
+PostgREST (and Supabase's max-rows setting) caps how many rows one request can
+return, so a single `.limit(10000)` query silently truncates long windows.
+This reader walks the window in pages ordered by (timestamp, id) and resumes
+each page strictly after the last row seen:
+
+    timestamp > last_ts  OR  (timestamp = last_ts AND id > last_id)
+
+which stays stable under concurrent inserts and never re-reads or skips rows
+that share a timestamp (newest-first walks mirror it with <). Each page is
+yielded as a DataFrame holding only the requested columns, so callers can
+aggregate or sample the full window with bounded memory. The
+(timestamp, id) index from database/phase9-keyset-indexes.sql makes every
+page an index range scan.
+"""
+
+import os
+from typing import Any, Callable, Iterator, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from db_executor import check_deadline
+
+
+SENSOR_PAGE_SIZE = int(os.getenv("SENSOR_PAGE_SIZE", 1000))
+
+
+def iter_sensor_logs(db, since: str, until: Optional[str] = None,
+                     columns: Sequence[str] = ('device_id', 'temperature', 'vibration_x',
+                                               'vibration_y', 'vibration_z', 'speed'),
+                     device_id: Optional[str] = None,
+                     page_size: int = SENSOR_PAGE_SIZE,
+                     newest_first: bool = False) -> Iterator[pd.DataFrame]:
+    """
+    Yield `sensor_logs` rows in [since, until) as DataFrame chunks, oldest
+    first (or newest first).
+
+    Args:
+        db: Supabase client
+        since: ISO timestamp (inclusive)
+        until: ISO timestamp (exclusive), open-ended if None
+        columns: Columns to fetch; `timestamp` and `id` are always included
+        device_id: Restrict to one device
+        page_size: Rows requested per round trip
+        newest_first: Walk the window backwards, e.g. to read only its
+            most recent rows
+
+    Yields:
+        DataFrame per page with the requested columns plus timestamp and id
+    """
+    return iter_keyset(db, 'sensor_logs', since, until, columns,
+                       time_column='timestamp', id_column='id',
+                       device_id=device_id, page_size=page_size, descending=newest_first)
+
+
+def iter_keyset(db, table: str, since: str, until: Optional[str], columns: Sequence[str],
+                time_column: str, id_column: str, device_id: Optional[str] = None,
+                page_size: int = SENSOR_PAGE_SIZE, descending: bool = False) -> Iterator[pd.DataFrame]:
+    """
+    Keyset-paginate any time-series table on (time_column, id_column).
+
+    Same contract as iter_sensor_logs(); `time_column` and `id_column` are
+    always fetched.
+    """
+    select = ', '.join(dict.fromkeys([*columns, time_column, id_column]))
+
+    def query():
+        query = db.table(table).select(select).gte(time_column, since)
+        if until:
+            query = query.lt(time_column, until)
+        if device_id:
+            query = query.eq('device_id', device_id)
+        return query
+
+    return iter_pages(query, time_column, id_column, page_size, descending)
+
+
+def iter_pages(query: Callable[[], Any], key_column: str, tie_column: Optional[str] = None,
+               page_size: int = SENSOR_PAGE_SIZE, descending: bool = False) -> Iterator[pd.DataFrame]:
+    """
+    Keyset-paginate any PostgREST query, a table select or a set-returning
+    RPC, ordered by (key_column, tie_column). The resume filter applies to
+    the query's output, so an aggregating RPC would recompute its whole
+    result per page; those take the resume key as arguments instead (see
+    aggregates.py).
+
+    Args:
+        query: Builds a fresh filtered query per page
+        key_column: Leading sort key
+        tie_column: Breaks ties in key_column; None if key_column is unique
+        page_size: Rows requested per round trip
+        descending: Walk the order backwards (resuming strictly before the
+            last row seen)
+
+    Yields:
+        DataFrame per page
+
+    Raises:
+        DatabaseTimeout: Run on the DatabaseExecutor, past the call's timeout
+    """
+    last_key = last_tie = None
+    past = 'lt' if descending else 'gt'
+
+    while True:
+        # Stop once the executor call running this loop has timed out
+        check_deadline()
+        page = query()
+        if last_key is not None and tie_column is None:
+            page = getattr(page, past)(key_column, last_key)
+        elif last_key is not None:
+            page = page.or_(
+                f'{key_column}.{past}."{last_key}",'
+                f'and({key_column}.eq."{last_key}",{tie_column}.{past}."{last_tie}")'
+            )
+        page = page.order(key_column, desc=descending)
+        if tie_column is not None:
+            page = page.order(tie_column, desc=descending)
+
+        response = page.limit(page_size).execute()
+        rows = response.data or []
+
+        # Stop on an empty page rather than a short one: the server may cap
+        # pages below page_size
+        if not rows:
+            return
+
+        yield pd.DataFrame(rows)
+
+        last_key = rows[-1][key_column]
+        if tie_column is not None:
+            last_tie = rows[-1][tie_column]
+
+
+def vib_magnitude(df: pd.DataFrame) -> pd.Series:
+    """Vibration magnitude for a sensor_logs frame (missing axes count as 0)"""
+    return np.sqrt(
+        df['vibration_x'].fillna(0)**2 +
+        df['vibration_y'].fillna(0)**2 +
+        df['vibration_z'].fillna(0)**2
+    )
+
+
+class RunningStats:
+    """
+    Streaming count / min / max / mean / variance, merged chunk by chunk
+    (Chan et al. parallel variance), so a whole window can be summarised
+    without holding it in memory.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    @classmethod
+    def from_sums(cls, count: int, minimum: float, maximum: float,
+                  total: float, total_sq: float) -> 'RunningStats':
+        """Build from pre-aggregated count / min / max / sum / sum of squares (e.g. rollups)"""
+        stats = cls()
+        if count:
+            stats.count = int(count)
+            stats.min = float(minimum)
+            stats.max = float(maximum)
+            stats.mean = total / count
+            stats._m2 = max(0.0, total_sq - total * total / count)
+        return stats
+
+    def update(self, values: np.ndarray):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        n = len(values)
+        if n == 0:
+            return
+
+        chunk_mean = values.mean()
+        chunk_m2 = ((values - chunk_mean) ** 2).sum()
+        total = self.count + n
+        delta = chunk_mean - self.mean
+
+        self.mean += delta * n / total
+        self._m2 += chunk_m2 + delta**2 * self.count * n / total
+        self.count = total
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+    @property
+    def std(self) -> float:
+        """Sample standard deviation (ddof=1, same as pandas; 0 for a single value)"""
+        return float(np.sqrt(self._m2 / (self.count - 1))) if self.count > 1 else 0.0
+
+    def summary(self, digits: int, include_std: bool = False) -> dict:
+        if not self.count:
+            result = {"min": 0, "max": 0, "avg": 0}
+            if include_std:
+                result["std"] = 0
+            return result
+        result = {
+            "min": round(float(self.min), digits),
+            "max": round(float(self.max), digits),
+            "avg": round(float(self.mean), digits),
+        }
+        if include_std:
+            result["std"] = round(self.std, digits + 1)
+        return result
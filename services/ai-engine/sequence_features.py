@@ -0,0 +1,205 @@
+"""
+Sequence Features
+=================
+Windowed features that give the anomaly model a sense of how a machine got
+to its current reading, not just where it is: a temperature climbing 2 °C a
+minute or a bearing starting to rattle can look perfectly normal one reading
+at a time.
+
+For every reading, over the machine's last `window` readings (the reading
+itself included):
+
+    temp_rate          least-squares temperature slope, °C per minute
+    temp_std           temperature standard deviation
+    vib_{x,y,z}_rms    per-axis vibration RMS
+    vib_{x,y,z}_p2p    per-axis vibration peak-to-peak
+    vib_band_*         RMS amplitude of the vibration magnitude in the low,
+                       mid and high thirds of the window's spectrum (rfft,
+                       DC removed)
+
+Windows:
+--------
+The readings of all machines arrive interleaved, so MachineWindows keeps the
+last `window - 1` readings of every machine in arrays indexed by its
+interned index (see SensorRingBuffer.intern). A batch is laid out as one
+contiguous segment per machine,
+
+    [ machine's stored history | machine's readings in this batch ]
+
+and np.lib.stride_tricks.sliding_window_view() over that layout yields every
+reading's window as a view; the features are then a handful of reductions
+over an (n, window) array. There is no per-reading or per-machine Python
+loop. The history arrays come from an array store (see shared_state), so
+worker processes can share them.
+
+Until a machine has `window` readings its windows are incomplete and its
+features are NaN: fit_anomaly_model() and the detector substitute the
+training mean, so such readings are judged on their instantaneous values
+alone. (A machine's first reading fills the missing slots so the arithmetic
+stays finite.)
+"""
+
+from typing import Dict
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from shared_state import CapacityError, LocalArrays
+
+
+# Columns kept per machine ('seconds' is the reading time, epoch seconds)
+CHANNELS = ('temp', 'vib_x', 'vib_y', 'vib_z', 'seconds')
+
+N_BANDS = 3
+
+FEATURE_NAMES = (
+    'temp_rate', 'temp_std',
+    'vib_x_rms', 'vib_y_rms', 'vib_z_rms',
+    'vib_x_p2p', 'vib_y_p2p', 'vib_z_p2p',
+    'vib_band_low', 'vib_band_mid', 'vib_band_high',
+)
+
+
+def window_features(windows: Dict[str, np.ndarray]) -> np.ndarray:
+    """
+    Features of reading windows.
+
+    Args:
+        windows: Channel name (see CHANNELS) -> (n, window) array, one row per
+            reading, oldest first and ending at the reading itself
+
+    Returns:
+        (n, len(FEATURE_NAMES)) array
+    """
+    temp = windows['temp']
+    n = len(temp)
+
+    # Relative to the newest reading, so epoch-sized times keep their precision
+    t = windows['seconds'] - windows['seconds'][:, -1:]
+    t = t - t.mean(axis=1, keepdims=True)
+    t_var = (t ** 2).sum(axis=1)
+    covariance = (t * (temp - temp.mean(axis=1, keepdims=True))).sum(axis=1)
+    rate = np.divide(covariance * 60, t_var, out=np.zeros(n), where=t_var > 0)
+
+    axes = [windows[col] for col in ('vib_x', 'vib_y', 'vib_z')]
+    features = [rate, temp.std(axis=1)]
+    features += [np.sqrt((values ** 2).mean(axis=1)) for values in axes]
+    features += [np.ptp(values, axis=1) for values in axes]
+
+    magnitude = np.sqrt(axes[0] ** 2 + axes[1] ** 2 + axes[2] ** 2)
+    spectrum = np.fft.rfft(magnitude - magnitude.mean(axis=1, keepdims=True), axis=1)
+    power = spectrum.real ** 2 + spectrum.imag ** 2
+    for band in np.array_split(power[:, 1:], N_BANDS, axis=1):
+        features.append(np.sqrt(2 * band.sum(axis=1)) / magnitude.shape[1])
+
+    return np.column_stack(features)
+
+
+class MachineWindows:
+    """
+    Per-machine reading history and sliding-window features.
+    """
+
+    def __init__(self, window: int = 16, initial_machines: int = 64, arrays=None):
+        """
+        Args:
+            window: Readings per window, including the current one
+            initial_machines: Initial array capacity (grows as machines appear)
+            arrays: Array store (default: process-local; see shared_state)
+        """
+        if window < 2 * N_BANDS + 2:
+            raise ValueError(f"window must be at least {2 * N_BANDS + 2} readings")
+
+        arrays = arrays or LocalArrays()
+        self.window = window
+        self._fixed_capacity = arrays.max_machines is not None
+        self._capacity = arrays.max_machines or initial_machines
+        self._lock = arrays.lock('windows')
+        self._history = {col: arrays.array(col, (self._capacity, window - 1)) for col in CHANNELS}
+        self._count = arrays.array('count', self._capacity, np.int64)
+
+    def update(self, machines: np.ndarray, columns: Dict[str, np.ndarray],
+               seconds: np.ndarray) -> np.ndarray:
+        """
+        Features for a batch, then fold its readings into the history.
+
+        Args:
+            machines: Interned machine index per reading, in arrival order
+            columns: Column arrays with keys temp, vib_x, vib_y, vib_z
+            seconds: Reading time per reading, epoch seconds
+
+        Returns:
+            (n, len(FEATURE_NAMES)) array, one row per reading in input order
+            (NaN rows for readings whose window is not yet full)
+        """
+        return self._features(machines, columns, seconds, keep=True)
+
+    def score_batch(self, machines: np.ndarray, columns: Dict[str, np.ndarray],
+                    seconds: np.ndarray) -> np.ndarray:
+        """
+        Like update(), without changing the stored history. Earlier readings
+        of the same machine in the batch still count towards later windows.
+        """
+        return self._features(machines, columns, seconds, keep=False)
+
+    def machine_count(self) -> int:
+        """Number of machines with a history"""
+        with self._lock:
+            return int(np.count_nonzero(self._count))
+
+    def _features(self, machines: np.ndarray, columns: Dict[str, np.ndarray],
+                  seconds: np.ndarray, keep: bool) -> np.ndarray:
+        machines = np.asarray(machines, dtype=np.int64)
+        n = len(machines)
+        if n == 0:
+            return np.zeros((0, len(FEATURE_NAMES)))
+
+        history = self.window - 1
+        order = np.argsort(machines, kind='stable')
+        codes, first, counts = np.unique(machines[order], return_index=True, return_counts=True)
+
+        # Combined layout: machine s occupies [first[s] + history * s, + history
+        # + counts[s]); the j-th sorted reading lands at j + history * (s + 1)
+        segment = np.repeat(np.arange(len(codes)), counts)
+        reading_pos = np.arange(n) + history * (segment + 1)
+        history_pos = (first + history * np.arange(len(codes)))[:, None] + np.arange(history)
+        window_start = reading_pos - history
+
+        windows = {}
+        with self._lock:
+            self._ensure_capacity(int(codes[-1]) + 1)
+            before = self._count[codes]
+            new = before == 0
+            for col in CHANNELS:
+                values = np.asarray(seconds if col == 'seconds' else columns[col], dtype=np.float64)[order]
+                stored = self._history[col][codes]
+                stored[new] = values[first[new], None]
+
+                combined = np.empty(n + history * len(codes))
+                combined[history_pos] = stored
+                combined[reading_pos] = values
+                windows[col] = sliding_window_view(combined, self.window)[window_start]
+                if keep:
+                    # Newest `history` values of each segment become the stored history
+                    self._history[col][codes] = combined[history_pos + counts[:, None]]
+            if keep:
+                self._count[codes] += counts
+
+        features = window_features(windows)
+        # Readings of the machine so far, this one included
+        readings = before[segment] + np.arange(n) - first[segment] + 1
+        features[readings < self.window] = np.nan
+        result = np.empty((n, len(FEATURE_NAMES)))
+        result[order] = features
+        return result
+
+    def _ensure_capacity(self, needed: int):
+        if needed <= self._capacity:
+            return
+        if self._fixed_capacity:
+            raise CapacityError(f"Shared windows hold {self._capacity} machines; raise SHARED_MAX_MACHINES")
+        size = max(needed, 2 * self._capacity)
+        for col, array in self._history.items():
+            self._history[col] = np.concatenate([array, np.zeros((size - self._capacity, array.shape[1]))])
+        self._count = np.concatenate([self._count, np.zeros(size - self._capacity, dtype=np.int64)])
+        self._capacity = size
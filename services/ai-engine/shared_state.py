@@ -0,0 +1,199 @@
+"""
+Shared State
+============
+Storage for the engine's per-machine state (ring buffer and interned machine
+IDs, drift baselines, sequence windows, trend statistics, online reservoir,
+open alerts), so several worker processes can serve one fleet consistently.
+
+Stateful components allocate their arrays and locks through an array store:
+
+    LocalArrays     plain NumPy arrays and threading locks, for a single
+                    process (the default); arrays grow as machines appear
+    SharedArrays    one .npy file per array in a directory on a shared-memory
+                    filesystem (/dev/shm), memory-mapped by every worker, and
+                    locks that exclude other processes as well as threads
+
+Shared arrays cannot be reallocated under the other workers, so their
+capacity is fixed: per-machine arrays have `max_machines` rows, and a
+machine beyond that is refused with CapacityError.
+
+Creation:
+---------
+The first process to ask for an array creates it (filled with its initial
+value) under a store-wide lock and renames it into place; later processes map
+the existing file.
+
+Every process attached to a store holds a shared flock on `.attached.lock`
+for as long as it lives. A process that attaches while nobody else holds it
+is the first of a new run: files left in the directory belong to a run whose
+processes have all exited, and are deleted before anything is mapped. That
+holds however the workers are started (`python main.py`, the uvicorn CLI
+with --workers, a restarted container), and a worker respawned next to live
+ones attaches to their state. A file whose shape or dtype differs while
+other processes are attached is an error.
+
+Locks are fcntl.flock() locks on files in the same directory, taken together
+with a threading.Lock (flock alone does not exclude threads sharing the
+process's file descriptor). POSIX only, like /dev/shm.
+"""
+
+import copy
+import fcntl
+import glob
+import os
+import threading
+from typing import Optional, Tuple, Union
+
+import numpy as np
+
+
+Shape = Union[int, Tuple[int, ...]]
+
+
+class CapacityError(RuntimeError):
+    """A fixed-capacity store has no room for another machine"""
+
+
+class LocalArrays:
+    """
+    Process-local array store: NumPy arrays and threading locks.
+    """
+
+    max_machines: Optional[int] = None  # unbounded: components grow their arrays
+
+    def array(self, name: str, shape: Shape, dtype=np.float64, fill=0) -> np.ndarray:
+        return np.full(shape, fill, dtype=dtype)
+
+    def lock(self, name: str) -> threading.Lock:
+        return threading.Lock()
+
+    def scope(self, prefix: str) -> "LocalArrays":
+        return self
+
+
+class SharedLock:
+    """
+    Mutual exclusion across the threads of this process and other processes
+    (usable like threading.Lock).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if not self._thread_lock.acquire(blocking):
+            return False
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._thread_lock.release()
+            return False
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        return True
+
+    def release(self):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+    def __enter__(self) -> "SharedLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class SharedArrays:
+    """
+    Array store backed by memory-mapped files shared between processes.
+    """
+
+    def __init__(self, directory: str, max_machines: int, prefix: str = ""):
+        """
+        Args:
+            directory: Directory for the array and lock files (ideally on
+                tmpfs, e.g. under /dev/shm); created if missing
+            max_machines: Rows of every per-machine array
+            prefix: Prepended to array and lock names (see scope())
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_machines = max_machines
+        self._prefix = prefix
+        self._create_lock = SharedLock(os.path.join(directory, ".create.lock"))
+        self._attached = os.open(os.path.join(directory, ".attached.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        with self._create_lock:
+            try:
+                fcntl.flock(self._attached, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                pass  # Other processes are attached: join their state
+            else:
+                # First process of a new run: drop what a previous run left
+                self._clear(directory)
+            fcntl.flock(self._attached, fcntl.LOCK_SH)
+
+    def array(self, name: str, shape: Shape, dtype=np.float64, fill=0) -> np.ndarray:
+        """Map the named array, creating and filling it if no process has yet"""
+        shape = (shape,) if isinstance(shape, int) else tuple(shape)
+        dtype = np.dtype(dtype)
+        path = os.path.join(self.directory, f"{self._prefix}{name}.npy")
+        with self._create_lock:
+            if not os.path.exists(path):
+                staging = f"{path}.{os.getpid()}.tmp"
+                created = np.lib.format.open_memmap(staging, mode="w+", dtype=dtype, shape=shape)
+                if fill:
+                    # New files read as zeros; leaving them untouched keeps tmpfs pages unallocated
+                    created[...] = fill
+                created.flush()
+                del created
+                os.replace(staging, path)
+            mapped = np.lib.format.open_memmap(path, mode="r+")
+        if mapped.shape != shape or mapped.dtype != dtype:
+            raise ValueError(
+                f"Shared array {path} is {mapped.dtype}{mapped.shape}, expected {dtype}{shape}: "
+                f"it belongs to another configuration; clear {self.directory}"
+            )
+        # A plain ndarray view: memmap's subclass hooks would tax every operation
+        return np.asarray(mapped)
+
+    def lock(self, name: str) -> SharedLock:
+        return SharedLock(os.path.join(self.directory, f"{self._prefix}{name}.lock"))
+
+    def scope(self, prefix: str) -> "SharedArrays":
+        """The same store with names prefixed, one scope per component"""
+        scoped = copy.copy(self)
+        scoped._prefix = f"{self._prefix}{prefix}."
+        return scoped
+
+    @staticmethod
+    def _clear(directory: str):
+        """Delete the array and lock files of a previous run (caller holds the store's locks)"""
+        for pattern in ("*.npy", "*.tmp", "*.lock"):
+            for path in glob.glob(os.path.join(directory, pattern)):
+                os.remove(path)
+
+
+class LeaderLock:
+    """
+    Held by at most one process at a time, for as long as that process
+    lives (the kernel releases it when the process exits).
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self.held = False
+
+    def try_acquire(self) -> bool:
+        """Take the lock if it is free; True if this process holds it"""
+        if not self.held:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self.held = True
+            except BlockingIOError:
+                pass
+        return self.held
@@ -0,0 +1,482 @@
+"""
+Streaming Trend Statistics
+==========================
+Per-machine running regression statistics, updated on every ingested batch,
+so trend slopes, forecasts and time-to-threshold (via trends.trend_alerts)
+are O(1) lookups instead of a database query plus a regression fit.
+
+Time grid:
+----------
+Like trends.py, the regression runs on real time resampled onto a fixed grid:
+readings are averaged per `bin_seconds` bin and each bin is one point at its
+centre time (in days). Each machine keeps its newest bin "open" while readings
+for it keep arriving; once a newer bin starts, the open one is folded into the
+running state. Empty bins (device offline, lower publish rate) contribute
+nothing. Queries fold the open bin into a copy, so results are always current.
+
+State:
+------
+For every (metric, variant) pair the store keeps arrays indexed by the
+machine's interned index (see SensorRingBuffer.intern):
+
+    W         total weight (grid points for the plain variant)
+    mean_x    weighted mean of x (bin centre, days since the epoch)
+    mean_y    weighted mean of the metric
+    c_xy      co-moment Σw(x - x̄)(y - ȳ)
+    m_xx      Σw(x - x̄)²
+    m_yy      Σw(y - ȳ)²
+
+These are the centered form of (n, Σx, Σy, Σxy, Σx², Σy²): the same
+sufficient statistics, without the cancellation error of raw power sums over
+long histories. Two variants are kept: "full" (every point weighs 1) and
+"decayed" (weights shrink by `decay` per grid step of age, so old behaviour
+fades at the same rate in wall-clock time whatever the publish rate).
+
+The arrays and the lock come from an array store (see shared_state), so
+worker processes can share them.
+
+Rebuilds:
+---------
+The state is periodically rebuilt from a replay of stored readings, which
+takes a while on a live stream. begin_rebuild() fixes a cutoff at the start
+of the current grid bin and, until end_rebuild(), also collects every update
+from the cutoff on into a second store (seeded with the current bin's
+readings so far). The replay covers readings before the cutoff, so the two
+hold disjoint grid points; end_rebuild() loads the replayed state in place
+(swapping objects would only update one process) and merges the collected
+points into it with the same parallel-update formulas.
+
+Points are folded in with one grouped pass: per-machine batch statistics are
+built with bincount and merged into the running state with the weighted
+parallel-update formulas.
+"""
+
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from shared_state import CapacityError, LocalArrays
+from trends import DAY_SECONDS, DEFAULT_BIN_SECONDS
+
+
+STAT_FIELDS = ('W', 'mean_x', 'mean_y', 'c_xy', 'm_xx', 'm_yy')
+VARIANTS = ('full', 'decayed')
+
+# Open-bin marker for machines without readings
+NO_BIN = -1
+
+
+class StreamingTrendStats:
+    """
+    Running per-machine regression state for a set of metrics.
+    """
+
+    def __init__(self, metrics: Sequence[str] = ('temperature', 'vib_magnitude'),
+                 decay: float = 0.998, bin_seconds: float = DEFAULT_BIN_SECONDS,
+                 initial_machines: int = 64, arrays=None):
+        """
+        Args:
+            metrics: Metric names tracked per machine
+            decay: Per-grid-step weight decay for the "decayed" variant (0 < decay <= 1)
+            bin_seconds: Grid resolution readings are averaged onto
+            initial_machines: Initial array capacity (grows as machines appear)
+            arrays: Array store (default: process-local; see shared_state)
+        """
+        arrays = arrays or LocalArrays()
+        self._array_store = arrays
+        self.metrics = tuple(metrics)
+        self.decay = decay
+        self.bin_seconds = bin_seconds
+        self._fixed_capacity = arrays.max_machines is not None
+        self._capacity = n = arrays.max_machines or initial_machines
+        self._lock = arrays.lock('trends')
+
+        self._stats = {
+            (metric, variant): {field: arrays.array(f'{metric}.{variant}.{field}', n) for field in STAT_FIELDS}
+            for metric in self.metrics for variant in VARIANTS
+        }
+        # Newest folded bin per machine; decayed weights are relative to it
+        self._ref_bin = {metric: arrays.array(f'{metric}.ref_bin', n, np.int64) for metric in self.metrics}
+        # Newest bin, still accumulating readings
+        self._open_bin = {metric: arrays.array(f'{metric}.open_bin', n, np.int64, NO_BIN) for metric in self.metrics}
+        self._open_sum = {metric: arrays.array(f'{metric}.open_sum', n) for metric in self.metrics}
+        self._open_n = {metric: arrays.array(f'{metric}.open_n', n) for metric in self.metrics}
+        # Non-NaN readings seen per machine and metric
+        self._count = {metric: arrays.array(f'{metric}.count', n, np.int64) for metric in self.metrics}
+        # Running rebuild: its id, and the first bin the replay leaves to the
+        # collected updates (NO_BIN when none runs); see begin_rebuild()
+        self._rebuild_id = arrays.array('rebuild_id', 1, np.int64)
+        self._rebuild_from = arrays.array('rebuild_from', 1, np.int64, NO_BIN)
+        self._collected: Optional["StreamingTrendStats"] = None
+
+    # ───────────────────────────────────────────────────────────────
+    # Updates
+    # ───────────────────────────────────────────────────────────────
+
+    def update(self, machines: np.ndarray, seconds: np.ndarray, values: Dict[str, np.ndarray]):
+        """
+        Fold a batch of readings into the running state.
+
+        Args:
+            machines: Interned machine index per reading
+            seconds: Reading time in seconds since the epoch
+            values: Metric name -> value per reading (NaNs are skipped)
+        """
+        machines = np.asarray(machines, dtype=np.int64)
+        if not len(machines):
+            return
+        bins = np.floor(np.asarray(seconds, dtype=np.float64) / self.bin_seconds).astype(np.int64)
+
+        with self._lock:
+            self._ensure_capacity(int(machines.max()) + 1)
+            for metric in self.metrics:
+                y = np.asarray(values[metric], dtype=np.float64)
+                valid = ~np.isnan(y)
+                self._update_metric(metric, machines[valid], bins[valid], y[valid])
+
+            rebuild_from = int(self._rebuild_from[0])
+            if rebuild_from != NO_BIN:
+                # Past the running replay's cutoff: kept for end_rebuild()
+                late = bins >= rebuild_from
+                self._collected_store().update(
+                    machines[late], np.asarray(seconds, dtype=np.float64)[late],
+                    {metric: np.asarray(values[metric], dtype=np.float64)[late] for metric in self.metrics}
+                )
+
+    def _update_metric(self, metric: str, codes: np.ndarray, bins: np.ndarray, y: np.ndarray):
+        if not len(codes):
+            return
+        n = self._capacity
+        open_bin, open_sum, open_n = self._open_bin[metric], self._open_sum[metric], self._open_n[metric]
+
+        # Group readings by (machine, bin), oldest bin first within each machine
+        order = np.lexsort((bins, codes))
+        codes, bins, y = codes[order], bins[order], y[order]
+        starts = np.r_[True, (codes[1:] != codes[:-1]) | (bins[1:] != bins[:-1])]
+        slot = np.cumsum(starts) - 1
+        g_code, g_bin = codes[starts], bins[starts]
+        g_sum = np.bincount(slot, weights=y)
+        g_n = np.bincount(slot).astype(np.float64)
+
+        # A group landing in its machine's open bin absorbs it
+        absorbs = g_bin == open_bin[g_code]
+        g_sum[absorbs] += open_sum[g_code[absorbs]]
+        g_n[absorbs] += open_n[g_code[absorbs]]
+        absorbed = np.zeros(n, dtype=bool)
+        absorbed[g_code[absorbs]] = True
+
+        # Each machine's newest group becomes its open bin, unless the batch is
+        # entirely older than the current open bin (late readings)
+        newest = np.r_[g_code[1:] != g_code[:-1], True]
+        opens = newest & (g_bin >= open_bin[g_code])
+        opened = g_code[opens]
+        self._count[metric] += np.bincount(codes, minlength=n)
+
+        # Closed points: every non-open group, plus open bins that were superseded
+        superseded = opened[(open_bin[opened] != NO_BIN) & ~absorbed[opened]]
+        self._fold(
+            metric,
+            np.concatenate([g_code[~opens], superseded]),
+            np.concatenate([g_bin[~opens], open_bin[superseded]]),
+            np.concatenate([g_sum[~opens] / g_n[~opens], open_sum[superseded] / open_n[superseded]]),
+        )
+
+        open_bin[opened] = g_bin[opens]
+        open_sum[opened] = g_sum[opens]
+        open_n[opened] = g_n[opens]
+
+    def _fold(self, metric: str, codes: np.ndarray, bins: np.ndarray, y: np.ndarray,
+              stats: Optional[Dict[str, dict]] = None, ref_bin: Optional[np.ndarray] = None):
+        """Merge grid points into the running state (or into the given copies of it, indexed like ref_bin)"""
+        if not len(codes):
+            return
+        n = self._capacity if ref_bin is None else len(ref_bin)
+        if stats is None:
+            stats = {variant: self._stats[(metric, variant)] for variant in VARIANTS}
+            ref_bin = self._ref_bin[metric]
+
+        touched = np.bincount(codes, minlength=n) > 0
+        newest = ref_bin.copy()
+        np.maximum.at(newest, codes, bins)
+        x = (bins + 0.5) * self.bin_seconds / DAY_SECONDS
+
+        for variant in VARIANTS:
+            decay = self.decay if variant == 'decayed' else 1.0
+            # The newest point weighs 1, one a grid step older `decay`, and so on
+            weights = decay ** (newest[codes] - bins).astype(np.float64)
+            batch = self._batch_stats(codes, x, y, weights, n)
+            carry = decay ** (newest - ref_bin).astype(np.float64)
+            self._merge(stats[variant], batch, carry, touched)
+
+        ref_bin[:] = newest
+
+    @staticmethod
+    def _batch_stats(codes: np.ndarray, x: np.ndarray, y: np.ndarray,
+                     w: np.ndarray, n: int) -> Dict[str, np.ndarray]:
+        W = np.bincount(codes, weights=w, minlength=n)
+        safe_W = np.where(W > 0, W, 1)
+        mean_x = np.bincount(codes, weights=w * x, minlength=n) / safe_W
+        mean_y = np.bincount(codes, weights=w * y, minlength=n) / safe_W
+        dx = x - mean_x[codes]
+        dy = y - mean_y[codes]
+        return {
+            'W': W,
+            'mean_x': mean_x,
+            'mean_y': mean_y,
+            'c_xy': np.bincount(codes, weights=w * dx * dy, minlength=n),
+            'm_xx': np.bincount(codes, weights=w * dx * dx, minlength=n),
+            'm_yy': np.bincount(codes, weights=w * dy * dy, minlength=n),
+        }
+
+    @staticmethod
+    def _merge(state: Dict[str, np.ndarray], batch: Dict[str, np.ndarray],
+               carry: np.ndarray, touched: np.ndarray):
+        """Weighted parallel merge of batch statistics into state (in place)"""
+        t = touched
+        W_old = state['W'][t] * carry[t]
+        W_new = W_old + batch['W'][t]
+        share = batch['W'][t] / W_new
+        dx = batch['mean_x'][t] - state['mean_x'][t]
+        dy = batch['mean_y'][t] - state['mean_y'][t]
+        cross = W_old * share  # W_old * W_batch / W_new
+
+        state['c_xy'][t] = state['c_xy'][t] * carry[t] + batch['c_xy'][t] + dx * dy * cross
+        state['m_xx'][t] = state['m_xx'][t] * carry[t] + batch['m_xx'][t] + dx * dx * cross
+        state['m_yy'][t] = state['m_yy'][t] * carry[t] + batch['m_yy'][t] + dy * dy * cross
+        state['mean_x'][t] += dx * share
+        state['mean_y'][t] += dy * share
+        state['W'][t] = W_new
+
+    # ───────────────────────────────────────────────────────────────
+    # Rebuilds
+    # ───────────────────────────────────────────────────────────────
+
+    def begin_rebuild(self, now: float) -> Tuple[int, float]:
+        """
+        Start rebuilding the state from a replay of stored readings; from now
+        until end_rebuild(), updates past the cutoff are also collected. A new
+        rebuild supersedes an unfinished one (e.g. of a process that exited).
+
+        Args:
+            now: Current time in seconds since the epoch
+
+        Returns:
+            Tuple of (rebuild id, cutoff): the replay should cover readings
+            before the cutoff (seconds since the epoch, the start of the
+            current grid bin)
+        """
+        cutoff_bin = int(np.floor(now / self.bin_seconds))
+        with self._lock:
+            collected = self._collected_store()
+            collected._clear()
+            collected._ensure_capacity(self._capacity)
+            for metric in self.metrics:
+                # The current bin's readings so far are past the cutoff too
+                current = np.flatnonzero(self._open_bin[metric] >= cutoff_bin)
+                collected._open_bin[metric][current] = self._open_bin[metric][current]
+                collected._open_sum[metric][current] = self._open_sum[metric][current]
+                collected._open_n[metric][current] = self._open_n[metric][current]
+                collected._count[metric][current] = self._open_n[metric][current].astype(np.int64)
+            self._rebuild_id[0] += 1
+            self._rebuild_from[0] = cutoff_bin
+            return int(self._rebuild_id[0]), cutoff_bin * self.bin_seconds
+
+    def end_rebuild(self, rebuild: int, fresh: Optional["StreamingTrendStats"] = None) -> bool:
+        """
+        Finish a rebuild: overwrite this state in place with `fresh` (the
+        replay, same metrics) merged with the updates collected since
+        begin_rebuild(). With fresh=None the rebuild is abandoned.
+
+        Returns:
+            False if a newer rebuild superseded this one (nothing changes)
+        """
+        if fresh is not None and fresh.metrics != self.metrics:
+            raise ValueError(f"Metrics differ: {fresh.metrics} vs {self.metrics}")
+        machines, source = 0, {}
+        if fresh is not None:
+            with fresh._lock:
+                seen = np.flatnonzero(sum(fresh._count[m] for m in fresh.metrics))
+                machines = int(seen[-1]) + 1 if len(seen) else 0
+                source = {name: values[:machines].copy() for name, values in fresh._arrays().items()}
+
+        with self._lock:
+            if int(self._rebuild_id[0]) != rebuild or int(self._rebuild_from[0]) == NO_BIN:
+                return False
+            self._rebuild_from[0] = NO_BIN
+            if fresh is None:
+                return True
+
+            collected = self._collected_store()
+            self._ensure_capacity(max(machines, collected._capacity))
+            for name, values in self._arrays().items():
+                values[:machines] = source[name]
+                values[machines:] = NO_BIN if name.endswith('.open_bin') else 0
+            for metric in self.metrics:
+                self._merge_collected(metric, collected)
+            return True
+
+    def _merge_collected(self, metric: str, collected: "StreamingTrendStats"):
+        """Merge a rebuild's collected updates, all newer than the replay, into the state (caller holds the lock)"""
+        n = self._capacity
+        live = np.flatnonzero(collected._open_bin[metric] != NO_BIN)
+        if not len(live):
+            return
+
+        # The replay's newest bins precede every collected point: close them
+        closing = live[self._open_bin[metric][live] != NO_BIN]
+        self._fold(metric, closing, self._open_bin[metric][closing],
+                   self._open_sum[metric][closing] / self._open_n[metric][closing])
+
+        # Collected grid points, rescaled to a common reference bin per machine
+        ref_bin = self._ref_bin[metric]
+        folded = live[collected._stats[(metric, 'full')]['W'][live] > 0]
+        newest = np.maximum(ref_bin[folded], collected._ref_bin[metric][folded])
+        touched = np.zeros(n, dtype=bool)
+        touched[folded] = True
+        for variant in VARIANTS:
+            decay = self.decay if variant == 'decayed' else 1.0
+            carry = np.ones(n)
+            carry[folded] = decay ** (newest - ref_bin[folded]).astype(np.float64)
+            scale = decay ** (newest - collected._ref_bin[metric][folded]).astype(np.float64)
+            batch = {}
+            for field, values in collected._stats[(metric, variant)].items():
+                batch[field] = np.zeros(n)
+                batch[field][folded] = values[folded] if field.startswith('mean') else values[folded] * scale
+            self._merge(self._stats[(metric, variant)], batch, carry, touched)
+        ref_bin[folded] = newest
+
+        # The collected open bins are the newest
+        self._open_bin[metric][live] = collected._open_bin[metric][live]
+        self._open_sum[metric][live] = collected._open_sum[metric][live]
+        self._open_n[metric][live] = collected._open_n[metric][live]
+        self._count[metric][:collected._capacity] += collected._count[metric]
+
+    def _collected_store(self) -> "StreamingTrendStats":
+        """Where a rebuild collects updates (created on first use; shared like this state)"""
+        if self._collected is None:
+            self._collected = StreamingTrendStats(
+                self.metrics, self.decay, self.bin_seconds, initial_machines=self._capacity,
+                arrays=self._array_store.scope('rebuild')
+            )
+        return self._collected
+
+    def _clear(self):
+        for name, values in self._arrays().items():
+            values[:] = NO_BIN if name.endswith('.open_bin') else 0
+
+    def _arrays(self) -> Dict[str, np.ndarray]:
+        """Every state array, by name"""
+        arrays = {
+            f'{metric}.{variant}.{field}': values
+            for (metric, variant), state in self._stats.items() for field, values in state.items()
+        }
+        for name in ('ref_bin', 'open_bin', 'open_sum', 'open_n', 'count'):
+            for metric, values in getattr(self, f'_{name}').items():
+                arrays[f'{metric}.{name}'] = values
+        return arrays
+
+    def _ensure_capacity(self, needed: int):
+        if needed <= self._capacity:
+            return
+        if self._fixed_capacity:
+            raise CapacityError(f"Shared trend stats hold {self._capacity} machines; raise SHARED_MAX_MACHINES")
+        size = max(needed, 2 * self._capacity)
+        grow = size - self._capacity
+
+        def extend(array: np.ndarray, fill) -> np.ndarray:
+            return np.concatenate([array, np.full(grow, fill, dtype=array.dtype)])
+
+        for state in self._stats.values():
+            for field in STAT_FIELDS:
+                state[field] = extend(state[field], 0)
+        for metric in self.metrics:
+            self._ref_bin[metric] = extend(self._ref_bin[metric], 0)
+            self._open_bin[metric] = extend(self._open_bin[metric], NO_BIN)
+            self._open_sum[metric] = extend(self._open_sum[metric], 0)
+            self._open_n[metric] = extend(self._open_n[metric], 0)
+            self._count[metric] = extend(self._count[metric], 0)
+        self._capacity = size
+
+    # ───────────────────────────────────────────────────────────────
+    # Queries
+    # ───────────────────────────────────────────────────────────────
+
+    def _current(self, metric: str, machine: Optional[int] = None) -> Dict[str, dict]:
+        """
+        Copies of both variants' state with the open bins folded in: for
+        every machine, or only row `machine` as length-1 arrays (caller
+        holds the lock)
+        """
+        rows = slice(None) if machine is None else slice(machine, machine + 1)
+        stats = {
+            variant: {field: values[rows].copy() for field, values in self._stats[(metric, variant)].items()}
+            for variant in VARIANTS
+        }
+        open_bin = self._open_bin[metric][rows]
+        has_open = np.flatnonzero(open_bin != NO_BIN)
+        self._fold(
+            metric, has_open, open_bin[has_open],
+            self._open_sum[metric][rows][has_open] / self._open_n[metric][rows][has_open],
+            stats=stats, ref_bin=self._ref_bin[metric][rows].copy()
+        )
+        return stats
+
+    def _last(self, metric: str, machine: Optional[int] = None) -> np.ndarray:
+        """Mean of each machine's (or row `machine`'s) newest bin, NaN without readings (caller holds the lock)"""
+        rows = slice(None) if machine is None else slice(machine, machine + 1)
+        open_sum, open_n = self._open_sum[metric][rows], self._open_n[metric][rows]
+        return np.divide(open_sum, open_n, out=np.full(len(open_n), np.nan), where=open_n > 0)
+
+    def trends(self, metric: str, variant: str = 'full') -> Dict[str, np.ndarray]:
+        """
+        Fleet-wide trend arrays, indexed by machine index, in the same shape
+        as trends.linear_trends(): count (grid points), slope (per day), last
+        (newest bin mean), x_mean, y_mean; plus readings (raw reading count).
+        """
+        with self._lock:
+            current = self._current(metric)
+            state = current[variant]
+            points = np.rint(current['full']['W']).astype(np.int64)
+            slope = np.divide(state['c_xy'], state['m_xx'],
+                              out=np.zeros(self._capacity), where=state['m_xx'] > 0)
+            return {
+                "count": points,
+                "slope": slope,
+                "last": self._last(metric),
+                "x_mean": state['mean_x'],
+                "y_mean": state['mean_y'],
+                "readings": self._count[metric].copy(),
+            }
+
+    def regression(self, machine: int, metric: str, variant: str = 'full') -> Optional[dict]:
+        """
+        Regression summary for one machine.
+
+        Returns:
+            Dict with readings, points, slope (per day), x_mean (days since the
+            epoch), mean, variance and last (newest bin mean), or None if the machine has no readings
+        """
+        with self._lock:
+            if machine >= self._capacity or self._count[metric][machine] == 0:
+                return None
+            # Only this machine's slot: the fleet-wide fold is O(machines)
+            current = self._current(metric, machine)
+            s = {field: float(values[0]) for field, values in current[variant].items()}
+            points = int(round(current['full']['W'][0]))
+            readings = int(self._count[metric][machine])
+            last = float(self._last(metric, machine)[0])
+
+        return {
+            "readings": readings,
+            "points": points,
+            "slope": s['c_xy'] / s['m_xx'] if s['m_xx'] > 0 else 0.0,
+            "x_mean": s['mean_x'],
+            "mean": s['mean_y'],
+            "variance": s['m_yy'] / s['W'] if s['W'] > 0 else 0.0,
+            "last": last,
+        }
+
+    def machine_count(self) -> int:
+        """Number of machines with at least one reading"""
+        with self._lock:
+            return int(np.count_nonzero(sum(self._count[m] for m in self.metrics)))
@@ -0,0 +1,83 @@
+import pandas as pd
+
+from aggregates import _rpc_pages, alert_counts, trend_grid, window_totals
+from rollups import ROLLUP_FIELDS
+
+
+class Response:
+    def __init__(self, data):
+        self.data = data
+
+
+class Call:
+    def __init__(self, data):
+        self.data = data
+
+    def execute(self):
+        return Response(self.data)
+
+
+class PagedRpc:
+    """Answers an aggregating RPC from precomputed rows sorted by `keys`, honouring p_after_* and p_limit"""
+
+    def __init__(self, rows, keys, after_params):
+        self.rows = rows
+        self.keys = keys
+        self.after_params = after_params
+        self.calls = []
+
+    def rpc(self, name, params):
+        self.calls.append(params)
+        after = tuple(params.get(param) for param in self.after_params)
+        rows = self.rows
+        if after[0] is not None:
+            rows = [row for row in rows if tuple(row[key] for key in self.keys) > after]
+        return Call(rows[:params['p_limit']])
+
+
+def _totals_row(device_id):
+    return {'device_id': device_id, **{field: 1 for field in ROLLUP_FIELDS}}
+
+
+def test_window_totals_pages_with_resume_key_and_limit():
+    devices = [f"m{i:04d}" for i in range(2500)]
+    db = PagedRpc([_totals_row(d) for d in devices], ('device_id',), ('p_after_device_id',))
+
+    totals = window_totals(db, "2025-01-01T00:00:00")
+
+    assert totals.index.tolist() == devices
+    # Three pages of at most SENSOR_PAGE_SIZE devices, then an empty page
+    assert [call.get('p_after_device_id') for call in db.calls] == [None, "m0999", "m1999", "m2499"]
+    assert all(call['p_limit'] == 1000 for call in db.calls)
+    assert all(call['p_since'] == "2025-01-01T00:00:00" for call in db.calls)
+
+
+def test_trend_grid_resumes_after_device_and_bin():
+    rows = [{'device_id': d, 'bin': b, 'readings': 3, 'temp_mean': 60.0, 'vib_mean': 0.1}
+            for d in ("a", "b") for b in (100, 101, 102)]
+    db = PagedRpc(rows, ('device_id', 'bin'), ('p_after_device_id', 'p_after_bin'))
+
+    grid = pd.concat(_rpc_pages(db, 'sensor_trend_grid', {}, lambda row: {
+        'p_after_device_id': row['device_id'], 'p_after_bin': row['bin']}, page_size=4))
+
+    assert list(zip(grid['device_id'], grid['bin'])) == [(r['device_id'], r['bin']) for r in rows]
+    assert (db.calls[1]['p_after_device_id'], db.calls[1]['p_after_bin']) == ("b", 100)
+    assert trend_grid(PagedRpc([], ('device_id', 'bin'), ('p_after_device_id',)), "t", 60).empty
+
+
+def test_paging_stops_after_a_null_key():
+    rows = [{'machine_id': "m1", 'count': 1, 'critical_count': 0, 'type_counts': {}},
+            {'machine_id': None, 'count': 2, 'critical_count': 1, 'type_counts': {}}]
+
+    class NullLast(PagedRpc):
+        def rpc(self, name, params):
+            self.calls.append(params)
+            # A NULL resume key would restart from the first row
+            return Call(rows if params.get('p_after_machine_id') is None else [])
+
+    db = NullLast(rows, ('machine_id',), ('p_after_machine_id',))
+
+    counts = alert_counts(db, "t")
+
+    assert counts['count'].tolist() == [1, 2]
+    assert len(db.calls) == 1
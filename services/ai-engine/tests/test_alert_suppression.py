@@ -0,0 +1,83 @@
+import numpy as np
+
+from alert_suppression import AlertSuppressor
+
+CRITICAL = {"anomaly_type": "overheat_critical", "severity": "critical", "anomaly_score": 1.0,
+            "details": "CRITICAL: Temperature 105.0°C exceeds 100°C"}
+
+
+def _run(suppressor, readings):
+    """Feed (seconds, anomalous) readings of machine 0 one at a time; returns (transition, seconds) pairs"""
+    transitions = []
+    for seconds, anomalous in readings:
+        indices = np.array([0] if anomalous else [], dtype=np.int64)
+        rows = [CRITICAL] if anomalous else []
+        for t in suppressor.observe(np.array([0]), np.array([seconds], dtype=float), indices, rows):
+            transitions.append((t["transition"], t["timestamp"] // 1000))
+    return transitions
+
+
+def _suppressor():
+    return AlertSuppressor(lambda machine: f"m{machine}", resolve_after=60, cooldown=300)
+
+
+def test_reopen_within_cooldown_is_announced_once_cooldown_passes():
+    # Critical for 30 s, normal for 90 s (resolves), then critical for 2 h
+    readings = [(t, t < 30 or t >= 120) for t in range(0, 120 + 7200, 3)]
+    suppressor = _suppressor()
+
+    transitions = _run(suppressor, readings)
+
+    assert transitions == [("opened", 0), ("resolved", 87), ("opened", 300)]
+    (alert,) = suppressor.open_alerts()
+    assert alert["severity"] == "critical"
+
+
+def test_flapping_within_cooldown_stays_silent():
+    # Critical for 30 s, normal for 90 s, critical for 30 s, normal again
+    readings = [(t, t < 30 or 120 <= t < 150) for t in range(0, 240, 3)]
+    suppressor = _suppressor()
+
+    transitions = _run(suppressor, readings)
+
+    assert transitions == [("opened", 0), ("resolved", 87)]
+    assert suppressor.stats()["open"] == 0
+
+
+WARNING = {"anomaly_type": "overheat", "severity": "warning", "anomaly_score": 0.2,
+           "details": "Temperature 95.0°C exceeds 90°C threshold"}
+
+
+def test_sustained_anomaly_opens_one_alert():
+    # Critical for an hour, one reading every 3 s
+    readings = [(t, True) for t in range(0, 3600, 3)]
+    suppressor = _suppressor()
+
+    transitions = _run(suppressor, readings)
+
+    assert transitions == [("opened", 0)]
+    (alert,) = suppressor.open_alerts()
+    assert alert["occurrences"] == 1200
+    assert suppressor.stats()["suppressed"] == 1199
+
+
+def test_critical_variant_escalates_the_open_base_alert():
+    suppressor = _suppressor()
+    machines = np.array([0])
+
+    opened = suppressor.observe(machines, np.array([0.0]), np.array([0]), [WARNING])
+    escalated = suppressor.observe(machines, np.array([3.0]), np.array([0]), [CRITICAL])
+    repeated = suppressor.observe(machines, np.array([6.0]), np.array([0]), [WARNING])
+
+    assert [t["transition"] for t in opened + escalated + repeated] == ["opened", "escalated"]
+    assert escalated[0]["anomaly_type"] == "overheat"
+    assert escalated[0]["severity"] == "critical"
+
+
+def test_machines_are_tracked_independently():
+    suppressor = _suppressor()
+
+    transitions = suppressor.observe(np.array([0, 1, 0, 1]), np.array([0.0, 0.0, 3.0, 3.0]),
+                                     np.array([0, 1, 2, 3]), [CRITICAL] * 4)
+
+    assert [(t["machine_id"], t["transition"]) for t in transitions] == [("m0", "opened"), ("m1", "opened")]
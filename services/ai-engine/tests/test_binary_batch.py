@@ -0,0 +1,79 @@
+import struct
+
+import numpy as np
+import pytest
+
+from binary_batch import MAGIC, READING_DTYPE, VERSION, BatchFormatError, decode_batch, encode_batch
+from ring_buffer import MACHINE_ID_BYTES, MISSING_TIMESTAMP
+
+
+def _encode(machine_ids, timestamp=None):
+    n = len(machine_ids)
+    return encode_batch(machine_ids, temp=np.arange(n) + 60.0, vib_x=np.full(n, 0.1), vib_y=np.full(n, 0.2),
+                        vib_z=np.full(n, 0.3), speed=np.arange(n, dtype=float), timestamp=timestamp)
+
+
+def test_round_trip():
+    body = _encode(["b", "a", "b", "ü-3"], timestamp=[1000, None, 3000, 4000])
+
+    dictionary, columns, machines = decode_batch(body)
+
+    assert [dictionary[i] for i in machines.tolist()] == ["b", "a", "b", "ü-3"]
+    assert columns['temp'].tolist() == [60.0, 61.0, 62.0, 63.0]
+    assert columns['speed'].tolist() == [0.0, 1.0, 2.0, 3.0]
+    assert columns['timestamp'].tolist() == [1000, MISSING_TIMESTAMP, 3000, 4000]
+    assert not columns['temp'].flags.writeable
+
+
+def test_empty_batch():
+    dictionary, columns, machines = decode_batch(_encode([]))
+
+    assert dictionary == []
+    assert len(machines) == 0 and len(columns['temp']) == 0
+
+
+def test_rejects_bad_header():
+    body = _encode(["a"])
+
+    with pytest.raises(BatchFormatError):
+        decode_batch(body[:8])
+    with pytest.raises(BatchFormatError):
+        decode_batch(b"XXXX" + body[4:])
+    with pytest.raises(BatchFormatError):
+        decode_batch(body[:4] + struct.pack("<H", VERSION + 1) + body[6:])
+
+
+def test_rejects_truncated_and_padded_bodies():
+    body = _encode(["a", "b"])
+
+    with pytest.raises(BatchFormatError):
+        decode_batch(body[:-1])
+    with pytest.raises(BatchFormatError):
+        decode_batch(body + bytes(READING_DTYPE.itemsize))
+
+
+def test_rejects_machine_index_outside_the_dictionary():
+    records = np.zeros(1, dtype=READING_DTYPE)
+    records['machine'] = 1
+    text = b"a"
+    body = struct.pack("<4sHHII", MAGIC, VERSION, 0, 1, len(text)) + text + bytes(7) + records.tobytes()
+
+    with pytest.raises(BatchFormatError, match="dictionary"):
+        decode_batch(body)
+
+
+def test_rejects_non_finite_values():
+    body = encode_batch(["a"], temp=[np.nan], vib_x=[0.0], vib_y=[0.0], vib_z=[0.0], speed=[0.0])
+
+    with pytest.raises(BatchFormatError, match="temp"):
+        decode_batch(body)
+
+
+def test_rejects_oversized_machine_ids():
+    with pytest.raises(BatchFormatError):
+        decode_batch(_encode(["x" * (MACHINE_ID_BYTES + 1)]))
+
+
+def test_encode_rejects_newlines_in_machine_ids():
+    with pytest.raises(ValueError):
+        _encode(["a\nb"])
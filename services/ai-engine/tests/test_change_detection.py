@@ -0,0 +1,127 @@
+import numpy as np
+import pytest
+
+from change_detection import MachineBaselines
+
+
+def _baselines(**kwargs):
+    params = dict(metrics=('temperature',), alpha=0.1, cusum_k=0.5, cusum_h=4.0, z_threshold=6.0,
+                  clip=3.0, warmup=2, min_std={'temperature': 1.0})
+    params.update(kwargs)
+    return MachineBaselines(**params)
+
+
+def _feed(baselines, machines, temperatures, speed=10.0):
+    machines = np.asarray(machines)
+    values = {'temperature': np.asarray(temperatures, dtype=np.float64)}
+    return baselines.update(machines, values, np.full(len(machines), speed))['temperature']
+
+
+def test_warmup_is_a_running_mean_and_flags_nothing():
+    baselines = _baselines(warmup=3)
+
+    result = _feed(baselines, [0, 0, 0], [10.0, 20.0, 30.0])
+    state = baselines.machine_state(0)['temperature']
+
+    np.testing.assert_array_equal(result['z'], [0, 0, 0])
+    assert not result['flag'].any()
+    np.testing.assert_array_equal(result['baseline'], [np.nan, 10.0, 15.0])
+    # Mean and (population) variance of 10, 20, 30
+    assert state['readings'] == 3 and state['warm']
+    assert state['mean'] == pytest.approx(20.0)
+    assert state['std'] == pytest.approx(np.sqrt(200 / 3))
+
+    # First warm reading: z against the warm-up baseline, then an EWMA step of max(alpha, 1/4)
+    result = _feed(baselines, [0], [40.0])
+    state = baselines.machine_state(0)['temperature']
+
+    assert result['z'][0] == pytest.approx(20 / np.sqrt(200 / 3))
+    assert result['cusum'][0] == pytest.approx(20 / np.sqrt(200 / 3) - 0.5)
+    assert state['mean'] == pytest.approx(25.0)
+    assert state['std'] == pytest.approx(np.sqrt(0.75 * (200 / 3 + 0.25 * 400)))
+
+
+def test_small_excursion_is_learned_with_a_clipped_residual():
+    baselines = _baselines(clip=0.5)
+    _feed(baselines, [0, 0], [50.0, 50.0])  # mean 50, variance 0: std is the 1.0 floor
+
+    result = _feed(baselines, [0], [51.0])
+    state = baselines.machine_state(0)['temperature']
+
+    assert result['z'][0] == pytest.approx(1.0)
+    assert result['cusum'][0] == pytest.approx(0.5)
+    # In control (0.5 <= h/2): weight 1/3, residual clipped to 0.5 * std = 0.5
+    assert state['mean'] == pytest.approx(50 + 0.5 / 3)
+    assert state['std'] == pytest.approx(np.sqrt((2 / 3) * (0.25 / 3)))
+
+
+def test_baseline_freezes_while_out_of_control_then_restarts_at_the_change_point():
+    baselines = _baselines()
+    _feed(baselines, [0, 0], [50.0, 50.0])
+
+    # z = 3: cusum 2.5 is past h/2 = 2, so the baseline stops learning
+    first = _feed(baselines, [0], [53.0])
+    frozen = baselines.machine_state(0)['temperature']
+
+    assert first['cusum'][0] == pytest.approx(2.5) and not first['flag'][0]
+    assert frozen['mean'] == pytest.approx(50.0) and frozen['std'] == 0.0
+    assert frozen['cusum'] == pytest.approx(2.5) and frozen['readings'] == 3
+
+    # cusum 5.0 > h: reported once, and the baseline restarts at the current reading
+    second = _feed(baselines, [0], [53.0])
+    restarted = baselines.machine_state(0)['temperature']
+
+    assert second['cusum'][0] == pytest.approx(5.0) and second['flag'][0]
+    assert second['baseline'][0] == pytest.approx(50.0)
+    assert restarted == {"readings": 1, "mean": 53.0, "std": 0.0, "cusum": 0.0, "warm": False}
+
+    # The new level is the reference: warming up again, then nothing to report
+    after = _feed(baselines, [0, 0, 0], [53.0, 53.0, 53.0])
+
+    np.testing.assert_array_equal(after['z'], [0, 0, 0])
+    assert not after['flag'].any()
+    assert baselines.machine_state(0)['temperature']['mean'] == pytest.approx(53.0)
+
+
+def test_single_spike_is_flagged_by_z_without_a_change_point():
+    baselines = _baselines(cusum_h=100.0)
+    _feed(baselines, [0, 0], [50.0, 50.0])
+
+    result = _feed(baselines, [0], [57.0])
+    state = baselines.machine_state(0)['temperature']
+
+    assert result['z'][0] == pytest.approx(7.0) and result['flag'][0]
+    # Learned with the residual clipped to 3 std: mean moves by 3 / 3 = 1
+    assert state['mean'] == pytest.approx(51.0) and state['readings'] == 3
+
+
+def test_machines_keep_separate_state_in_mixed_batches():
+    interleaved = _baselines(warmup=3)
+    _feed(interleaved, [0, 1, 0, 1, 0, 1], [10.0, 100.0, 20.0, 200.0, 30.0, 300.0])
+    # Machine 0 drifts up; machine 1 holds its level
+    drift = _feed(interleaved, [1, 0], [200.0, 60.0])
+
+    separate = _baselines(warmup=3)
+    _feed(separate, [0, 0, 0], [10.0, 20.0, 30.0])
+    _feed(separate, [1, 1, 1], [100.0, 200.0, 300.0])
+    _feed(separate, [0], [60.0])
+    _feed(separate, [1], [200.0])
+
+    for machine in (0, 1):
+        got = interleaved.machine_state(machine)['temperature']
+        expected = separate.machine_state(machine)['temperature']
+        assert got == pytest.approx(expected)
+    assert drift['z'][0] == pytest.approx(0.0)
+    assert drift['z'][1] == pytest.approx(40 / np.sqrt(200 / 3))
+    assert interleaved.machine_state(1)['temperature']['cusum'] == 0.0
+    assert interleaved.machine_state(2) is None
+    assert interleaved.machine_count() == 2
+
+
+def test_idle_readings_are_not_scored():
+    baselines = _baselines()
+
+    result = _feed(baselines, [0, 0, 0], [50.0, 90.0, 10.0], speed=0.0)
+
+    assert baselines.machine_state(0) is None
+    assert not result['flag'].any() and np.isnan(result['baseline']).all()
@@ -0,0 +1,79 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from db_executor import DatabaseExecutor, DatabaseTimeout, check_deadline
+
+
+def test_slow_call_times_out_stops_at_its_next_check_and_frees_the_pool():
+    pages = []
+    stopped = threading.Event()
+
+    def paging():
+        try:
+            for page in range(100):
+                check_deadline()
+                pages.append(page)
+                time.sleep(0.02)
+        finally:
+            stopped.set()
+
+    async def run():
+        executor = DatabaseExecutor(max_workers=1, timeout=0.1)
+        started = time.monotonic()
+        with pytest.raises(DatabaseTimeout) as raised:
+            await executor.run(paging)
+        waited = time.monotonic() - started
+        assert await asyncio.to_thread(stopped.wait, 5)
+        after = await executor.run(lambda: "still usable", timeout=1)
+        return raised.value, waited, after, executor.stats()
+
+    error, waited, after, stats = asyncio.run(run())
+
+    assert error.status_code == 504 and error.detail == "Database query timed out after 0.1s"
+    assert waited < 0.5
+    # The worker gave up at its first check past the deadline, not after 100 pages
+    assert 0 < len(pages) < 20
+    assert after == "still usable"
+    assert stats["timeouts"] == 1 and stats["in_flight"] == 0 and stats["errors"] == 0
+
+
+def test_work_queued_past_its_deadline_never_starts():
+    release = threading.Event()
+    ran = []
+
+    async def run():
+        executor = DatabaseExecutor(max_workers=1, timeout=5)
+        blocker = asyncio.ensure_future(executor.run(release.wait))
+        await asyncio.sleep(0.05)
+        with pytest.raises(DatabaseTimeout):
+            await executor.run(ran.append, "queued", timeout=0.05)
+        release.set()
+        await blocker
+        # The timed-out call reaches the front of the queue only now, then bails out
+        return await executor.run(lambda: len(ran))
+
+    assert asyncio.run(run()) == 0
+
+
+def test_check_deadline_does_nothing_outside_the_executor():
+    check_deadline()
+
+
+def test_gather_returns_results_in_call_order_and_raises_the_first_failure():
+    def fail():
+        raise RuntimeError("query failed")
+
+    async def run():
+        executor = DatabaseExecutor(max_workers=4)
+        results = await executor.gather(lambda: (time.sleep(0.05), "slow")[1], lambda: "fast")
+        with pytest.raises(RuntimeError):
+            await executor.gather(lambda: "ok", fail)
+        return results, executor.stats()
+
+    results, stats = asyncio.run(run())
+
+    assert results == ["slow", "fast"]
+    assert stats["errors"] == 1 and stats["calls"] == 4
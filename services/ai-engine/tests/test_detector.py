@@ -0,0 +1,92 @@
+import numpy as np
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+
+from detector import detect_batch, find_anomalies
+
+
+def _reference(temp, vib_x, vib_y, vib_z, speed, model=None, scaler=None):
+    """The per-reading /detect loop the vectorized detector replaced"""
+    vib_magnitude = np.sqrt(vib_x**2 + vib_y**2 + vib_z**2)
+    is_anomaly, anomaly_type, details, anomaly_score, severity = False, None, "", 0.0, "warning"
+
+    if temp > 100:
+        is_anomaly, anomaly_type, anomaly_score, severity = True, "overheat_critical", 1.0, "critical"
+        details = f"CRITICAL: Temperature {temp}°C exceeds 100°C"
+    elif temp > 90:
+        is_anomaly, anomaly_type, anomaly_score = True, "overheat", min(1.0, (temp - 90) / 30)
+        details = f"Temperature {temp}°C exceeds 90°C threshold"
+    elif vib_magnitude > 0.7:
+        is_anomaly, anomaly_type, anomaly_score, severity = True, "vibration_critical", 1.0, "critical"
+        details = f"CRITICAL: Vibration {vib_magnitude:.3f} indicates mechanical failure"
+    elif vib_magnitude > 0.5:
+        is_anomaly, anomaly_type, anomaly_score = True, "vibration", min(1.0, vib_magnitude / 1.0)
+        details = f"High vibration {vib_magnitude:.3f} - check machinery"
+    elif speed < 1 and vib_magnitude > 0.02:
+        is_anomaly, anomaly_type, anomaly_score, severity = True, "idle", 0.3, "info"
+        details = f"Machine idle with engine running (speed={speed}, vib={vib_magnitude:.3f})"
+
+    if model is not None and not is_anomaly:
+        features_scaled = scaler.transform(np.array([[temp, vib_magnitude, speed]]))
+        prediction = model.predict(features_scaled)[0]
+        score = -model.score_samples(features_scaled)[0]
+        if prediction == -1:
+            is_anomaly, anomaly_type = True, "ml_detected"
+            anomaly_score = min(1.0, score / 0.5)
+            details = f"ML model detected unusual pattern (score={score:.3f})"
+            severity = "warning" if score < 0.3 else "critical"
+
+    return {"is_anomaly": is_anomaly, "anomaly_score": round(anomaly_score, 3), "anomaly_type": anomaly_type,
+            "details": details, "severity": severity}
+
+
+def _batch(n, seed):
+    rng = np.random.default_rng(seed)
+    return {
+        'temp': np.round(rng.uniform(40, 110, n), 1),
+        'vib_x': rng.uniform(0, 0.5, n),
+        'vib_y': rng.uniform(0, 0.4, n),
+        'vib_z': rng.uniform(0, 0.3, n),
+        'speed': np.where(rng.random(n) < 0.3, 0.0, np.round(rng.uniform(0, 20, n), 1)),
+    }
+
+
+def _model(seed=0):
+    rng = np.random.default_rng(seed)
+    features = np.column_stack([rng.normal(65, 8, 2000), rng.uniform(0, 0.4, 2000), rng.uniform(0, 20, 2000)])
+    scaler = StandardScaler().fit(features)
+    return IsolationForest(contamination=0.1, random_state=42).fit(scaler.transform(features)), scaler
+
+
+def _reference_rows(columns, model=None, scaler=None):
+    return [
+        _reference(*(float(columns[col][i]) for col in ('temp', 'vib_x', 'vib_y', 'vib_z', 'speed')), model, scaler)
+        for i in range(len(columns['temp']))
+    ]
+
+
+def test_rules_only_batch_matches_per_reading_detection():
+    columns = _batch(500, seed=1)
+
+    assert detect_batch(columns) == _reference_rows(columns)
+
+
+def test_batch_with_model_matches_per_reading_detection():
+    columns = _batch(300, seed=2)
+    model, scaler = _model()
+
+    rows = detect_batch(columns, model, scaler)
+
+    assert rows == _reference_rows(columns, model, scaler)
+    assert any(row["anomaly_type"] == "ml_detected" for row in rows)
+
+
+def test_find_anomalies_returns_the_anomalous_rows_of_detect_batch():
+    columns = _batch(200, seed=3)
+    model, scaler = _model()
+
+    indices, rows = find_anomalies(columns, model, scaler)
+
+    full = detect_batch(columns, model, scaler)
+    assert indices.tolist() == [i for i, row in enumerate(full) if row["is_anomaly"]]
+    assert rows == [full[i] for i in indices.tolist()]
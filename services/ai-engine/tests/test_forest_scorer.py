@@ -0,0 +1,47 @@
+import numpy as np
+from sklearn.ensemble import IsolationForest
+
+from forest_scorer import FlatForest
+
+
+def _data(seed, n=2000, features=3):
+    rng = np.random.default_rng(seed)
+    return rng.normal(0, 1, (n, features))
+
+
+def test_scores_match_sklearn():
+    X = _data(0)
+    model = IsolationForest(contamination=0.1, random_state=42).fit(X)
+    queries = np.vstack([_data(1, n=500), _data(2, n=50) * 5])
+
+    np.testing.assert_allclose(FlatForest(model).score_samples(queries), model.score_samples(queries), rtol=1e-12)
+
+
+def test_scores_match_sklearn_with_subsampled_features_and_small_samples():
+    X = _data(3, features=6)
+    model = IsolationForest(n_estimators=40, max_samples=64, max_features=3, random_state=7).fit(X)
+    queries = _data(4, n=300, features=6)
+
+    np.testing.assert_allclose(FlatForest(model).score_samples(queries), model.score_samples(queries), rtol=1e-12)
+
+
+def test_outlier_decision_matches_predict():
+    X = _data(5)
+    model = IsolationForest(contamination=0.05, random_state=1).fit(X)
+    queries = _data(6, n=1000) * 2
+    flat = FlatForest(model)
+
+    outliers = flat.score_samples(queries) - flat.offset_ < 0
+
+    assert outliers.tolist() == (model.predict(queries) == -1).tolist()
+
+
+def test_scoring_in_chunks_matches_one_pass(monkeypatch):
+    X = _data(7)
+    model = IsolationForest(random_state=0).fit(X)
+    queries = _data(8, n=400)
+    expected = FlatForest(model).score_samples(queries)
+
+    monkeypatch.setattr("forest_scorer.CHUNK_ELEMENTS", 1000)
+
+    np.testing.assert_array_equal(FlatForest(model).score_samples(queries), expected)
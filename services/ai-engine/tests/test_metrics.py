@@ -0,0 +1,132 @@
+import asyncio
+import threading
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from metrics import MetricsMiddleware, Registry
+
+
+def test_counters_accumulate_per_label_set_across_threads():
+    registry = Registry()
+    rows = registry.counter("rows_total", "Rows", labels=("table",))
+
+    def work():
+        for _ in range(1000):
+            rows.labels("sensor_logs").inc()
+            rows.labels("alerts").inc(2)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert rows.samples() == [
+        ("rows_total", {"table": "alerts"}, 8000.0),
+        ("rows_total", {"table": "sensor_logs"}, 4000.0),
+    ]
+
+
+def test_wrong_label_count_and_duplicate_names_are_refused():
+    registry = Registry()
+    rows = registry.counter("rows_total", "Rows", labels=("table",))
+
+    with pytest.raises(ValueError):
+        rows.labels("sensor_logs", "extra")
+    with pytest.raises(ValueError):
+        registry.counter("rows_total", "Again")
+
+
+def test_histogram_buckets_are_cumulative_and_upper_bounds_inclusive():
+    registry = Registry()
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(1, 0.1, 0.5))
+
+    for value in (0.05, 0.1, 0.3, 0.5, 2.0):
+        latency.observe(value)
+
+    assert latency.samples() == [
+        ("latency_seconds_bucket", {"le": "0.1"}, 2),
+        ("latency_seconds_bucket", {"le": "0.5"}, 4),
+        ("latency_seconds_bucket", {"le": "1"}, 4),
+        ("latency_seconds_bucket", {"le": "+Inf"}, 5),
+        ("latency_seconds_sum", {}, pytest.approx(2.95)),
+        ("latency_seconds_count", {}, 5),
+    ]
+
+
+def test_histogram_timer_observes_its_block():
+    registry = Registry()
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(10,))
+
+    with latency.time():
+        pass
+
+    samples = dict((name, value) for name, _, value in latency.samples())
+    assert samples["latency_seconds_count"] == 1
+    assert 0 <= samples["latency_seconds_sum"] < 10
+
+
+def test_exposition_format():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests served", labels=("endpoint",))
+    batch = registry.histogram("batch_readings", "Readings per batch", buckets=(10, 100))
+    registry.gauge("buffer_size", "Readings in the buffer", lambda: 42)
+    registry.gauge("queue_depth", "Queued work per queue", lambda: {"db": 3, "mqtt": 0.5}, labels=("queue",))
+    registry.gauge("no_model_age", "Omitted while unknown", lambda: None)
+    registry.counter_function("cache_events_total", "Cache events", lambda: {("hit",): 7}, labels=("event",))
+    registry.gauge("broken", "Fails at scrape time", lambda: 1 / 0)
+
+    requests.labels('/predict/"x"\\n').inc()
+    batch.observe(5)
+    batch.observe(500)
+
+    assert registry.render() == (
+        '# HELP requests_total Requests served\n'
+        '# TYPE requests_total counter\n'
+        'requests_total{endpoint="/predict/\\"x\\"\\\\n"} 1\n'
+        '# HELP batch_readings Readings per batch\n'
+        '# TYPE batch_readings histogram\n'
+        'batch_readings_bucket{le="10"} 1\n'
+        'batch_readings_bucket{le="100"} 1\n'
+        'batch_readings_bucket{le="+Inf"} 2\n'
+        'batch_readings_sum 505\n'
+        'batch_readings_count 2\n'
+        '# HELP buffer_size Readings in the buffer\n'
+        '# TYPE buffer_size gauge\n'
+        'buffer_size 42\n'
+        '# HELP queue_depth Queued work per queue\n'
+        '# TYPE queue_depth gauge\n'
+        'queue_depth{queue="db"} 3\n'
+        'queue_depth{queue="mqtt"} 0.5\n'
+        '# HELP no_model_age Omitted while unknown\n'
+        '# TYPE no_model_age gauge\n'
+        '# HELP cache_events_total Cache events\n'
+        '# TYPE cache_events_total counter\n'
+        'cache_events_total{event="hit"} 7\n'
+    )
+
+
+def test_middleware_labels_requests_by_route_template_and_status():
+    registry = Registry()
+    duration = registry.histogram("http_seconds", "Request duration", labels=("method", "endpoint", "status"))
+    app = FastAPI()
+
+    @app.get("/machines/{machine_id}")
+    async def machine(machine_id: str):
+        return {"id": machine_id}
+
+    app.add_middleware(MetricsMiddleware, histogram=duration)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            for machine_id in ("m1", "m2"):
+                await client.get(f"/machines/{machine_id}")
+            await client.get("/nowhere")
+
+    asyncio.run(run())
+    counts = {tuple(labels.values()): value for name, labels, value in duration.samples()
+              if name == "http_seconds_count"}
+
+    assert counts == {("GET", "/machines/{machine_id}", "200"): 2, ("GET", "unmatched", "404"): 1}
@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from model_store import ModelStore
+
+
+def _save(store, pinned):
+    return store.save({"model": 1}, {"scaler": 1}, trained_at=datetime.now(), samples=10,
+                      source="database" if pinned else "online", pinned=pinned)
+
+
+def test_prune_caps_pinned_and_unpinned_versions_separately(tmp_path):
+    store = ModelStore(str(tmp_path), keep=2)
+    pinned = [_save(store, pinned=True) for _ in range(4)]
+    unpinned = [_save(store, pinned=False) for _ in range(4)]
+
+    kept = {m["version"] for m in store.list_versions()}
+
+    assert kept == set(pinned[-2:]) | set(unpinned[-2:])
+
+
+def test_prune_never_deletes_the_current_version(tmp_path):
+    store = ModelStore(str(tmp_path), keep=2)
+    first = _save(store, pinned=True)
+    second = _save(store, pinned=True)
+    store.set_current(first)
+
+    store.keep = 1
+    store._prune()
+
+    assert {m["version"] for m in store.list_versions()} == {first, second}
@@ -0,0 +1,180 @@
+import asyncio
+import json
+import threading
+
+import numpy as np
+import pytest
+
+from mqtt_consumer import MqttConsumer, mqtt, payloads_to_columns
+from ring_buffer import MISSING_TIMESTAMP
+
+needs_paho = pytest.mark.skipif(mqtt is None, reason="paho-mqtt not installed (requirements-mqtt.txt)")
+
+
+def _payload(device_id="m1", temp=70.0, timestamp=1700000000000, **fields):
+    reading = {"id": device_id, "temp": temp, "vib_x": 0.1, "vib_y": 0.2, "vib_z": 0.3, "speed": 12.0,
+               "timestamp": timestamp, "fuel": 40}
+    reading.update(fields)
+    return json.dumps(reading).encode()
+
+
+class Message:
+    def __init__(self, payload):
+        self.payload = payload
+
+
+class FakeClient:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, payload, qos):
+        self.published.append((topic, json.loads(payload)))
+
+    def disconnect(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+
+def test_payloads_decode_into_columns_and_invalid_ones_are_counted():
+    payloads = [
+        _payload("m1", 70.5),
+        b"not json",
+        _payload("m2", 80.0, timestamp=None),
+        json.dumps({"id": "m3", "temp": 70}).encode(),   # missing axes
+        _payload("m4", "hot"),
+        _payload("m5", float("nan")),
+        _payload("x" * 65),                               # longer than a machine ID slot
+        b"[1, 2]",
+        _payload(7, 60.0),                                # numeric IDs become strings
+    ]
+
+    device_ids, columns, invalid = payloads_to_columns(payloads)
+
+    assert device_ids == ["m1", "m2", "7"]
+    assert invalid == 6
+    np.testing.assert_array_equal(columns['temp'], [70.5, 80.0, 60.0])
+    np.testing.assert_array_equal(columns['vib_z'], [0.3] * 3)
+    np.testing.assert_array_equal(columns['timestamp'], [1700000000000, MISSING_TIMESTAMP, 1700000000000])
+    assert columns['timestamp'].dtype == np.int64
+
+
+def test_empty_payload_list_decodes_to_empty_columns():
+    device_ids, columns, invalid = payloads_to_columns([])
+
+    assert device_ids == [] and invalid == 0
+    assert all(len(values) == 0 for values in columns.values())
+
+
+async def _running(consumer):
+    consumer._loop = asyncio.get_running_loop()
+    consumer._task = asyncio.create_task(consumer._run())
+    return consumer
+
+
+def _deliver(consumer, payloads):
+    """Deliver messages from another thread, like paho's network thread"""
+    thread = threading.Thread(target=lambda: [consumer._on_message(None, None, Message(p)) for p in payloads])
+    thread.start()
+    thread.join()
+
+
+@needs_paho
+def test_messages_are_flushed_in_order_in_batches_of_at_most_max_batch():
+    batches = []
+
+    async def run():
+        consumer = await _running(MqttConsumer(lambda ids, columns: batches.append(ids) or [], "localhost",
+                                               alerts_topic=None, max_batch=3, max_delay=5))
+        _deliver(consumer, [_payload(f"m{i}") for i in range(7)])
+        # A full batch is flushed right away, long before max_delay
+        for _ in range(100):
+            if sum(map(len, batches)) >= 6:
+                break
+            await asyncio.sleep(0.01)
+        flushed_early = sum(map(len, batches))
+        await consumer.stop()
+        return flushed_early, consumer.stats()
+
+    flushed_early, stats = asyncio.run(run())
+
+    assert flushed_early >= 6
+    assert all(len(batch) <= 3 for batch in batches)
+    assert [device for batch in batches for device in batch] == [f"m{i}" for i in range(7)]
+    assert stats["received"] == stats["processed"] == 7 and stats["pending"] == 0
+
+
+@needs_paho
+def test_a_quiet_feed_is_flushed_after_max_delay():
+    batches = []
+
+    async def run():
+        consumer = await _running(MqttConsumer(lambda ids, columns: batches.append(ids) or [], "localhost",
+                                               alerts_topic=None, max_batch=100, max_delay=0.1))
+        _deliver(consumer, [_payload("m1")])
+        await asyncio.sleep(0.02)
+        before = list(batches)
+        await asyncio.sleep(0.3)
+        after = list(batches)
+        await consumer.stop()
+        return before, after
+
+    before, after = asyncio.run(run())
+
+    assert before == [] and after == [["m1"]]
+
+
+@needs_paho
+def test_messages_beyond_max_pending_are_dropped_and_stop_drains_the_rest():
+    batches = []
+
+    async def run():
+        consumer = MqttConsumer(lambda ids, columns: batches.append(ids) or [], "localhost",
+                                alerts_topic=None, max_batch=10, max_pending=2)
+        consumer._loop = asyncio.get_running_loop()
+        _deliver(consumer, [_payload(f"m{i}") for i in range(5)])
+        await consumer.stop()
+        return consumer.stats()
+
+    stats = asyncio.run(run())
+
+    assert stats["received"] == 5 and stats["dropped"] == 3
+    assert batches == [["m0", "m1"]]
+
+
+@needs_paho
+def test_alerts_are_published_and_handler_failures_counted():
+    client = FakeClient()
+
+    def handler(device_ids, columns):
+        if "boom" in device_ids:
+            raise RuntimeError("detector failed")
+        return [{"machine_id": device_id, "temp": float(temp)}
+                for device_id, temp in zip(device_ids, columns['temp']) if temp > 90]
+
+    async def run():
+        consumer = MqttConsumer(handler, "localhost", alerts_topic="alerts", max_batch=2)
+        consumer._client = client
+        consumer._process_all([_payload("m1", 95.0), _payload("m2", 60.0), b"{}", _payload("boom")])
+        return consumer.stats()
+
+    stats = asyncio.run(run())
+
+    assert client.published == [("alerts", {"machine_id": "m1", "temp": 95.0})]
+    assert stats["alerts_published"] == 1 and stats["processed"] == 2 and stats["batches"] == 1
+    assert stats["invalid"] == 1 and stats["errors"] == 1
+
+
+def test_decoded_batches_run_through_the_engines_ingest_and_detection():
+    import main
+
+    before = len(main.realtime_buffer)
+    device_ids, columns, _ = payloads_to_columns([_payload("mqtt-hot", 120.0), _payload("mqtt-ok", 65.0)])
+
+    alerts = main._handle_mqtt_batch(device_ids, columns)
+
+    assert len(main.realtime_buffer) == before + 2
+    assert main.realtime_buffer.lookup("mqtt-ok") is not None
+    assert [alert["machine_id"] for alert in alerts] == ["mqtt-hot"]
+    assert alerts[0]["severity"] == "critical"
@@ -0,0 +1,42 @@
+import time
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+def _ingest(client, machine_id, seconds, temps):
+    data = [dict(id=machine_id, temp=float(temp), vib_x=0.1, vib_y=0.1, vib_z=0.1, speed=10.0,
+                 timestamp=int(second * 1000)) for second, temp in zip(seconds, temps)]
+    assert client.post("/ingest", json={"data": data}).status_code == 200
+
+
+def test_stream_forecast_needs_enough_grid_bins_not_just_readings(client):
+    # 30 readings of 60 ± 1 crammed into the last two and a half minutes: three bins
+    now = time.time()
+    _ingest(client, "short-history", now - 150 + np.arange(30) * 5, 60 + np.tile([1.0, -1.0], 15))
+
+    response = client.get("/predict/temperature/short-history", params={"source": "stream", "hours_ahead": 6})
+
+    assert response.status_code == 400
+    assert not main._stream_has_history("short-history")
+
+
+def test_stream_forecast_of_a_flat_series_stays_flat(client):
+    # The same 60 ± 1, one reading every 30 s for an hour: 120 readings in 60
+    # bins, each holding one high and one low reading
+    start = (time.time() - 3600) // 60 * 60 + 15
+    _ingest(client, "long-history", start + np.arange(120) * 30, 60 + np.tile([1.0, -1.0], 60))
+
+    response = client.get("/predict/temperature/long-history", params={"source": "stream", "hours_ahead": 6})
+
+    assert response.status_code == 200
+    assert response.json()["predicted_value"] == pytest.approx(60.0, abs=1.0)
+    assert main._stream_has_history("long-history")
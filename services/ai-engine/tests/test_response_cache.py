@@ -0,0 +1,190 @@
+import asyncio
+
+import pytest
+
+import response_cache
+from response_cache import ResponseCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache.time, "monotonic", clock)
+    return clock
+
+
+def _value(value):
+    async def compute():
+        return value
+    return compute
+
+
+def test_concurrent_misses_share_one_computation():
+    async def run():
+        cache = ResponseCache(ttl=10)
+        calls = 0
+        release = asyncio.Event()
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return {"value": calls}
+
+        waiters = [asyncio.ensure_future(cache.get_or_compute(("stats", 24), compute)) for _ in range(5)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*waiters)
+        return calls, results, cache.stats()
+
+    calls, results, stats = asyncio.run(run())
+
+    assert calls == 1
+    assert results == [{"value": 1}] * 5
+    assert stats["misses"] == 1 and stats["coalesced"] == 4
+
+
+def test_failed_computation_reaches_every_waiter_and_is_not_cached():
+    async def run():
+        cache = ResponseCache(ttl=10)
+        release = asyncio.Event()
+
+        async def fail():
+            await release.wait()
+            raise RuntimeError("database down")
+
+        waiters = [asyncio.ensure_future(cache.get_or_compute("key", fail)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        return results, await cache.get_or_compute("key", _value("recovered"))
+
+    results, retried = asyncio.run(run())
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert retried == "recovered"
+
+
+def test_entries_expire_after_ttl(clock):
+    async def run():
+        cache = ResponseCache(ttl=10)
+        first = await cache.get_or_compute("key", _value(1))
+        clock.now += 9
+        fresh = await cache.get_or_compute("key", _value(2))
+        clock.now += 2
+        expired = await cache.get_or_compute("key", _value(3))
+        return first, fresh, expired
+
+    assert asyncio.run(run()) == (1, 1, 3)
+
+
+def test_least_recently_used_entry_is_evicted():
+    async def run():
+        cache = ResponseCache(ttl=10, max_entries=2)
+        await cache.get_or_compute("a", _value("a1"))
+        await cache.get_or_compute("b", _value("b1"))
+        await cache.get_or_compute("a", _value("a2"))  # hit: "b" is now least recently used
+        await cache.get_or_compute("c", _value("c1"))
+        return (await cache.get_or_compute("a", _value("a3")),
+                await cache.get_or_compute("b", _value("b2")),
+                cache.stats()["evictions"])
+
+    a, b, evictions = asyncio.run(run())
+
+    assert a == "a1"
+    assert b == "b2"
+    assert evictions >= 1
+
+
+def test_invalidation_during_computation_does_not_store_the_result(clock):
+    async def run():
+        cache = ResponseCache(ttl=10)
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def slow():
+            started.set()
+            await release.wait()
+            return "stale"
+
+        waiter = asyncio.ensure_future(cache.get_or_compute(("stats", 24), slow))
+        await started.wait()
+        clock.now += 1
+        cache.invalidate("stats")
+        release.set()
+        answered = await waiter
+        return answered, await cache.get_or_compute(("stats", 24), _value("fresh"))
+
+    assert asyncio.run(run()) == ("stale", "fresh")
+
+
+def test_invalidate_only_drops_the_given_endpoint(clock):
+    async def run():
+        cache = ResponseCache(ttl=10)
+        await cache.get_or_compute(("stats", 24), _value("stats"))
+        await cache.get_or_compute(("efficiency", 24), _value("efficiency"))
+        clock.now += 1
+        dropped = cache.invalidate("stats")
+        return (dropped,
+                await cache.get_or_compute(("stats", 24), _value("stats2")),
+                await cache.get_or_compute(("efficiency", 24), _value("efficiency2")))
+
+    assert asyncio.run(run()) == (1, "stats2", "efficiency")
+
+
+def test_cancelling_the_first_caller_does_not_cancel_coalesced_waiters():
+    async def run():
+        cache = ResponseCache(ttl=10)
+        started = asyncio.Event()
+        release = asyncio.Event()
+        calls = 0
+
+        async def slow():
+            nonlocal calls
+            calls += 1
+            started.set()
+            await release.wait()
+            return "value"
+
+        first = asyncio.ensure_future(cache.get_or_compute("key", slow))
+        await started.wait()
+        second = asyncio.ensure_future(cache.get_or_compute("key", slow))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        answered = await second
+        cached = await cache.get_or_compute("key", _value("recomputed"))
+        return first.cancelled(), answered, cached, calls
+
+    assert asyncio.run(run()) == (True, "value", "value", 1)
+
+
+def test_failure_after_every_caller_is_cancelled_is_not_cached():
+    async def run():
+        cache = ResponseCache(ttl=10)
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def fail():
+            started.set()
+            await release.wait()
+            raise RuntimeError("database down")
+
+        waiter = asyncio.ensure_future(cache.get_or_compute("key", fail))
+        await started.wait()
+        waiter.cancel()
+        release.set()
+        for _ in range(3):
+            await asyncio.sleep(0)
+        return cache.stats()["inflight"], await cache.get_or_compute("key", _value("recovered"))
+
+    assert asyncio.run(run()) == (0, "recovered")
@@ -0,0 +1,93 @@
+import numpy as np
+
+from ring_buffer import SensorRingBuffer
+
+
+def _append(buffer, temps, machine="m1"):
+    for temp in temps:
+        buffer.append(machine, temp, 0.0, 0.0, 0.0, 0.0, timestamp=int(temp))
+
+
+def _columns(buffer, temps, machine="m1"):
+    n = len(temps)
+    return {
+        'temp': np.asarray(temps, dtype=float),
+        'vib_x': np.zeros(n), 'vib_y': np.zeros(n), 'vib_z': np.zeros(n), 'speed': np.zeros(n),
+        'timestamp': np.asarray(temps, dtype=np.int64),
+        'machine': np.full(n, buffer.intern(machine), dtype=np.int32),
+    }
+
+
+def test_append_wraps_around_keeping_the_newest_readings_in_order():
+    buffer = SensorRingBuffer(capacity=4)
+    _append(buffer, [1, 2, 3, 4, 5, 6])
+
+    assert len(buffer) == 4
+    assert buffer.view()['temp'].tolist() == [3, 4, 5, 6]
+    assert buffer.view(last=2)['temp'].tolist() == [5, 6]
+    assert buffer.view()['timestamp'].tolist() == [3, 4, 5, 6]
+
+
+def test_view_of_a_partly_filled_buffer_holds_only_written_readings():
+    buffer = SensorRingBuffer(capacity=8)
+    _append(buffer, [1, 2, 3])
+
+    assert buffer.view()['temp'].tolist() == [1, 2, 3]
+    assert buffer.view(last=10)['temp'].tolist() == [1, 2, 3]
+    assert buffer.view(last=0)['temp'].tolist() == []
+
+
+def test_extend_columns_across_the_wrap_point():
+    buffer = SensorRingBuffer(capacity=5)
+    _append(buffer, [1, 2, 3])
+
+    buffer.extend_columns(_columns(buffer, [4, 5, 6, 7]))
+
+    assert buffer.view()['temp'].tolist() == [3, 4, 5, 6, 7]
+
+
+def test_extend_columns_larger_than_capacity_keeps_the_newest():
+    buffer = SensorRingBuffer(capacity=4)
+    _append(buffer, [1, 2, 3])
+
+    buffer.extend_columns(_columns(buffer, [10, 11, 12, 13, 14, 15, 16]))
+
+    assert len(buffer) == 4
+    assert buffer.view()['temp'].tolist() == [13, 14, 15, 16]
+    # Later appends continue after the batch
+    _append(buffer, [17])
+    assert buffer.view()['temp'].tolist() == [14, 15, 16, 17]
+
+
+def test_mixed_appends_match_a_plain_list():
+    buffer = SensorRingBuffer(capacity=7)
+    expected = []
+    value = 0
+    for size in [1, 3, 9, 2, 7, 1, 15, 4]:
+        temps = list(range(value, value + size))
+        value += size
+        if size == 1:
+            _append(buffer, temps)
+        else:
+            buffer.extend_columns(_columns(buffer, temps))
+        expected.extend(temps)
+        assert buffer.view()['temp'].tolist() == expected[-7:]
+
+
+def test_machine_ids_are_interned_per_reading():
+    buffer = SensorRingBuffer(capacity=4)
+    _append(buffer, [1], machine="a")
+    _append(buffer, [2], machine="b")
+    _append(buffer, [3], machine="a")
+
+    machines = buffer.view()['machine']
+    assert [buffer.machine_id(idx) for idx in machines.tolist()] == ["a", "b", "a"]
+    assert buffer.lookup("c") is None
+
+
+def test_views_are_read_only():
+    buffer = SensorRingBuffer(capacity=4)
+    _append(buffer, [1, 2])
+
+    view = buffer.view()['temp']
+    assert not view.flags.writeable
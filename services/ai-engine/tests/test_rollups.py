@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from rollups import ROLLUP_FIELDS, RollupAccumulator, aggregate_readings
+
+
+def _row(values, i):
+    return dict(zip(ROLLUP_FIELDS, values[i].tolist()))
+
+
+def test_readings_are_aggregated_per_group_and_bucket():
+    # Group 1: two readings in the 60 s bucket, one (no temperature) in the 120 s bucket;
+    # group 0: one idle reading in the 60 s bucket
+    seconds = np.array([61.0, 119.9, 120.0, 75.0])
+    temp = np.array([70.0, 80.0, np.nan, 50.0])
+    speed = np.array([10.0, 0.0, 5.0, 0.5])
+    vib = np.array([0.3, 0.4, 0.2, 0.05])
+    groups = np.array([1, 1, 1, 0])
+
+    out_groups, buckets, values = aggregate_readings(seconds, temp, speed, vib, groups)
+
+    assert out_groups.tolist() == [0, 1, 1]
+    assert buckets.tolist() == [60, 60, 120]
+    idle, working, no_temp = (_row(values, i) for i in range(3))
+
+    assert idle == pytest.approx({
+        'count': 1, 'active_count': 0, 'idle_count': 1, 'moving_count': 1,
+        'active_speed_sum': 0, 'moving_speed_sum': 0.5,
+        'temp_count': 1, 'temp_sum': 50, 'temp_sumsq': 2500,
+        'speed_count': 1, 'speed_sum': 0.5, 'speed_sumsq': 0.25,
+        'vib_sum': 0.05, 'vib_sumsq': 0.0025,
+        'temp_min': 50, 'speed_min': 0.5, 'vib_min': 0.05,
+        'temp_max': 50, 'speed_max': 0.5, 'vib_max': 0.05,
+    })
+    assert working == pytest.approx({
+        'count': 2, 'active_count': 1, 'idle_count': 1, 'moving_count': 1,
+        'active_speed_sum': 10, 'moving_speed_sum': 10,
+        'temp_count': 2, 'temp_sum': 150, 'temp_sumsq': 4900 + 6400,
+        'speed_count': 2, 'speed_sum': 10, 'speed_sumsq': 100,
+        'vib_sum': 0.7, 'vib_sumsq': 0.09 + 0.16,
+        'temp_min': 70, 'speed_min': 0, 'vib_min': 0.3,
+        'temp_max': 80, 'speed_max': 10, 'vib_max': 0.4,
+    })
+    # No temperature: not counted, and min / max stay at their identities
+    assert no_temp['temp_count'] == 0 and no_temp['temp_sum'] == 0
+    assert no_temp['temp_min'] == np.inf and no_temp['temp_max'] == -np.inf
+    assert no_temp['count'] == 1 and no_temp['active_count'] == 1
+
+
+def test_hour_buckets_and_nan_speed():
+    seconds = np.array([3599.0, 3600.0, 7199.0])
+    temp = np.array([60.0, 61.0, 62.0])
+    speed = np.array([np.nan, 3.0, 4.0])
+    vib = np.zeros(3)
+
+    _, buckets, values = aggregate_readings(seconds, temp, speed, vib, np.zeros(3, dtype=int), bucket_seconds=3600)
+
+    assert buckets.tolist() == [0, 3600]
+    first, second = _row(values, 0), _row(values, 1)
+    assert first['speed_count'] == 0 and first['speed_min'] == np.inf and first['moving_count'] == 0
+    assert second['count'] == 2 and second['speed_sum'] == 7 and second['temp_max'] == 62
+
+
+def test_accumulator_merges_batches_like_one_aggregation():
+    rng = np.random.default_rng(3)
+    n = 200
+    device_ids = rng.choice(["a", "b", "c"], n)
+    seconds = 1.7e9 + rng.uniform(0, 300, n)
+    temp, speed, vib = rng.normal(70, 5, n), rng.uniform(0, 20, n), rng.uniform(0, 0.4, n)
+
+    split = RollupAccumulator()
+    for part in np.array_split(np.arange(n), 7):
+        split.add(device_ids[part].tolist(), seconds[part], temp[part], speed[part], vib[part])
+    whole = RollupAccumulator()
+    whole.add(device_ids.tolist(), seconds, temp, speed, vib)
+
+    merged, expected = split.drain(), whole.drain()
+    assert merged.keys() == expected.keys()
+    for key in expected:
+        np.testing.assert_allclose(merged[key], expected[key])
+    assert len(split) == 0
+
+
+def test_rows_carry_iso_buckets_integer_counts_and_null_extremes():
+    accumulator = RollupAccumulator()
+    accumulator.add(["m1"], np.array([1.7e9 + 30]), np.array([np.nan]), np.array([12.5]), np.array([0.2]))
+
+    (row,) = RollupAccumulator.to_rows(accumulator.drain())
+
+    assert row["device_id"] == "m1"
+    assert row["bucket"] == "2023-11-14T22:13:00+00:00"
+    assert row["count"] == 1 and isinstance(row["count"], int)
+    assert row["temp_count"] == 0 and row["temp_min"] is None and row["temp_max"] is None
+    assert row["speed_max"] == 12.5 and row["active_speed_sum"] == 12.5
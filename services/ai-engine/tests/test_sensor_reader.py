@@ -0,0 +1,72 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# The in-memory PostgREST stand-in used by the benchmarks
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+from fake_supabase import FakeSupabase  # noqa: E402
+
+from sensor_reader import RunningStats, iter_sensor_logs  # noqa: E402
+
+
+def _database(timestamps, device_ids=None):
+    n = len(timestamps)
+    rows = pd.DataFrame({
+        'id': [f"r{i:03d}" for i in range(n)],
+        'device_id': device_ids or ["m1"] * n,
+        'temperature': np.arange(n, dtype=float),
+        'vibration_x': 0.0, 'vibration_y': 0.0, 'vibration_z': 0.0, 'speed': 1.0,
+        'timestamp': timestamps,
+    })
+    return FakeSupabase({'sensor_logs': rows}, sort_keys={'sensor_logs': ('timestamp', 'id')})
+
+
+# Runs of rows sharing a timestamp, longer than a page
+TIED = (["2025-01-01T00:00:00+00:00"] * 5 + ["2025-01-01T00:00:05+00:00"] * 2
+        + ["2025-01-01T00:00:10+00:00"] * 4)
+
+
+def _ids(db, **kwargs):
+    return [row_id for page in iter_sensor_logs(db, "2025-01-01T00:00:00+00:00", **kwargs)
+            for row_id in page['id']]
+
+
+def test_pages_over_tied_timestamps_neither_skip_nor_repeat_rows():
+    db = _database(TIED)
+
+    for page_size in (1, 2, 3, 4, 100):
+        assert _ids(db, page_size=page_size) == [f"r{i:03d}" for i in range(len(TIED))]
+
+
+def test_newest_first_walks_the_same_rows_backwards():
+    db = _database(TIED)
+
+    for page_size in (1, 3, 100):
+        assert _ids(db, page_size=page_size, newest_first=True) == [f"r{i:03d}" for i in reversed(range(len(TIED)))]
+
+
+def test_window_bounds_and_device_filter():
+    timestamps = [f"2025-01-01T00:00:{s:02d}+00:00" for s in range(0, 40, 5)]
+    db = _database(timestamps, device_ids=["m1", "m2"] * 4)
+
+    pages = list(iter_sensor_logs(db, "2025-01-01T00:00:10+00:00", until="2025-01-01T00:00:30+00:00",
+                                  device_id="m1", page_size=1))
+
+    assert [page['id'].iloc[0] for page in pages] == ["r002", "r004"]
+    assert set(pages[0].columns) >= {'device_id', 'temperature', 'timestamp', 'id'}
+
+
+def test_running_stats_match_the_whole_window():
+    values = np.random.default_rng(0).normal(60, 10, 1000)
+    values[::37] = np.nan
+    stats = RunningStats()
+    for chunk in np.array_split(values, 13):
+        stats.update(chunk)
+
+    expected = pd.Series(values).dropna()
+    assert stats.count == len(expected)
+    assert np.isclose(stats.mean, expected.mean())
+    assert np.isclose(stats.std, expected.std())
+    assert stats.min == expected.min() and stats.max == expected.max()
@@ -0,0 +1,94 @@
+from collections import defaultdict
+
+import numpy as np
+import pytest
+
+from sequence_features import FEATURE_NAMES, N_BANDS, MachineWindows
+
+WINDOW = 8
+
+
+def _reference(history, window):
+    """Features of one reading from its machine's readings so far, written out per window"""
+    if len(history) < window:
+        return np.full(len(FEATURE_NAMES), np.nan)
+    rows = np.array(history[-window:])
+    temp, vib_x, vib_y, vib_z, seconds = rows.T
+
+    slope = np.polyfit(seconds - seconds[-1], temp, 1)[0] * 60
+    features = [slope, np.std(temp)]
+    features += [np.sqrt(np.mean(axis ** 2)) for axis in (vib_x, vib_y, vib_z)]
+    features += [axis.max() - axis.min() for axis in (vib_x, vib_y, vib_z)]
+
+    magnitude = np.sqrt(vib_x ** 2 + vib_y ** 2 + vib_z ** 2)
+    power = np.abs(np.fft.rfft(magnitude - magnitude.mean())) ** 2
+    for band in np.array_split(power[1:], N_BANDS):
+        features.append(np.sqrt(2 * band.sum()) / window)
+    return np.array(features)
+
+
+def _batches(rng, machines, weights, n_batches):
+    clock = 1.7e9
+    for _ in range(n_batches):
+        size = int(rng.integers(1, 40))
+        clock += rng.uniform(1, 5, size).cumsum()[-1]
+        yield (
+            rng.choice(machines, size=size, p=weights),
+            {
+                'temp': rng.normal(70, 5, size),
+                'vib_x': rng.normal(0, 0.2, size),
+                'vib_y': rng.normal(0, 0.2, size),
+                'vib_z': rng.normal(0, 0.2, size),
+            },
+            clock + np.sort(rng.uniform(0, 60, size)),
+        )
+
+
+def test_batched_features_match_a_per_reading_reference():
+    rng = np.random.default_rng(7)
+    # Sparse interned indices beyond the initial capacity; machine 41 stays short of a full window
+    machines = np.array([0, 3, 9, 17, 41])
+    weights = np.array([0.3, 0.3, 0.2, 0.195, 0.005])
+    windows = MachineWindows(window=WINDOW, initial_machines=4)
+    history = defaultdict(list)
+    compared = 0
+
+    for codes, columns, seconds in _batches(rng, machines, weights, 60):
+        scored = windows.score_batch(codes, columns, seconds)
+        features = windows.update(codes, columns, seconds)
+
+        expected = []
+        for i, machine in enumerate(codes):
+            history[machine].append([columns['temp'][i], columns['vib_x'][i], columns['vib_y'][i],
+                                     columns['vib_z'][i], seconds[i]])
+            expected.append(_reference(history[machine], WINDOW))
+
+        np.testing.assert_allclose(features, expected, rtol=1e-7, atol=1e-9)
+        np.testing.assert_array_equal(scored, features)
+        compared += int(np.isfinite(features[:, 0]).sum())
+
+    # Histories wrapped many times over, and the rare machine never filled a window
+    assert min(len(history[m]) for m in machines[:4]) > 10 * WINDOW
+    assert 0 < len(history[41]) < WINDOW
+    assert compared > 500
+    assert windows.machine_count() == len(machines)
+
+
+def test_score_batch_leaves_the_history_untouched():
+    rng = np.random.default_rng(1)
+    batches = list(_batches(rng, np.array([0, 1]), np.array([0.5, 0.5]), 10))
+    probe = batches.pop()
+    scoring = MachineWindows(window=WINDOW)
+    plain = MachineWindows(window=WINDOW)
+
+    for codes, columns, seconds in batches:
+        scoring.update(codes, columns, seconds)
+        scoring.score_batch(codes, columns, seconds + 1000)
+        plain.update(codes, columns, seconds)
+
+    np.testing.assert_array_equal(scoring.update(*probe), plain.update(*probe))
+
+
+def test_window_too_short_for_the_bands_is_refused():
+    with pytest.raises(ValueError):
+        MachineWindows(window=2 * N_BANDS + 1)
@@ -0,0 +1,148 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import numpy as np
+import pytest
+
+from shared_state import CapacityError, LeaderLock, SharedArrays
+
+ENGINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+class Worker:
+    """Another process running `script` (with `directory` defined); waits for a line on stdin to exit"""
+
+    def __init__(self, directory, script):
+        code = f"import sys\nsys.path.insert(0, {ENGINE_DIR!r})\ndirectory = {str(directory)!r}\n"
+        code += textwrap.dedent(script) + "\nprint('ready', flush=True)\nsys.stdin.readline()\n"
+        self.process = subprocess.Popen([sys.executable, "-c", code], stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, text=True)
+        self.lines = []
+        for line in self.process.stdout:
+            if line.strip() == "ready":
+                break
+            self.lines.append(line.strip())
+        assert self.process.poll() is None, "worker exited early"
+
+    def exit(self):
+        self.process.communicate("\n", timeout=30)
+        assert self.process.returncode == 0
+
+
+def test_processes_attached_to_one_store_share_arrays(tmp_path):
+    store = SharedArrays(str(tmp_path), max_machines=4)
+    values = store.scope("buffer").array("temp", 4)
+    values[0] = 65.0
+
+    worker = Worker(tmp_path, """
+        from shared_state import SharedArrays
+        values = SharedArrays(directory, max_machines=4).scope("buffer").array("temp", 4)
+        print(values[0])
+        values[1] = 70.0
+    """)
+    worker.exit()
+
+    assert worker.lines == ["65.0"]
+    np.testing.assert_array_equal(values, [65.0, 70.0, 0.0, 0.0])
+
+
+def test_shared_lock_excludes_other_processes(tmp_path):
+    store = SharedArrays(str(tmp_path), max_machines=4)
+    lock = store.lock("buffer")
+
+    worker = Worker(tmp_path, """
+        from shared_state import SharedArrays
+        SharedArrays(directory, max_machines=4).lock("buffer").acquire()
+    """)
+    held_elsewhere = lock.acquire(blocking=False)
+    worker.exit()
+
+    assert not held_elsewhere
+    assert lock.acquire(blocking=False)
+    lock.release()
+
+
+def test_leader_lock_is_handed_over_when_the_leader_exits(tmp_path):
+    path = str(tmp_path / "leader.lock")
+    follower = LeaderLock(path)
+
+    leader = Worker(tmp_path, f"""
+        from shared_state import LeaderLock
+        print(LeaderLock({path!r}).try_acquire())
+    """)
+    while_leader_lives = follower.try_acquire()
+    leader.exit()
+
+    assert leader.lines == ["True"]
+    assert not while_leader_lives and not follower.held
+    assert follower.try_acquire() and follower.held
+
+
+def test_first_process_of_a_new_run_clears_the_previous_runs_state(tmp_path):
+    attach = """
+        from shared_state import SharedArrays
+        temp = SharedArrays(directory, max_machines=4).array("temp", 4)
+        print(temp.tolist())
+        temp[:] = 99.0
+    """
+    previous = Worker(tmp_path, attach)
+    # Attached while the previous run lives: its state is joined
+    joining = Worker(tmp_path, attach)
+    mismatched = subprocess.run([sys.executable, "-c", textwrap.dedent(f"""
+        import sys
+        sys.path.insert(0, {ENGINE_DIR!r})
+        from shared_state import SharedArrays
+        SharedArrays({str(tmp_path)!r}, max_machines=8).array("temp", 8)
+    """)], capture_output=True, text=True)
+    previous.exit()
+    joining.exit()
+
+    # Every process of that run has exited: the next one starts clean, in any shape
+    restarted = Worker(tmp_path, """
+        from shared_state import SharedArrays
+        print(SharedArrays(directory, max_machines=8).array("temp", 8).tolist())
+    """)
+    restarted.exit()
+
+    assert previous.lines == ["[0.0, 0.0, 0.0, 0.0]"]
+    assert joining.lines == ["[99.0, 99.0, 99.0, 99.0]"]
+    assert mismatched.returncode != 0 and "another configuration" in mismatched.stderr
+    assert restarted.lines == ["[0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]"]
+
+
+def test_machine_beyond_shared_capacity_is_refused(tmp_path):
+    from ring_buffer import SensorRingBuffer
+
+    buffer = SensorRingBuffer(8, arrays=SharedArrays(str(tmp_path), max_machines=2))
+    buffer.intern("m1")
+    buffer.intern("m2")
+
+    with pytest.raises(CapacityError):
+        buffer.intern("m3")
+    assert buffer.machine_ids == ["m1", "m2"]
+
+
+def test_ingest_beyond_shared_capacity_returns_503(tmp_path):
+    # Multi-worker configuration is read when main is imported: run it in its own process
+    script = textwrap.dedent(f"""
+        import os, sys
+        os.environ.update(WORKERS="2", SHARED_MAX_MACHINES="2", SHARED_STATE_DIR={str(tmp_path)!r},
+                          SUPABASE_URL="", SUPABASE_SERVICE_KEY="", MQTT_ENABLED="false")
+        sys.path.insert(0, {ENGINE_DIR!r})
+        from fastapi.testclient import TestClient
+        import main
+
+        client = TestClient(main.app)
+        reading = dict(temp=70.0, vib_x=0.1, vib_y=0.1, vib_z=0.1, speed=10.0)
+        for machines in (["m1", "m2"], ["m3"]):
+            response = client.post("/ingest", json={{"data": [dict(reading, id=m) for m in machines]}})
+            print(response.status_code, response.json())
+    """)
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, timeout=120)
+    statuses = [line for line in result.stdout.splitlines() if line[:3].isdigit()]
+
+    assert result.returncode == 0, result.stderr
+    assert statuses[0].startswith("200 ")
+    assert statuses[1].startswith("503 ") and "SHARED_MAX_MACHINES" in statuses[1]
@@ -0,0 +1,83 @@
+import numpy as np
+
+from streaming_trends import StreamingTrendStats
+from trends import linear_trends, resample_grid
+
+
+def _readings(seed, machines=4, n=3000):
+    """Readings of several machines in time order, with irregular gaps"""
+    rng = np.random.default_rng(seed)
+    seconds = 1.7e9 + np.cumsum(rng.exponential(20, n))
+    codes = rng.integers(0, machines, n)
+    temperature = 60 + 5 * np.sin(seconds / 5000) + codes * 3 + rng.normal(0, 1, n)
+    temperature[rng.random(n) < 0.02] = np.nan
+    return codes, seconds, temperature
+
+
+def _batch_trends(codes, seconds, values, machines):
+    grid_codes, x, means = resample_grid(codes, seconds, values)
+    return linear_trends(grid_codes, x, means, machines)
+
+
+def test_streaming_matches_batch_linear_trends():
+    codes, seconds, temperature = _readings(seed=1)
+    stats = StreamingTrendStats(metrics=('temperature',))
+    for chunk in np.array_split(np.arange(len(codes)), 17):
+        stats.update(codes[chunk], seconds[chunk], {'temperature': temperature[chunk]})
+
+    streamed = stats.trends('temperature')
+    expected = _batch_trends(codes, seconds, temperature, 4)
+
+    assert streamed["count"][:4].tolist() == expected["count"].tolist()
+    np.testing.assert_allclose(streamed["slope"][:4], expected["slope"], rtol=1e-6)
+    np.testing.assert_allclose(streamed["y_mean"][:4], expected["y_mean"], rtol=1e-9)
+    np.testing.assert_allclose(streamed["x_mean"][:4], expected["x_mean"], rtol=1e-12)
+    np.testing.assert_allclose(streamed["last"][:4], expected["last"], rtol=1e-9)
+    assert streamed["readings"][:4].tolist() == np.bincount(codes[~np.isnan(temperature)], minlength=4).tolist()
+
+
+def test_batch_split_does_not_change_the_result():
+    codes, seconds, temperature = _readings(seed=2)
+    whole = StreamingTrendStats(metrics=('temperature',))
+    whole.update(codes, seconds, {'temperature': temperature})
+    split = StreamingTrendStats(metrics=('temperature',))
+    for i in range(len(codes)):
+        split.update(codes[i:i + 1], seconds[i:i + 1], {'temperature': temperature[i:i + 1]})
+
+    for field in ("count", "slope", "y_mean", "last"):
+        np.testing.assert_allclose(split.trends('temperature')[field], whole.trends('temperature')[field],
+                                   rtol=1e-9)
+
+
+def test_regression_matches_the_fleet_arrays():
+    codes, seconds, temperature = _readings(seed=3)
+    stats = StreamingTrendStats(metrics=('temperature',))
+    stats.update(codes, seconds, {'temperature': temperature})
+    fleet = stats.trends('temperature')
+
+    reg = stats.regression(2, 'temperature')
+
+    assert np.isclose(reg["slope"], fleet["slope"][2])
+    assert np.isclose(reg["mean"], fleet["y_mean"][2])
+    assert reg["points"] == fleet["count"][2]
+    assert stats.regression(10, 'temperature') is None
+
+
+def test_rebuild_keeps_readings_ingested_during_the_replay():
+    codes, seconds, temperature = _readings(seed=4)
+    cutoff = seconds[2000]
+    stats = StreamingTrendStats(metrics=('temperature',))
+    stats.update(codes[:1500], seconds[:1500], {'temperature': temperature[:1500]})
+
+    rebuild, replay_until = stats.begin_rebuild(cutoff)
+    # Live readings keep arriving while the replay runs
+    stats.update(codes[1500:], seconds[1500:], {'temperature': temperature[1500:]})
+    replayed = StreamingTrendStats(metrics=('temperature',))
+    before = seconds < replay_until
+    replayed.update(codes[before], seconds[before], {'temperature': temperature[before]})
+    assert stats.end_rebuild(rebuild, replayed)
+
+    expected = _batch_trends(codes, seconds, temperature, 4)
+    streamed = stats.trends('temperature')
+    assert streamed["count"][:4].tolist() == expected["count"].tolist()
+    np.testing.assert_allclose(streamed["slope"][:4], expected["slope"], rtol=1e-6)
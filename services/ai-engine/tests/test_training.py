@@ -0,0 +1,63 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+from training import fit_anomaly_model, fit_anomaly_models
+
+
+def _features(seed):
+    rng = np.random.default_rng(seed)
+    return np.column_stack([rng.normal(65, 8, 500), rng.uniform(0, 0.4, 500), rng.uniform(0, 20, 500)])
+
+
+def test_parallel_fits_match_serial_fits_in_order():
+    feature_sets = [_features(seed) for seed in range(3)]
+    probe = _features(10)
+
+    parallel = fit_anomaly_models(feature_sets, processes=2)
+    serial = [fit_anomaly_model(features) for features in feature_sets]
+
+    for (model, scaler), (expected_model, expected_scaler) in zip(parallel, serial):
+        np.testing.assert_array_equal(model.score_samples(scaler.transform(probe)),
+                                      expected_model.score_samples(expected_scaler.transform(probe)))
+
+
+ENGINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Imports the engine, then asks a spawned fit worker whether it did too
+LAUNCHER = f"""
+import multiprocessing, sys
+sys.path.insert(0, {ENGINE_DIR!r})
+import main
+from training import fit_anomaly_models
+
+if __name__ == "__main__":
+    fit_anomaly_models([main.np.random.default_rng(0).normal(size=(50, 3))] * 2, processes=2)
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        print(pool.apply(eval, ("'main' in __import__('sys').modules",)))
+"""
+
+
+def _spawned_worker_imports_engine(tmp_path, as_module: bool) -> bool:
+    package = tmp_path / "launcher"
+    package.mkdir()
+    (package / "__init__.py").write_text("")
+    (package / "__main__.py").write_text(LAUNCHER)
+    command = ["-m", "launcher"] if as_module else [str(package / "__main__.py")]
+    result = subprocess.run([sys.executable, *command], cwd=tmp_path, capture_output=True, text=True,
+                            timeout=120, check=True)
+    return result.stdout.strip().splitlines()[-1] == "True"
+
+
+def test_spawned_fit_workers_do_not_rerun_engine_startup(tmp_path):
+    # `python main.py` hands over to `python -m uvicorn main:app`: the engine
+    # is an imported module and a package's __main__ is the script, which
+    # spawned workers skip
+    assert not _spawned_worker_imports_engine(tmp_path, as_module=True)
+
+
+def test_spawned_workers_rerun_a_script_main(tmp_path):
+    # Why the hand-over matters: a plain script as __main__ is re-run by every spawned worker
+    assert _spawned_worker_imports_engine(tmp_path, as_module=False)
@@ -0,0 +1,345 @@
+"""
+Model Training
+==============
+Background training jobs for the anomaly model.
+
+Training (DB fetch + feature building + Isolation Forest fit) runs in a worker
+thread so the event loop keeps serving /detect and /ingest. A finished job
+publishes a new ModelBundle; detection reads the bundle reference once per
+request, so the scaler/forest pair is always swapped atomically and requests
+in flight keep using the previous model.
+
+Online updates refit from a RollingReservoir of recent feature rows fed by
+/ingest and /detect, so the model can follow drift without a DB query.
+
+Besides the fleet-wide forest, a bundle can carry one forest per machine type
+(balers, Happy Seeders and rotavators have different normal envelopes). The
+per-type fits are independent and CPU-bound, so fit_anomaly_models() spreads
+them over a process pool.
+
+With several worker processes (see shared_state), the reservoir lives in
+shared memory and job records are mirrored to a shared directory, so any
+worker can report on a job another one runs.
+"""
+
+import asyncio
+import glob
+import json
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import cached_property
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+
+from forest_scorer import FlatForest
+from shared_state import LocalArrays
+
+
+@dataclass(frozen=True)
+class ModelBundle:
+    """A fitted scaler + forest pair, published as one unit"""
+    model: IsolationForest
+    scaler: StandardScaler
+    trained_at: datetime
+    samples: int
+    source: str = "database"  # database | online
+    version: Optional[str] = None  # ModelStore version, if persisted
+    # Machine type -> (forest, scaler); machines of other types use model/scaler
+    group_models: Mapping[str, Tuple[IsolationForest, StandardScaler]] = field(default_factory=dict)
+    # Flattened forests loaded with the model (memory-mapped, see ModelStore),
+    # or None to build them from the forests
+    flat_model: Optional[FlatForest] = None
+    flat_group_models: Optional[Mapping[str, FlatForest]] = None
+
+    # Flattened copies used for scoring (see forest_scorer.py), built on first use
+    @cached_property
+    def scoring_model(self) -> FlatForest:
+        return self.flat_model if self.flat_model is not None else FlatForest(self.model)
+
+    @cached_property
+    def scoring_group_models(self) -> Dict[str, Tuple[FlatForest, StandardScaler]]:
+        flat = self.flat_group_models or {}
+        return {
+            group: (flat[group] if group in flat else FlatForest(model), scaler)
+            for group, (model, scaler) in self.group_models.items()
+        }
+
+
+def fit_anomaly_model(features: np.ndarray) -> Tuple[IsolationForest, StandardScaler]:
+    """
+    Fit the scaler and Isolation Forest on a (n, 3) feature matrix of
+    [temperature, vibration magnitude, speed], optionally followed by window
+    features (sequence_features.py). NaN entries, from incomplete windows,
+    are replaced by their column mean.
+    """
+    missing = np.isnan(features)
+    if missing.any():
+        counts = (~missing).sum(axis=0)
+        means = np.divide(np.where(missing, 0.0, features).sum(axis=0), counts,
+                          out=np.zeros(features.shape[1]), where=counts > 0)
+        features = np.where(missing, means, features)
+
+    scaler = StandardScaler()
+    features_scaled = scaler.fit_transform(features)
+
+    model = IsolationForest(
+        contamination=0.05,  # Expect 5% anomalies
+        random_state=42,
+        n_estimators=150,
+        max_samples='auto'
+    )
+    model.fit(features_scaled)
+    return model, scaler
+
+
+def fit_anomaly_models(feature_sets: Sequence[np.ndarray],
+                       processes: int = 1) -> List[Tuple[IsolationForest, StandardScaler]]:
+    """
+    fit_anomaly_model() for several feature matrices, in parallel across up
+    to `processes` worker processes (spawned, so they never inherit the
+    server's threads). Results are in input order.
+
+    A spawned worker imports this module and re-runs the parent's __main__
+    script, so neither may carry server setup: the engine runs under the
+    uvicorn CLI (`python main.py` hands over to it), never as __main__.
+    """
+    workers = min(processes, len(feature_sets))
+    if workers <= 1:
+        return [fit_anomaly_model(features) for features in feature_sets]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return list(pool.map(fit_anomaly_model, feature_sets))
+
+
+class ReservoirSampler:
+    """
+    Uniform fixed-size sample of feature rows from a stream of chunks
+    (Algorithm R, applied a chunk at a time).
+    """
+
+    def __init__(self, capacity: int, n_features: int, seed: int = 42):
+        self.capacity = capacity
+        self.seen = 0
+        self._rows = np.empty((capacity, n_features), dtype=np.float64)
+        self._rng = np.random.default_rng(seed)
+
+    def add(self, rows: np.ndarray):
+        rows = np.asarray(rows, dtype=np.float64)
+
+        # Fill phase: keep everything until the reservoir is full
+        fill = min(len(rows), max(0, self.capacity - self.seen))
+        if fill:
+            self._rows[self.seen:self.seen + fill] = rows[:fill]
+            self.seen += fill
+            rows = rows[fill:]
+        if not len(rows):
+            return
+
+        # Row number i (0-based) replaces a random slot with probability capacity / (i + 1)
+        positions = self.seen + np.arange(len(rows))
+        slots = self._rng.integers(0, positions + 1)
+        keep = slots < self.capacity
+        self._rows[slots[keep]] = rows[keep]
+        self.seen += len(rows)
+
+    @property
+    def rows(self) -> np.ndarray:
+        return self._rows[:min(self.seen, self.capacity)]
+
+
+class RollingReservoir:
+    """
+    Bounded sample of recent feature rows from a live stream.
+
+    Fills to capacity, then every new row overwrites a uniformly random slot.
+    A row's survival therefore decays exponentially with age (mean lifetime of
+    `capacity` rows), so the sample follows drift instead of freezing on old data.
+    Writes come from the event loop and snapshots from training threads, so
+    both take a lock.
+    """
+
+    def __init__(self, capacity: int, n_features: int, seed: int = 42, arrays=None):
+        arrays = arrays or LocalArrays()
+        self.capacity = capacity
+        self._rows = arrays.array('rows', (capacity, n_features))
+        self._counters = arrays.array('counters', 2, np.int64)  # [size, new rows]
+        shared = arrays.max_machines is not None
+        # Workers sharing the rows must not all pick the same slots
+        self._rng = np.random.default_rng([seed, os.getpid()] if shared else seed)
+        self._lock = arrays.lock('reservoir')
+
+    def __len__(self) -> int:
+        return int(self._counters[0])
+
+    @property
+    def new_rows(self) -> int:
+        """Rows added since the last snapshot"""
+        return int(self._counters[1])
+
+    def add(self, rows: np.ndarray):
+        rows = np.asarray(rows, dtype=np.float64)
+        with self._lock:
+            size = int(self._counters[0])
+            self._counters[1] += len(rows)
+
+            fill = min(len(rows), self.capacity - size)
+            if fill:
+                self._rows[size:size + fill] = rows[:fill]
+                self._counters[0] = size + fill
+                rows = rows[fill:]
+            if len(rows):
+                slots = self._rng.integers(0, self.capacity, size=len(rows))
+                self._rows[slots] = rows
+
+    def snapshot(self) -> np.ndarray:
+        """Copy of the current sample; resets the new-row counter"""
+        with self._lock:
+            self._counters[1] = 0
+            return self._rows[:int(self._counters[0])].copy()
+
+
+class TrainingJobManager:
+    """
+    Runs training functions on a small thread pool and tracks their status.
+
+    Job records are plain dicts:
+        job_id, status (queued | running | completed | failed), params,
+        submitted_at, started_at, finished_at, result, error, status_code
+
+    With `jobs_dir`, every record is also written there as <job_id>.json, and
+    get()/list() include the records other processes wrote.
+    """
+
+    def __init__(self, max_workers: int = 1, max_history: int = 50, jobs_dir: Optional[str] = None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="training")
+        self._jobs: Dict[str, dict] = {}
+        self._futures: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self.max_history = max_history
+        self.jobs_dir = jobs_dir
+        if jobs_dir:
+            os.makedirs(jobs_dir, exist_ok=True)
+
+    def submit(self, fn: Callable[..., dict], **params) -> dict:
+        """Queue fn(**params) and return a snapshot of the new job record"""
+        job_id = uuid.uuid4().hex[:12]
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "params": params,
+            "submitted_at": datetime.now().isoformat(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "error": None,
+            "status_code": None,
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            self._persist(job)
+            self._prune()
+            self._futures[job_id] = self._executor.submit(self._run, job_id, fn, params)
+            return dict(job)
+
+    @property
+    def busy(self) -> bool:
+        """True while any job is queued or running"""
+        with self._lock:
+            return any(job["status"] in ("queued", "running") for job in self._jobs.values())
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                return dict(job)
+        if self.jobs_dir and job_id.isalnum():
+            return _read_job(os.path.join(self.jobs_dir, f"{job_id}.json"))
+        return None
+
+    def list(self) -> List[dict]:
+        """All tracked jobs, newest first"""
+        with self._lock:
+            jobs = [dict(job) for job in reversed(self._jobs.values())]
+        if self.jobs_dir:
+            known = {job["job_id"] for job in jobs}
+            for path in glob.glob(os.path.join(self.jobs_dir, "*.json")):
+                if os.path.basename(path)[:-len(".json")] not in known:
+                    job = _read_job(path)
+                    if job:
+                        jobs.append(job)
+            jobs.sort(key=lambda job: job["submitted_at"], reverse=True)
+        return jobs
+
+    async def wait(self, job_id: str) -> Optional[dict]:
+        """Wait for a job without blocking the event loop"""
+        future = self._futures.get(job_id)
+        if future is not None:
+            await asyncio.wrap_future(future)
+        return self.get(job_id)
+
+    def _run(self, job_id: str, fn: Callable[..., dict], params: dict):
+        self._update(job_id, status="running", started_at=datetime.now().isoformat())
+        try:
+            result = fn(**params)
+            self._update(job_id, status="completed", result=result)
+        except Exception as e:
+            # HTTPException carries status_code/detail; anything else is a 500
+            self._update(
+                job_id,
+                status="failed",
+                error=str(getattr(e, 'detail', e)),
+                status_code=getattr(e, 'status_code', 500),
+            )
+            print(f"❌ Training job {job_id} failed: {e}")
+        finally:
+            self._update(job_id, finished_at=datetime.now().isoformat())
+            with self._lock:
+                self._futures.pop(job_id, None)
+
+    def _update(self, job_id: str, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+                self._persist(self._jobs[job_id])
+
+    def _prune(self):
+        """Drop the oldest finished jobs beyond max_history (caller holds the lock)"""
+        finished = [jid for jid, job in self._jobs.items() if job["status"] in ("completed", "failed")]
+        for jid in finished[:max(0, len(self._jobs) - self.max_history)]:
+            del self._jobs[jid]
+            if self.jobs_dir:
+                try:
+                    os.remove(os.path.join(self.jobs_dir, f"{jid}.json"))
+                except FileNotFoundError:
+                    pass
+
+    def _persist(self, job: dict):
+        """Mirror a job record to jobs_dir (caller holds the lock)"""
+        if not self.jobs_dir:
+            return
+        path = os.path.join(self.jobs_dir, f"{job['job_id']}.json")
+        staging = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(staging, "w") as f:
+                json.dump(job, f, default=str)
+            os.replace(staging, path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"⚠️ Could not write job record {job['job_id']}: {e}")
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _read_job(path: str) -> Optional[dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
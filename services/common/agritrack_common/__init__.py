@@ -0,0 +1,7 @@
+"""
+AgriTrack Common
+================
+Code shared by the AgriTrack Python services. Installed into each service's
+image (see the service Dockerfiles); for local runs, `pip install -e
+services/common`.
+"""
@@ -0,0 +1,231 @@
+"""
+Sampling Profiler
+=================
+Admin-only, opt-in profiling of a live FastAPI service. The result is
+collapsed stacks, one `root;caller;...;leaf count` line per distinct stack,
+which flamegraph.pl, inferno and speedscope read as is.
+
+A background thread snapshots every other thread's Python stack
+(sys._current_frames()) every `interval` seconds. Each stack is rooted at its
+thread's name, so the event loop (MainThread) and worker threads (e.g. the
+"supabase" database pool) come out as separate towers. Frames are labelled
+`function (path:first line)`, with paths relative to their sys.path entry.
+
+Two ways in, both requiring an X-Admin-Token header equal to the configured
+token (install() adds nothing when no token is configured):
+
+    POST <path>?seconds=10          sample all live traffic for `seconds`
+    any request + "X-Profile: 1"    sample while that request runs; its
+                                    response body is replaced by the stacks
+                                    (original status in X-Profiled-Status)
+
+Caveats:
+--------
+- Sampling is process-wide: a profiled request's stacks include whatever
+  else the process did meanwhile. Look for the endpoint's own frame, or
+  profile an instance taken out of rotation.
+- A coroutine suspended on `await` is on no thread's stack. Time an async
+  endpoint spends waiting for a worker thread shows up under that thread.
+- Threads waiting for work (event loop in select(), idle pool workers) are
+  left out unless idle=true.
+- One profile runs at a time; a second request gets 409.
+- A sample of a dozen threads costs ~0.1 ms (~3% of a core at the default
+  5 ms interval). When no profile is running the only cost is a header
+  lookup per request.
+
+Shared by the ai-engine and crop-residue services (services/common).
+"""
+
+import asyncio
+import hmac
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+
+# (file name, function) of leaf frames that mean "waiting for work"
+IDLE_FRAMES = {
+    ("selectors.py", "select"),       # asyncio event loop with nothing to run
+    ("threading.py", "wait"),         # Condition / Event waits
+    ("thread.py", "_worker"),         # ThreadPoolExecutor worker between tasks
+    ("queue.py", "get"),
+}
+
+
+class SamplingProfiler:
+    """
+    Periodic stack sampler for every thread of the process.
+    """
+
+    def __init__(self, interval: float = 0.005, include_idle: bool = False):
+        """
+        Args:
+            interval: Seconds between samples
+            include_idle: Keep stacks of threads waiting for work
+        """
+        self.interval = interval
+        self.include_idle = include_idle
+        self.samples = 0
+        self.elapsed = 0.0
+        self._started = 0.0
+        self._counts: Counter = Counter()
+        self._labels: Dict[object, str] = {}
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+        self.elapsed = time.perf_counter() - self._started
+
+    def collapsed(self) -> str:
+        """Collapsed stacks, most frequent first"""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self._counts.most_common())
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = self._stack(frame)
+                if stack is not None:
+                    self._counts[(names.get(ident, str(ident)),) + stack] += 1
+            self.samples += 1
+
+    def _stack(self, frame) -> Optional[Tuple[str, ...]]:
+        code = frame.f_code
+        if not self.include_idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+            return None
+        labels = []
+        while frame is not None:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                label = self._labels[code] = f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+            labels.append(label)
+            frame = frame.f_back
+        return tuple(reversed(labels))
+
+
+class ProfileRequestMiddleware:
+    """
+    ASGI middleware profiling single requests that carry "X-Profile: 1"
+    and a valid X-Admin-Token.
+    """
+
+    def __init__(self, app, token: str, lock: threading.Lock, interval: float = 0.001):
+        self.app = app
+        self.token = token
+        self.lock = lock
+        self.interval = interval
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        if headers.get(b"x-profile", b"0").lower() in (b"0", b"false", b""):
+            await self.app(scope, receive, send)
+            return
+
+        if not _token_matches(headers.get(b"x-admin-token", b"").decode("latin-1"), self.token):
+            await JSONResponse({"detail": "Invalid admin token"}, status_code=403)(scope, receive, send)
+            return
+        if not self.lock.acquire(blocking=False):
+            await JSONResponse({"detail": "A profile is already running"}, status_code=409)(scope, receive, send)
+            return
+
+        status = None
+
+        async def discard_response(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        profiler = SamplingProfiler(self.interval)
+        try:
+            profiler.start()
+            await self.app(scope, receive, discard_response)
+        finally:
+            profiler.stop()
+            self.lock.release()
+        await _stacks_response(profiler, {"X-Profiled-Status": str(status)})(scope, receive, send)
+
+
+def install(app: FastAPI, token: Optional[str], path: str = "/admin/profile",
+            max_seconds: float = 60, request_interval: float = 0.001):
+    """
+    Add the profile endpoint and per-request profiling to an app.
+
+    Args:
+        app: FastAPI application
+        token: Admin token; None or empty leaves the app untouched
+        path: Route of the live-traffic profile endpoint
+        max_seconds: Longest live-traffic profile accepted
+        request_interval: Sampling interval for single-request profiles
+    """
+    if not token:
+        return
+    lock = threading.Lock()
+
+    @app.post(path, include_in_schema=False)
+    async def profile(
+        request: Request,
+        seconds: float = Query(10, gt=0, le=max_seconds),
+        interval: float = Query(0.005, ge=0.0005, le=1),
+        idle: bool = Query(False, description="Include threads waiting for work"),
+    ):
+        """Sample live traffic for `seconds`, as collapsed stacks"""
+        if not _token_matches(request.headers.get("x-admin-token", ""), token):
+            raise HTTPException(status_code=403, detail="Invalid admin token")
+        if not lock.acquire(blocking=False):
+            raise HTTPException(status_code=409, detail="A profile is already running")
+
+        profiler = SamplingProfiler(interval, include_idle=idle)
+        try:
+            profiler.start()
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.stop()
+            lock.release()
+        return _stacks_response(profiler)
+
+    app.add_middleware(ProfileRequestMiddleware, token=token, lock=lock, interval=request_interval)
+    print(f"🔬 Profiler enabled at {path} (X-Admin-Token required)")
+
+
+def _stacks_response(profiler: SamplingProfiler, headers: Optional[Dict[str, str]] = None) -> PlainTextResponse:
+    return PlainTextResponse(profiler.collapsed(), headers={
+        "X-Profile-Samples": str(profiler.samples),
+        "X-Profile-Seconds": f"{profiler.elapsed:.3f}",
+        **(headers or {}),
+    })
+
+
+def _token_matches(given: str, token: str) -> bool:
+    return hmac.compare_digest(given.encode(), token.encode())
+
+
+def _short_path(filename: str) -> str:
+    """filename relative to the longest sys.path entry containing it"""
+    best = ""
+    for root in sys.path:
+        if root and filename.startswith(root.rstrip(os.sep) + os.sep) and len(root) > len(best):
+            best = root.rstrip(os.sep)
+    return filename[len(best) + 1:] if best else filename
@@ -0,0 +1,120 @@
+import asyncio
+import re
+import threading
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from agritrack_common.profiler import SamplingProfiler, install
+
+TOKEN = "secret"
+LINE = re.compile(r"^(\S[^;]*(?:;[^;]+)*) (\d+)$")
+
+
+def _spin(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def _app():
+    app = FastAPI()
+    release = asyncio.Event()
+
+    @app.get("/work", status_code=201)
+    def work():
+        _spin(0.1)
+        return {"done": True}
+
+    @app.get("/wait")
+    async def wait():
+        await release.wait()
+        return {"done": True}
+
+    install(app, TOKEN, max_seconds=5, request_interval=0.001)
+    return app, release
+
+
+def _client(app):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+def test_collapsed_output_is_one_stack_and_count_per_line():
+    profiler = SamplingProfiler(interval=0.001)
+    worker = threading.Thread(target=_spin, args=(0.2,), name="spinner")
+    profiler.start()
+    worker.start()
+    worker.join()
+    profiler.stop()
+
+    lines = profiler.collapsed().splitlines()
+    parsed = [LINE.match(line) for line in lines]
+    counts = [int(match.group(2)) for match in parsed]
+    spinner = [match.group(1).split(";") for match in parsed if match.group(1).startswith("spinner;")]
+
+    assert all(parsed)
+    assert counts == sorted(counts, reverse=True)
+    assert profiler.samples > 0 and profiler.elapsed >= 0.2
+    # Root is the thread name, then frames outermost first, ending at the leaf
+    assert spinner and all(re.fullmatch(r"_spin \(.*test_profiler\.py:\d+\)", stack[-1]) for stack in spinner)
+    assert sum(count for line, count in zip(parsed, counts) if line.group(1).startswith("spinner;")) <= profiler.samples
+
+
+def test_no_token_installs_nothing():
+    app = FastAPI()
+    install(app, "")
+
+    assert not [route for route in app.routes if getattr(route, "path", "") == "/admin/profile"]
+    assert not app.user_middleware
+
+
+def test_bad_token_is_rejected():
+    async def run():
+        app, _ = _app()
+        async with _client(app) as client:
+            endpoint = await client.post("/admin/profile", params={"seconds": 0.1},
+                                         headers={"X-Admin-Token": "wrong"})
+            per_request = await client.get("/work", headers={"X-Profile": "1", "X-Admin-Token": "wrong"})
+            missing = await client.post("/admin/profile", params={"seconds": 0.1})
+        return endpoint.status_code, per_request.status_code, missing.status_code
+
+    assert asyncio.run(run()) == (403, 403, 403)
+
+
+def test_second_profile_while_one_runs_gets_409():
+    async def run():
+        app, release = _app()
+        async with _client(app) as client:
+            first = asyncio.ensure_future(client.get("/wait", headers={"X-Profile": "1", "X-Admin-Token": TOKEN}))
+            await asyncio.sleep(0.05)
+            endpoint = await client.post("/admin/profile", params={"seconds": 0.1},
+                                         headers={"X-Admin-Token": TOKEN})
+            per_request = await client.get("/work", headers={"X-Profile": "1", "X-Admin-Token": TOKEN})
+            release.set()
+            first = await first
+            after = await client.post("/admin/profile", params={"seconds": 0.05},
+                                      headers={"X-Admin-Token": TOKEN})
+        return endpoint.status_code, per_request.status_code, first.status_code, after.status_code
+
+    assert asyncio.run(run()) == (409, 409, 200, 200)
+
+
+def test_x_profile_replaces_the_response_with_the_request_stacks():
+    async def run():
+        app, _ = _app()
+        async with _client(app) as client:
+            plain = await client.get("/work")
+            profiled = await client.get("/work", headers={"X-Profile": "1", "X-Admin-Token": TOKEN})
+        return plain, profiled
+
+    plain, profiled = asyncio.run(run())
+
+    assert plain.status_code == 201 and plain.json() == {"done": True}
+    assert profiled.status_code == 200
+    assert profiled.headers["content-type"].startswith("text/plain")
+    assert profiled.headers["x-profiled-status"] == "201"
+    assert int(profiled.headers["x-profile-samples"]) > 0
+    assert float(profiled.headers["x-profile-seconds"]) >= 0.1
+    assert all(LINE.match(line) for line in profiled.text.splitlines())
+    assert any(";_spin (" in line for line in profiled.text.splitlines())
@@ -22,6 +22,9 @@ Endpoints:
     GET  /api/scheduling/summary       - Scheduling summary
     GET  /api/scheduling/dashboard     - Complete scheduling dashboard
     GET  /api/scheduling/sms/preview   - Preview SMS messages
+
+    # Admin (only when PROFILER_TOKEN is set, see agritrack_common.profiler)
+    POST /api/admin/profile            - Sample live traffic as collapsed stacks
 """
 
 from fastapi import FastAPI, Query, HTTPException
@@ -30,12 +33,14 @@ from typing import Optional, List
 from datetime import datetime
 from dataclasses import asdict
 import json
+import os
 
 # Import our prediction modules
 from mock_data import generate_district_ndvi_data, get_machines_data, get_districts_data, DISTRICTS
 from harvest_predictor import HarvestPredictor
 from machine_allocator import MachineAllocator
 from harvest_scheduler import HarvestScheduler
+from agritrack_common.profiler import install as install_profiler
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -60,6 +65,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Admin-only sampling profiler: POST /api/admin/profile samples live traffic,
+# an "X-Profile: 1" header profiles one request; both return collapsed stacks
+# and need X-Admin-Token == PROFILER_TOKEN. Unset (the default) = off
+install_profiler(
+    app,
+    os.getenv("PROFILER_TOKEN", ""),
+    path="/api/admin/profile",
+    max_seconds=float(os.getenv("PROFILER_MAX_SECONDS", 60)),
+)
+
 # ═══════════════════════════════════════════════════════════════════════════
 # DYNAMIC DATA GENERATION
 # ═══════════════════════════════════════════════════════════════════════════